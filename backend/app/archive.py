@@ -0,0 +1,47 @@
+"""
+Move old NDVI observations from the database into the Parquet archive.
+
+Run periodically (e.g. weekly from cron):   python -m app.archive
+
+See app/services/ndvi_archive.py for the layout. Series queries read both
+tiers, so archiving is invisible to API clients. On SQLite pass --vacuum to
+give the freed pages back to the filesystem.
+"""
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from app.database import SessionLocal, engine, sync_schema
+from app.services.ndvi_archive import ARCHIVE_AFTER_DAYS, archive_ndvi_data
+
+
+def vacuum():
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if engine.dialect.name == "postgresql":
+            conn.exec_driver_sql("VACUUM ANALYZE ndvi_data")
+            conn.exec_driver_sql("VACUUM ANALYZE spectral_index_values")
+        else:
+            conn.exec_driver_sql("VACUUM")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old NDVI observations to Parquet")
+    parser.add_argument("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS,
+                        help="Archive observations older than this (each field's latest row is kept)")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--vacuum", action="store_true", help="Reclaim database space afterwards")
+    args = parser.parse_args()
+
+    sync_schema()
+    db = SessionLocal()
+    try:
+        before = datetime.now(timezone.utc) - timedelta(days=args.older_than_days)
+        summary = archive_ndvi_data(db, before=before, batch_size=args.batch_size)
+        print(f"NDVI archive: {summary}")
+    finally:
+        db.close()
+    if args.vacuum:
+        vacuum()
+
+
+if __name__ == "__main__":
+    main()
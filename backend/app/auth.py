@@ -1,12 +1,19 @@
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from starlette.concurrency import run_in_threadpool
+from app.database import get_async_db, get_db
 from app import models, schemas
+from app.services.passwords import hash_password, pwd_context, verify_password_async
 import os
 from dotenv import load_dotenv
 
@@ -15,15 +22,17 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+# Resolved user + profiles per token, shared by requests in this process (0 = off)
+IDENTITY_CACHE_TTL_SECONDS = float(os.getenv("IDENTITY_CACHE_TTL_SECONDS", "30"))
+IDENTITY_CACHE_MAX_ENTRIES = int(os.getenv("IDENTITY_CACHE_MAX_ENTRIES", "10000"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return hash_password(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -38,42 +47,172 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = get_user_by_email(db, email)
+def get_user_with_profiles(db: Session, email: str):
+    """User with farmer_profile and agronomist_profile loaded, in one joined query"""
+    return db.query(models.User).options(
+        joinedload(models.User.farmer_profile),
+        joinedload(models.User.agronomist_profile)
+    ).filter(models.User.email == email).first()
+
+def _columns(instance) -> Optional[Dict]:
+    if instance is None:
+        return None
+    return {attr.key: getattr(instance, attr.key) for attr in inspect(instance).mapper.column_attrs}
+
+def _attach(db: Session, model, columns: Optional[Dict]):
+    """Instance of `model` with cached column values, attached to `db` without a query"""
+    if columns is None:
+        return None
+    instance = model(**columns)
+    make_transient_to_detached(instance)
+    return db.merge(instance, load=False)
+
+class IdentityCache:
+    """
+    Short-TTL cache of token -> user and profile column values.
+    Entries expire after `ttl_seconds` (or with the token) and are dropped by
+    invalidate() when roles or profiles change.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if entry["expires_at"] <= time.monotonic():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return entry
+
+    def put(self, token: str, user, token_expires_at: Optional[float]):
+        if self.ttl_seconds <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds
+        if token_expires_at is not None:
+            expires_at = min(expires_at, time.monotonic() + token_expires_at - time.time())
+        entry = {
+            "email": user.email,
+            "expires_at": expires_at,
+            "user": _columns(user),
+            "farmer": _columns(user.farmer_profile),
+            "agronomist": _columns(user.agronomist_profile),
+        }
+        with self._lock:
+            self._entries[token] = entry
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, email: Optional[str] = None):
+        """Drop the entries of `email` (all entries if None)"""
+        with self._lock:
+            if email is None:
+                self._entries.clear()
+                return
+            for token in [token for token, entry in self._entries.items() if entry["email"] == email]:
+                del self._entries[token]
+
+_identity_cache = IdentityCache(IDENTITY_CACHE_TTL_SECONDS, IDENTITY_CACHE_MAX_ENTRIES)
+
+def invalidate_identity(email: Optional[str] = None):
+    """Call after changing a user's roles or profiles"""
+    _identity_cache.invalidate(email)
+
+def _store_rehash(db: Session, user: models.User, new_hash: str):
+    user.hashed_password = new_hash
+    db.commit()
+    db.refresh(user)
+
+async def authenticate_user(db: Session, email: str, password: str):
+    """
+    The user if the password matches, else False. bcrypt runs in the password process pool
+    and queries in the threadpool, so only the awaits happen on the event loop;
+    a hash made with an outdated cost is replaced on success.
+    """
+    user = await run_in_threadpool(get_user_by_email, db, email)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    matches, new_hash = await verify_password_async(password, user.hashed_password)
+    if not matches:
         return False
+    if new_hash:
+        await run_in_threadpool(_store_rehash, db, user, new_hash)
     return user
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+def _cached_user(db: Session, token: str):
+    """The token's cached user with its profiles, attached to `db` without a query (None on a miss)"""
+    cached = _identity_cache.get(token)
+    if cached is None:
+        return None
+    user = _attach(db, models.User, cached["user"])
+    set_committed_value(user, "farmer_profile", _attach(db, models.Farmer, cached["farmer"]))
+    set_committed_value(user, "agronomist_profile", _attach(db, models.Agronomist, cached["agronomist"]))
+    return user
+
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _decode_token(token: str) -> Dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
-    user = get_user_by_email(db, email=email)
+        raise _credentials_exception()
+    if payload.get("sub") is None:
+        raise _credentials_exception()
+    return payload
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    """
+    The token's user, with farmer_profile / agronomist_profile already loaded.
+    FastAPI resolves it once per request; across requests it comes from the identity
+    cache (no query at all) or from a single joined query.
+    """
+    user = _cached_user(db, token)
+    if user is not None:
+        return user
+
+    payload = _decode_token(token)
+    # In the threadpool: an async dependency runs on the event loop
+    user = await run_in_threadpool(get_user_with_profiles, db, payload["sub"])
+    if user is None:
+        raise _credentials_exception()
+    _identity_cache.put(token, user, payload.get("exp"))
+    return user
+
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    """get_current_user for endpoints on an AsyncSession (same identity cache)"""
+    user = _cached_user(db.sync_session, token)
+    if user is not None:
+        return user
+
+    payload = _decode_token(token)
+    user = await db.run_sync(get_user_with_profiles, payload["sub"])
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
+    _identity_cache.put(token, user, payload.get("exp"))
     return user
 
-async def get_current_farmer(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_current_farmer(current_user: models.User = Depends(get_current_user)):
     # Check if user has farmer profile (regardless of current role)
-    farmer = db.query(models.Farmer).filter(models.Farmer.user_id == current_user.id).first()
+    farmer = current_user.farmer_profile
     if not farmer:
         raise HTTPException(status_code=404, detail="Farmer profile not found. Please add farmer role first.")
     return farmer
 
-async def get_current_agronomist(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_current_agronomist(current_user: models.User = Depends(get_current_user)):
     # Check if user has agronomist profile (regardless of current role)
-    agronomist = db.query(models.Agronomist).filter(models.Agronomist.user_id == current_user.id).first()
+    agronomist = current_user.agronomist_profile
     if not agronomist:
         raise HTTPException(status_code=404, detail="Agronomist profile not found. Please add agronomist role first.")
     return agronomist
@@ -0,0 +1,96 @@
+"""
+Login throughput benchmark (not a test).
+
+    python -m app.bench_passwords [--logins 200] [--rounds 12] [--workers N]
+
+Reports bcrypt verifications per second inline and through the password
+process pool, per core, and how long a trivial request takes to get a
+threadpool slot while a login storm is running (inline on the threadpool, as
+before, versus offloaded to the pool).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+async def _probe_latency(executor: ThreadPoolExecutor, until: asyncio.Event, samples: list):
+    """Time a no-op 'sync endpoint' on the shared threadpool every 20 ms"""
+    loop = asyncio.get_running_loop()
+    while not until.is_set():
+        start = time.perf_counter()
+        await loop.run_in_executor(executor, lambda: None)
+        samples.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.02)
+
+
+async def _storm(logins: int, offload: bool, threadpool: ThreadPoolExecutor, hashed: str):
+    from app.services import passwords
+
+    passwords._slots = None  # the semaphore belongs to the previous asyncio.run loop
+    loop = asyncio.get_running_loop()
+    done = asyncio.Event()
+    samples: list = []
+    probe = asyncio.ensure_future(_probe_latency(threadpool, done, samples))
+
+    start = time.perf_counter()
+    if offload:
+        await asyncio.gather(*(passwords.verify_password_async("password", hashed) for _ in range(logins)))
+    else:
+        await asyncio.gather(*(loop.run_in_executor(threadpool, passwords.verify_and_update, "password", hashed)
+                               for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await probe
+    return logins / elapsed, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bcrypt login throughput")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=None, help="bcrypt cost (default BCRYPT_ROUNDS)")
+    parser.add_argument("--workers", type=int, default=None, help="Process pool size (default PASSWORD_HASH_WORKERS)")
+    parser.add_argument("--threadpool", type=int, default=40, help="Threads shared by sync endpoints (AnyIO default)")
+    args = parser.parse_args()
+
+    if args.rounds is not None:
+        os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    if args.workers is not None:
+        os.environ["PASSWORD_HASH_WORKERS"] = str(args.workers)
+    os.environ.setdefault("PASSWORD_HASH_MAX_PENDING", str(args.logins))
+    os.environ.setdefault("PASSWORD_HASH_QUEUE_TIMEOUT", "3600")
+    from app.services import passwords
+
+    hashed = passwords.hash_password("password")
+    cores = os.cpu_count() or 1
+    print(f"bcrypt cost {passwords.BCRYPT_ROUNDS}, {cores} core(s), pool of {passwords.PASSWORD_HASH_WORKERS}")
+
+    start = time.perf_counter()
+    count = max(5, args.logins // 10)
+    for _ in range(count):
+        passwords.verify_and_update("password", hashed)
+    single = count / (time.perf_counter() - start)
+    print(f"single thread:        {single:7.1f} logins/s")
+
+    threadpool = ThreadPoolExecutor(max_workers=args.threadpool)
+    # Warm the worker processes up so spawn time isn't measured
+    asyncio.run(_storm(passwords.PASSWORD_HASH_WORKERS, True, threadpool, hashed))
+    for label, offload in (("inline (threadpool)", False), ("process pool", True)):
+        rate, samples = asyncio.run(_storm(args.logins, offload, threadpool, hashed))
+        used = min(cores, passwords.PASSWORD_HASH_WORKERS if offload else cores)
+        print(f"{label + ':':22}{rate:7.1f} logins/s ({rate / used:.1f}/core), "
+              f"sync endpoint wait p50 {statistics.median(samples) if samples else 0:.1f} ms, "
+              f"p95 {_percentile(samples, 0.95):.1f} ms")
+    threadpool.shutdown()
+    passwords.shutdown_password_pool()
+
+
+if __name__ == "__main__":
+    main()
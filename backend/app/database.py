@@ -1,26 +1,177 @@
-from sqlalchemy import create_engine
+from fastapi import Request
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
+import threading
+from typing import List, Optional, Tuple
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./agrimonitor.db")
+# Optional read replica serving GET requests (replication lag: a GET right after a write may not see it yet)
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL", "")
 
-if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-else:
-    engine = create_engine(DATABASE_URL)
+# SQLite: WAL lets readers run alongside the single writer; writers wait busy_timeout ms for the lock
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "15000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# Server databases (PostgreSQL)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))  # 0 = none
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        if SQLITE_JOURNAL_MODE:
+            cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    finally:
+        cursor.close()
+
+
+def make_engine(url: str):
+    """Engine for `url` with the pool and connection settings above"""
+    if url.startswith("sqlite"):
+        engine = create_engine(
+            url, connect_args={"check_same_thread": False}
+        )
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+        return engine
+
+    connect_args = {}
+    if DB_STATEMENT_TIMEOUT_MS and url.startswith("postgresql"):
+        connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+    return create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
+
+engine = make_engine(DATABASE_URL)
+read_engine = make_engine(DATABASE_READ_URL) if DATABASE_READ_URL else engine
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 Base = declarative_base()
-def get_db():
-    db = SessionLocal()
+def get_db(request: Request):
+    """Session for the request: on the read replica (if configured) for GET requests, else the primary"""
+    db = ReadSessionLocal() if request.method in ("GET", "HEAD") else SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
 
+# Async sessions (aiosqlite / asyncpg) for the read endpoints that run on the event loop
+# instead of the threadpool. Same models and URLs, the driver is swapped; created on first use.
+
+def async_database_url(url: str) -> str:
+    scheme, _, rest = url.partition(":")
+    if scheme == "sqlite":
+        return f"sqlite+aiosqlite:{rest}"
+    if scheme in ("postgresql", "postgresql+psycopg2", "postgres"):
+        return f"postgresql+asyncpg:{rest}"
+    return url
+
+
+def make_async_engine(url: str):
+    url = async_database_url(url)
+    if url.startswith("sqlite"):
+        async_engine = create_async_engine(url)
+        event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+        return async_engine
+
+    connect_args = {}
+    if DB_STATEMENT_TIMEOUT_MS and url.startswith("postgresql+asyncpg"):
+        connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+    return create_async_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
+
+_async_sessions: Optional[Tuple[async_sessionmaker, async_sessionmaker]] = None
+_async_lock = threading.Lock()
+
+
+def async_sessionmakers() -> Tuple[async_sessionmaker, async_sessionmaker]:
+    """(primary, read replica) async session factories; the same factory twice without a replica"""
+    global _async_sessions
+    if _async_sessions is None:
+        with _async_lock:
+            if _async_sessions is None:
+                primary = async_sessionmaker(make_async_engine(DATABASE_URL), autoflush=False,
+                                             expire_on_commit=False)
+                read = primary
+                if DATABASE_READ_URL:
+                    read = async_sessionmaker(make_async_engine(DATABASE_READ_URL), autoflush=False,
+                                              expire_on_commit=False)
+                _async_sessions = (primary, read)
+    return _async_sessions
+
+
+def async_engines() -> List:
+    """Async engines created so far"""
+    if _async_sessions is None:
+        return []
+    return list({sessions.kw["bind"] for sessions in _async_sessions})
+
+
+async def dispose_async_engines():
+    global _async_sessions
+    for async_engine in async_engines():
+        await async_engine.dispose()
+    _async_sessions = None
+
+
+async def get_async_db(request: Request):
+    """AsyncSession for the request: on the read replica (if configured) for GET requests, else the primary"""
+    primary, read = async_sessionmakers()
+    async with (read if request.method in ("GET", "HEAD") else primary)() as db:
+        yield db
+
+
+def sync_schema():
+    """
+    Create missing tables, then add nullable columns and indexes that were added to
+    models after a table was first created (create_all skips existing tables).
+    """
+    Base.metadata.create_all(bind=engine)
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns and column.nullable:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except Exception as e:
+                # e.g. a unique index over rows that already violate it; the app still works without it
+                print(f"Could not create index {index.name}: {e}")
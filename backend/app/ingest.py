@@ -0,0 +1,188 @@
+"""
+Incremental NDVI ingestion.
+
+Run once (e.g. nightly from cron):   python -m app.ingest
+or in the backend process by setting NDVI_INGEST_INTERVAL_HOURS.
+
+For every field the last ingested Sentinel 2 STAC item is remembered in
+`ndvi_ingest_state`. Each run only searches for acquisitions newer than that
+(one STAC search per ~1° cell of fields) and computes NDVI for those scenes
+with shared band reads, so each scene is ingested once per field. Cells with
+no new scenes cost a single search and are skipped. A field whose scene could
+not be read (network error, expired signature) keeps its watermark and is
+left out for the rest of the run, so the next run retries that scene.
+"""
+import argparse
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from shapely.geometry import Point, shape
+from sqlalchemy.orm import Session
+
+from app import models
+from app.database import SessionLocal, sync_schema
+from app.services.geometry import field_geometry
+from app.services.ndvi_service import (
+    NDVIService, SEARCH_CELL_DEG, _group_by_cell, _union_bounds, get_ndvi_service
+)
+from app.services.ndvi_store import insert_ndvi_records, select_fields
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # SQLite hands back naive datetimes; everything here is UTC
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def ingest_new_acquisitions(db: Session, ndvi_service: Optional[NDVIService] = None,
+                            field_ids: Optional[List[int]] = None, lookback_days: int = 30,
+                            max_cloud_cover: float = 30, now: Optional[datetime] = None) -> Dict:
+    """
+    Ingest Sentinel 2 acquisitions newer than each field's last ingested item.
+    Fields never ingested start `lookback_days` back. Returns a run summary.
+    """
+    ndvi_service = ndvi_service or get_ndvi_service()
+    now = now or datetime.now(timezone.utc)
+    default_since = now - timedelta(days=lookback_days)
+
+    fields = select_fields(db, field_ids)
+    state_query = db.query(models.NDVIIngestState)
+    if field_ids:
+        state_query = state_query.filter(models.NDVIIngestState.field_id.in_(field_ids))
+    states = {state.field_id: state for state in state_query.all()}
+
+    summary = {"fields": len(fields), "cells": 0, "cells_skipped": 0, "items": 0, "records": 0, "read_errors": 0}
+    # Fields with a failed read; later scenes would move their watermark past it
+    held_back = set()
+    for cell_fields in _group_by_cell(fields, SEARCH_CELL_DEG).values():
+        summary["cells"] += 1
+        since_by_field = {}
+        for field in cell_fields:
+            state = states.get(field.id)
+            last = _as_utc(state.last_item_datetime) if state else None
+            since_by_field[field.id] = last or default_since
+
+        bbox = list(_union_bounds([field_geometry(field) for field in cell_fields]))
+        features = ndvi_service.search_planetary_computer_items_between(
+            bbox, min(since_by_field.values()), now, max_cloud_cover=max_cloud_cover
+        )
+        if not features:
+            summary["cells_skipped"] += 1
+            continue
+
+        for feature in features:
+            if not feature.get("geometry"):
+                continue
+            footprint = shape(feature["geometry"])
+            item_datetime = datetime.fromisoformat(feature["properties"]["datetime"].replace("Z", "+00:00"))
+            targets = [
+                field for field in cell_fields
+                if field.id not in held_back and since_by_field[field.id] < item_datetime
+                and footprint.contains(Point(field.longitude, field.latitude))
+            ]
+            if not targets:
+                continue
+
+            failed = set()
+            records = ndvi_service.ndvi_records_for_item(feature, targets, item_datetime, failed=failed)
+            computed = [field for field in targets if field.id in records]
+            insert_ndvi_records(db, computed, [records[field.id] for field in computed])
+            held_back |= failed
+            summary["read_errors"] += len(failed)
+
+            # Scenes without valid pixels (e.g. clouds over the field) still count as processed
+            for field in targets:
+                if field.id in failed:
+                    continue
+                state = states.get(field.id)
+                if state is None:
+                    state = models.NDVIIngestState(field_id=field.id)
+                    db.add(state)
+                    states[field.id] = state
+                state.last_item_id = feature["id"]
+                state.last_item_datetime = item_datetime
+                since_by_field[field.id] = item_datetime
+            db.commit()
+
+            summary["items"] += 1
+            summary["records"] += len(computed)
+
+    return summary
+
+
+class IngestScheduler:
+    """Runs ingest_new_acquisitions every `interval_hours` in a background thread"""
+
+    def __init__(self, interval_hours: float):
+        self.interval_seconds = interval_hours * 3600
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="ndvi-ingest", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+
+    def _run(self):
+        while not self._stop.is_set():
+            db = SessionLocal()
+            try:
+                summary = ingest_new_acquisitions(db)
+                print(f"NDVI ingest: {summary}")
+            except Exception as e:
+                db.rollback()
+                print(f"NDVI ingest failed: {e}")
+            finally:
+                db.close()
+            self._stop.wait(self.interval_seconds)
+
+
+_scheduler: Optional[IngestScheduler] = None
+
+
+def start_ingest_scheduler():
+    global _scheduler
+    interval_hours = float(os.getenv("NDVI_INGEST_INTERVAL_HOURS", "0"))
+    if _scheduler is None and interval_hours > 0:
+        _scheduler = IngestScheduler(interval_hours)
+        _scheduler.start()
+
+
+def stop_ingest_scheduler():
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.stop()
+        _scheduler = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest new Sentinel 2 acquisitions into NDVI data")
+    parser.add_argument("--field-id", type=int, action="append", dest="field_ids",
+                        help="Only ingest this field (repeatable)")
+    parser.add_argument("--lookback-days", type=int, default=30,
+                        help="How far back to start for fields never ingested")
+    parser.add_argument("--max-cloud-cover", type=float, default=30)
+    args = parser.parse_args()
+
+    sync_schema()
+    db = SessionLocal()
+    try:
+        summary = ingest_new_acquisitions(
+            db, field_ids=args.field_ids, lookback_days=args.lookback_days,
+            max_cloud_cover=args.max_cloud_cover
+        )
+        print(f"NDVI ingest: {summary}")
+    finally:
+        db.close()
+        get_ndvi_service().close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,34 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import engine, Base
-from app.routers import auth, farmers, agronomists, fields, requests, treatments, ndvi
+from app.database import SessionLocal, dispose_async_engines, engine, sync_schema
+from app.routers import auth, farmers, agronomists, fields, requests, treatments, ndvi, dashboard
+from app.services.ndvi_service import get_ndvi_service, shutdown_ndvi_service
+from app.services.ndvi_jobs import start_job_workers, stop_job_workers
+from app.ingest import start_ingest_scheduler, stop_ingest_scheduler
+from app.services.spatial_index import ensure_spatial_index
+from app.services.passwords import shutdown_password_pool
+from app.services.pagination import NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Create database tables (and columns/indexes added since)
+sync_schema()
+with SessionLocal() as db:
+    ensure_spatial_index(engine, db)
 
-app = FastAPI(title="AgriMonitor API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One NDVIService (env config, Earth Engine init, pooled HTTP session) for the app lifetime
+    get_ndvi_service()
+    start_job_workers()
+    start_ingest_scheduler()
+    yield
+    stop_ingest_scheduler()
+    stop_job_workers()
+    shutdown_ndvi_service()
+    shutdown_password_pool()
+    await dispose_async_engines()
+
+app = FastAPI(title="AgriMonitor API", version="1.0.0", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -15,6 +37,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[TOTAL_COUNT_HEADER, NEXT_CURSOR_HEADER],
 )
 
 # Include routers
@@ -25,6 +48,7 @@ app.include_router(fields.router, prefix="/api/fields", tags=["fields"])
 app.include_router(requests.router, prefix="/api/requests", tags=["requests"])
 app.include_router(treatments.router, prefix="/api/treatments", tags=["treatments"])
 app.include_router(ndvi.router, prefix="/api/ndvi", tags=["ndvi"])
+app.include_router(dashboard.router, prefix="/api/dashboard", tags=["dashboard"])
 
 @app.get("/")
 async def root():
@@ -1,7 +1,9 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, Index, Enum as SQLEnum
+from sqlalchemy import event
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
+from app.services.geometry import field_geometry, geometry_bounds
 import enum
 
 class UserRole(str, enum.Enum):
@@ -20,6 +22,12 @@ class TreatmentStatus(str, enum.Enum):
     COMPLETED = "completed"
     VERIFIED = "verified"
 
+class JobStatus(str, enum.Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
 class User(Base):
     __tablename__ = "users"
     
@@ -63,19 +71,31 @@ class Field(Base):
     __tablename__ = "fields"
     
     id = Column(Integer, primary_key=True, index=True)
-    farmer_id = Column(Integer, ForeignKey("farmers.id"), nullable=False)
+    farmer_id = Column(Integer, ForeignKey("farmers.id"), nullable=False, index=True)
     name = Column(String, nullable=False)
     area_hectares = Column(Float, nullable=False)
-    crop_type = Column(String, nullable=True)
+    crop_type = Column(String, nullable=True, index=True)
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
     polygon_coordinates = Column(Text, nullable=True)  # JSON string of coordinates
+    # Bounding box of the polygon (or point box), kept in sync below; backs the spatial index
+    bbox_west = Column(Float, nullable=True)
+    bbox_south = Column(Float, nullable=True)
+    bbox_east = Column(Float, nullable=True)
+    bbox_north = Column(Float, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     farmer = relationship("Farmer", back_populates="fields")
     ndvi_data = relationship("NDVIData", back_populates="field")
     requests = relationship("TreatmentRequest", back_populates="field")
 
+@event.listens_for(Field, "before_insert")
+@event.listens_for(Field, "before_update")
+def _update_field_bbox(mapper, connection, field):
+    if field.latitude is None or field.longitude is None:
+        return
+    field.bbox_west, field.bbox_south, field.bbox_east, field.bbox_north = geometry_bounds(field_geometry(field))
+
 class NDVIData(Base):
     __tablename__ = "ndvi_data"
     
@@ -85,17 +105,56 @@ class NDVIData(Base):
     ndvi_value = Column(Float, nullable=False)  # Average NDVI for the field
     image_url = Column(String, nullable=True)  # URL to NDVI image
     ndvi_metadata = Column(Text, nullable=True)  # JSON string with additional data
+    source = Column(String, nullable=True)  # Copied from metadata so list queries skip the JSON blob
+    is_real_data = Column(Boolean, nullable=True)
+    # Zonal statistics over the field polygon (real Sentinel 2 reads only)
+    ndvi_std = Column(Float, nullable=True)
+    ndvi_min = Column(Float, nullable=True)
+    ndvi_max = Column(Float, nullable=True)
+    ndvi_median = Column(Float, nullable=True)
+    ndvi_p10 = Column(Float, nullable=True)
+    ndvi_p25 = Column(Float, nullable=True)
+    ndvi_p75 = Column(Float, nullable=True)
+    ndvi_p90 = Column(Float, nullable=True)
+    valid_pixels = Column(Integer, nullable=True)
+    valid_fraction = Column(Float, nullable=True)  # valid pixels / pixels inside the polygon
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     field = relationship("Field", back_populates="ndvi_data")
+    index_values = relationship("SpectralIndexValue", back_populates="ndvi_data")
+
+# Latest-NDVI-per-field lookups
+Index("ix_ndvi_data_field_id_date", NDVIData.field_id, NDVIData.date.desc())
+
+class SpectralIndexValue(Base):
+    """Zonal statistics of one spectral index (evi, ndre, ...) for an NDVIData acquisition"""
+    __tablename__ = "spectral_index_values"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    ndvi_data_id = Column(Integer, ForeignKey("ndvi_data.id"), nullable=False, index=True)
+    field_id = Column(Integer, ForeignKey("fields.id"), nullable=False)
+    date = Column(DateTime(timezone=True), nullable=False)
+    index_name = Column(String, nullable=False)
+    value = Column(Float, nullable=False)  # Mean over the field
+    std = Column(Float, nullable=True)
+    median = Column(Float, nullable=True)
+    p10 = Column(Float, nullable=True)
+    p90 = Column(Float, nullable=True)
+    valid_pixels = Column(Integer, nullable=True)
+    valid_fraction = Column(Float, nullable=True)
+    
+    ndvi_data = relationship("NDVIData", back_populates="index_values")
+
+Index("ix_spectral_index_values_field_index_date",
+      SpectralIndexValue.field_id, SpectralIndexValue.index_name, SpectralIndexValue.date)
 
 class TreatmentRequest(Base):
     __tablename__ = "treatment_requests"
     
     id = Column(Integer, primary_key=True, index=True)
-    agronomist_id = Column(Integer, ForeignKey("agronomists.id"), nullable=False)
-    field_id = Column(Integer, ForeignKey("fields.id"), nullable=False)
-    status = Column(SQLEnum(RequestStatus), default=RequestStatus.PENDING)
+    agronomist_id = Column(Integer, ForeignKey("agronomists.id"), nullable=False, index=True)
+    field_id = Column(Integer, ForeignKey("fields.id"), nullable=False, index=True)
+    status = Column(SQLEnum(RequestStatus), default=RequestStatus.PENDING, index=True)
     message = Column(Text, nullable=False)
     proposed_price = Column(Float, nullable=False)
     before_ndvi_value = Column(Float, nullable=False)
@@ -107,12 +166,15 @@ class TreatmentRequest(Base):
     field = relationship("Field", back_populates="requests")
     treatment = relationship("Treatment", back_populates="request", uselist=False)
 
+# Agronomist's requests newest first (sort=created_at keyset pages)
+Index("ix_treatment_requests_agronomist_created", TreatmentRequest.agronomist_id, TreatmentRequest.created_at)
+
 class Treatment(Base):
     __tablename__ = "treatments"
     
     id = Column(Integer, primary_key=True, index=True)
     request_id = Column(Integer, ForeignKey("treatment_requests.id"), unique=True, nullable=False)
-    status = Column(SQLEnum(TreatmentStatus), default=TreatmentStatus.SCHEDULED)
+    status = Column(SQLEnum(TreatmentStatus), default=TreatmentStatus.SCHEDULED, index=True)
     scheduled_date = Column(DateTime(timezone=True), nullable=True)
     completed_date = Column(DateTime(timezone=True), nullable=True)
     after_ndvi_value = Column(Float, nullable=True)
@@ -125,3 +187,40 @@ class Treatment(Base):
     
     request = relationship("TreatmentRequest", back_populates="treatment")
 
+    @property
+    def before_ndvi_value(self):
+        """NDVI when the request was made (TreatmentResponse.before_ndvi_value)"""
+        return self.request.before_ndvi_value if self.request else None
+
+class NDVIJob(Base):
+    __tablename__ = "ndvi_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    created_by_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    dedup_key = Column(String, nullable=False, index=True)  # Identical pending jobs share a key
+    payload = Column(Text, nullable=False)  # JSON: field_ids, bounds, date
+    status = Column(SQLEnum(JobStatus), default=JobStatus.PENDING, index=True)
+    progress = Column(Float, default=0.0)  # 0..1
+    field_order = Column(Text, nullable=True)  # JSON: field ids resolved on the first attempt, in run order
+    completed_fields = Column(Integer, default=0)  # Fields in committed chunks; a retry resumes after them
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    next_run_at = Column(DateTime(timezone=True), nullable=False)
+    result = Column(Text, nullable=True)  # JSON summary (fields, saved), updated after each chunk
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+# At most one pending/running job per dedup key, so concurrent identical submissions can't both queue
+_active_job = NDVIJob.status.in_([JobStatus.PENDING, JobStatus.RUNNING])
+Index("uq_ndvi_jobs_active_dedup_key", NDVIJob.dedup_key, unique=True,
+      sqlite_where=_active_job, postgresql_where=_active_job)
+
+class NDVIIngestState(Base):
+    __tablename__ = "ndvi_ingest_state"
+    
+    field_id = Column(Integer, ForeignKey("fields.id"), primary_key=True)
+    last_item_id = Column(String, nullable=True)  # Last Sentinel 2 STAC item ingested for the field
+    last_item_datetime = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
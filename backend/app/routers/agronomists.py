@@ -1,9 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from datetime import date
 from app.database import get_db
 from app import models, schemas
-from app.auth import get_current_agronomist
+from app.auth import get_current_agronomist, invalidate_identity
+from app.models import RequestStatus
+from app.routers.requests import request_list_query
+from app.services.pagination import PageParams, paginate
 
 router = APIRouter()
 
@@ -21,9 +25,21 @@ def update_agronomist_profile(
     agronomist.license_number = agronomist_data.license_number
     db.commit()
     db.refresh(agronomist)
+    invalidate_identity(agronomist.user.email)
     return agronomist
 
 @router.get("/requests", response_model=List[schemas.TreatmentRequestResponse])
-def get_my_requests(agronomist: models.Agronomist = Depends(get_current_agronomist)):
-    return agronomist.requests
+def get_my_requests(
+    response: Response,
+    page: PageParams = Depends(),
+    status: Optional[RequestStatus] = None,
+    crop_type: Optional[str] = None,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    agronomist: models.Agronomist = Depends(get_current_agronomist),
+    db: Session = Depends(get_db)
+):
+    query = request_list_query(db, status, crop_type, date_from, date_to) \
+        .filter(models.TreatmentRequest.agronomist_id == agronomist.id)
+    return paginate(query, models.TreatmentRequest, page, response)
 
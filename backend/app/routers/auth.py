@@ -2,54 +2,71 @@ from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from app.database import get_db
 from app import models, schemas
+from app.services.passwords import PasswordHashBusy, hash_password_async
 from app.auth import (
     authenticate_user,
     create_access_token,
-    get_password_hash,
     get_current_user,
+    get_user_by_email,
+    invalidate_identity,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
 
 router = APIRouter()
 
+def _hash_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-ins right now, please retry",
+        headers={"Retry-After": "2"},
+    )
+
+def _create_user(db: Session, user_data: schemas.UserCreate, hashed_password: str) -> models.User:
+    db_user = models.User(
+        email=user_data.email,
+        hashed_password=hashed_password,
+        full_name=user_data.full_name,
+        role=user_data.role,
+        phone=user_data.phone
+    )
+    db.add(db_user)
+    db.commit()
+    db.refresh(db_user)
+    
+    # Create profile based on role
+    # Note: User can have both profiles if they register with different roles later
+    if user_data.role == models.UserRole.FARMER:
+        farmer = models.Farmer(user_id=db_user.id)
+        db.add(farmer)
+    elif user_data.role == models.UserRole.AGRONOMIST:
+        agronomist = models.Agronomist(user_id=db_user.id)
+        db.add(agronomist)
+    
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
 @router.post("/register", response_model=schemas.UserResponse)
-def register(user_data: schemas.UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: schemas.UserCreate, db: Session = Depends(get_db)):
+    # Queries run in the threadpool; only the password hash is awaited on the event loop
     try:
         # Check if user already exists
-        db_user = db.query(models.User).filter(models.User.email == user_data.email).first()
+        db_user = await run_in_threadpool(get_user_by_email, db, user_data.email)
         if db_user:
             raise HTTPException(status_code=400, detail="Email already registered")
         
         # Create user
-        hashed_password = get_password_hash(user_data.password)
-        db_user = models.User(
-            email=user_data.email,
-            hashed_password=hashed_password,
-            full_name=user_data.full_name,
-            role=user_data.role,
-            phone=user_data.phone
-        )
-        db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
-        
-        # Create profile based on role
-        # Note: User can have both profiles if they register with different roles later
-        if user_data.role == models.UserRole.FARMER:
-            farmer = models.Farmer(user_id=db_user.id)
-            db.add(farmer)
-        elif user_data.role == models.UserRole.AGRONOMIST:
-            agronomist = models.Agronomist(user_id=db_user.id)
-            db.add(agronomist)
-        
-        db.commit()
-        return db_user
+        hashed_password = await hash_password_async(user_data.password)
+        return await run_in_threadpool(_create_user, db, user_data, hashed_password)
     except HTTPException:
         raise
+    except PasswordHashBusy:
+        raise _hash_busy()
     except Exception as e:
-        db.rollback()
+        await run_in_threadpool(db.rollback)
         raise HTTPException(status_code=500, detail=f"Registration failed: {str(e)}")
 
 @router.post("/add-role")
@@ -66,7 +83,7 @@ def add_role(
         
         if role == "farmer":
             # Check if farmer profile already exists
-            farmer = db.query(models.Farmer).filter(models.Farmer.user_id == current_user.id).first()
+            farmer = current_user.farmer_profile
             if farmer:
                 return {"message": "Farmer role already exists", "role": "farmer", "success": True}
             
@@ -76,6 +93,7 @@ def add_role(
                 db.add(farmer)
                 db.commit()
                 db.refresh(farmer)
+                invalidate_identity(current_user.email)
                 return {"message": "Farmer role added successfully", "role": "farmer", "success": True}
             except Exception as e:
                 db.rollback()
@@ -87,7 +105,7 @@ def add_role(
                 
         elif role == "agronomist":
             # Check if agronomist profile already exists
-            agronomist = db.query(models.Agronomist).filter(models.Agronomist.user_id == current_user.id).first()
+            agronomist = current_user.agronomist_profile
             if agronomist:
                 return {"message": "Agronomist role already exists", "role": "agronomist", "success": True}
             
@@ -97,6 +115,7 @@ def add_role(
                 db.add(agronomist)
                 db.commit()
                 db.refresh(agronomist)
+                invalidate_identity(current_user.email)
                 return {"message": "Agronomist role added successfully", "role": "agronomist", "success": True}
             except Exception as e:
                 db.rollback()
@@ -127,13 +146,11 @@ def get_available_roles(
     roles = []
     
     # Check if user has farmer profile
-    farmer = db.query(models.Farmer).filter(models.Farmer.user_id == current_user.id).first()
-    if farmer:
+    if current_user.farmer_profile:
         roles.append("farmer")
     
     # Check if user has agronomist profile
-    agronomist = db.query(models.Agronomist).filter(models.Agronomist.user_id == current_user.id).first()
-    if agronomist:
+    if current_user.agronomist_profile:
         roles.append("agronomist")
     
     return {
@@ -142,8 +159,11 @@ def get_available_roles(
     }
 
 @router.post("/login", response_model=schemas.Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    try:
+        user = await authenticate_user(db, form_data.username, form_data.password)
+    except PasswordHashBusy:
+        raise _hash_busy()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
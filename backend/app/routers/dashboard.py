@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import Optional
+from app.database import get_db
+from app import models
+from app.auth import get_current_user
+from app.services.dashboard import dashboard_summary
+
+router = APIRouter()
+
+@router.get("/summary")
+def get_dashboard_summary(
+    role: Optional[models.UserRole] = None,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Counts by status, average improvement, fields below the NDVI threshold and recent
+    activity for the current user as `role` (default: the user's own role).
+    """
+    role = role or current_user.role
+    if role == models.UserRole.FARMER:
+        profile = current_user.farmer_profile
+        if not profile:
+            raise HTTPException(status_code=404, detail="Farmer profile not found")
+    else:
+        profile = current_user.agronomist_profile
+        if not profile:
+            raise HTTPException(status_code=404, detail="Agronomist profile not found")
+    return dashboard_summary(db, role, profile.id)
@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from datetime import date
 from app.database import get_db
 from app import models, schemas
-from app.auth import get_current_farmer
+from app.auth import get_current_farmer, invalidate_identity
+from app.routers.fields import field_list_query
+from app.services.pagination import PageParams, paginate
 
 router = APIRouter()
 
@@ -21,9 +24,19 @@ def update_farmer_profile(
     farmer.address = farmer_data.address
     db.commit()
     db.refresh(farmer)
+    invalidate_identity(farmer.user.email)
     return farmer
 
 @router.get("/fields", response_model=List[schemas.FieldResponse])
-def get_my_fields(farmer: models.Farmer = Depends(get_current_farmer), db: Session = Depends(get_db)):
-    return farmer.fields
+def get_my_fields(
+    response: Response,
+    page: PageParams = Depends(),
+    crop_type: Optional[str] = None,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    farmer: models.Farmer = Depends(get_current_farmer),
+    db: Session = Depends(get_db)
+):
+    query = field_list_query(db, crop_type, date_from, date_to).filter(models.Field.farmer_id == farmer.id)
+    return paginate(query, models.Field, page, response)
 
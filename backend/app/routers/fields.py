@@ -1,12 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
-from app.database import get_db
+from typing import List, Optional
+from datetime import date
+from app.database import get_async_db, get_db
 from app import models, schemas
-from app.auth import get_current_farmer, get_current_user
+from app.auth import get_current_farmer, get_current_user_async
+from app.services.pagination import PageParams, filter_date_range, paginate
+from app.services.query_shapes import FIELD_LIST
 
 router = APIRouter()
 
+def field_list_query(db: Session, crop_type: Optional[str] = None, date_from: Optional[date] = None,
+                     date_to: Optional[date] = None):
+    query = db.query(models.Field).options(*FIELD_LIST)
+    if crop_type:
+        query = query.filter(models.Field.crop_type == crop_type)
+    return filter_date_range(query, models.Field.created_at, date_from, date_to)
+
 @router.post("/", response_model=schemas.FieldResponse)
 def create_field(
     field_data: schemas.FieldCreate,
@@ -20,28 +31,31 @@ def create_field(
     return db_field
 
 @router.get("/", response_model=List[schemas.FieldResponse])
-def get_all_fields(
-    skip: int = 0,
-    limit: int = 100,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def get_all_fields(
+    response: Response,
+    page: PageParams = Depends(),
+    crop_type: Optional[str] = None,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    current_user: models.User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
+    """Fields (created between from and to), one keyset page at a time; see app.services.pagination"""
     # Check if user has farmer profile
-    farmer = db.query(models.Farmer).filter(models.Farmer.user_id == current_user.id).first()
+    farmer = current_user.farmer_profile
     # Check if user has agronomist profile
-    agronomist = db.query(models.Agronomist).filter(models.Agronomist.user_id == current_user.id).first()
+    agronomist = current_user.agronomist_profile
+    
+    def fields_page(session: Session):
+        query = field_list_query(session, crop_type, date_from, date_to)
+        # If user has farmer profile (and no agronomist profile), show only their fields
+        if farmer and not agronomist:
+            query = query.filter(models.Field.farmer_id == farmer.id)
+        # If user has agronomist profile (or both), or neither profile (for compatibility), show all fields
+        return paginate(query, models.Field, page, response)
     
-    # If user has farmer profile (and no agronomist profile), show only their fields
-    if farmer and not agronomist:
-        return farmer.fields
-    # If user has agronomist profile (or both), show all fields
-    elif agronomist:
-        fields = db.query(models.Field).offset(skip).limit(limit).all()
-        return fields
-    # If user has neither profile, show all fields (for compatibility)
-    else:
-        fields = db.query(models.Field).offset(skip).limit(limit).all()
-        return fields
+    # The query code is shared with the sync endpoints; run_sync drives it on the async driver
+    return await db.run_sync(fields_page)
 
 @router.get("/{field_id}", response_model=schemas.FieldResponse)
 def get_field(field_id: int, db: Session = Depends(get_db)):
@@ -1,95 +1,320 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import and_, null, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
-from datetime import datetime
-from app.database import get_db
+from datetime import date, datetime
+from app.database import get_async_db, get_db
 from app import models, schemas
-from app.auth import get_current_user
-from app.services.ndvi_service import NDVIService
+from app.auth import get_current_user, get_current_user_async
+from app.services.ndvi_service import NDVIService, get_ndvi_service
+from app.services.band_cache import get_band_cache
+from app.services.cog_reader import get_mask_cache
+from app.services.stac_cache import get_stac_cache
+from app.services.ndvi_jobs import submit_job
+from app.services.ndvi_analytics import fleet_analytics
+from app.services.ndvi_series import AGGREGATES, BUCKETS, FILLS, field_series_async
+from app.services.pagination import SORT_KEYS, PageParams, filter_date_range, paginate
+from app.services.query_shapes import NDVI_LIST
+from app.services.spatial_index import field_ids_in_bounds, parse_bounds
+from app.services.spectral_indices import resolve_indices
+from app.services.vector_tiles import MAX_TILE_ZOOM, MVT_MEDIA_TYPE, POLYGON_MIN_ZOOM, get_tile, get_tile_cache
+from app.services.ndvi_store import (
+    index_value_rows, insert_ndvi_records, latest_ndvi_subquery, ndvi_data_source, ndvi_row, select_fields
+)
 
 router = APIRouter()
 
+# How often to check whether the client of a long fetch has disconnected
+DISCONNECT_POLL_SECONDS = 0.5
+# Observation lists can also be paged by acquisition date (ix_ndvi_data_field_id_date)
+NDVI_SORT_KEYS = SORT_KEYS + ("date",)
+
+async def _cancel_on_disconnect(request: Request, awaitable):
+    """Await `awaitable`, cancelling it if the HTTP client disconnects first"""
+    work = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({work}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return work.result()
+            if await request.is_disconnected():
+                work.cancel()
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    finally:
+        if not work.done():
+            work.cancel()
+
 @router.get("/field/{field_id}", response_model=List[schemas.NDVIDataResponse])
 def get_field_ndvi_data(
     field_id: int,
+    response: Response,
+    page: PageParams = Depends(),
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
     db: Session = Depends(get_db)
 ):
-    field = db.query(models.Field).filter(models.Field.id == field_id).first()
-    if not field:
+    """Observations acquired between from and to; sort=date&order=desc&limit=1 is the latest"""
+    if not db.query(models.Field.id).filter(models.Field.id == field_id).first():
+        raise HTTPException(status_code=404, detail="Field not found")
+    query = db.query(models.NDVIData).options(*NDVI_LIST).filter(models.NDVIData.field_id == field_id)
+    query = filter_date_range(query, models.NDVIData.date, date_from, date_to)
+    return paginate(query, models.NDVIData, page, response, sort_keys=NDVI_SORT_KEYS)
+
+@router.get("/field/{field_id}/series")
+async def get_field_ndvi_series(
+    field_id: int,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    bucket: str = "week",  # week | month
+    agg: str = "mean",  # mean | max
+    index: str = "ndvi",
+    fill: str = "linear",  # linear | none
+    smooth: Optional[int] = Query(None, ge=3, le=51, description="Savitzky-Golay window in buckets"),
+    current_user: models.User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    NDVI (or another index) per week/month, aggregated in SQL and returned as columnar
+    arrays: dates, values, observations (0 = interpolated bucket) and optionally smoothed.
+    """
+    if bucket not in BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {', '.join(BUCKETS)}")
+    if agg not in AGGREGATES:
+        raise HTTPException(status_code=400, detail=f"agg must be one of {', '.join(AGGREGATES)}")
+    if fill not in FILLS:
+        raise HTTPException(status_code=400, detail=f"fill must be one of {', '.join(FILLS)}")
+    index = _resolve_indices([index])[-1]
+    if date_from and date_to and date_from > date_to:
+        raise HTTPException(status_code=400, detail="from must be before to")
+    if await db.scalar(select(models.Field.id).where(models.Field.id == field_id)) is None:
         raise HTTPException(status_code=404, detail="Field not found")
-    return field.ndvi_data
+    return await field_series_async(db, field_id, bucket, agg, date_from, date_to, index, fill, smooth)
+
+def _resolve_indices(indices: Optional[List[str]]) -> Optional[List[str]]:
+    if not indices:
+        return None
+    try:
+        return resolve_indices(indices)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _save_ndvi(db: Session, field_id: int, ndvi_data) -> models.NDVIData:
+    """Insert a fetched record with its index values; returns the row with index_values loaded"""
+    db_ndvi = models.NDVIData(**ndvi_row(field_id, ndvi_data))
+    db_ndvi.index_values = [models.SpectralIndexValue(**row) for row in index_value_rows(field_id, ndvi_data)]
+    db.add(db_ndvi)
+    db.commit()
+    db.refresh(db_ndvi)
+    db_ndvi.index_values  # Loaded here, not by the response serializer on the event loop
+    return db_ndvi
 
 @router.post("/field/{field_id}/fetch", response_model=schemas.NDVIDataResponse)
-def fetch_ndvi_data(
+async def fetch_ndvi_data(
     field_id: int,
+    request: Request,
     date: Optional[datetime] = None,
+    indices: Optional[str] = None,  # Comma separated, e.g. "evi,ndre"; NDVI is always computed
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    ndvi_service: NDVIService = Depends(get_ndvi_service)
 ):
-    field = db.query(models.Field).filter(models.Field.id == field_id).first()
+    index_names = _resolve_indices(indices.split(",") if indices else None)
+    # Database work stays in the threadpool (a locked SQLite write would block the loop);
+    # only the Sentinel 2 fetch is awaited here
+    field = await run_in_threadpool(db.query(models.Field).filter(models.Field.id == field_id).first)
     if not field:
         raise HTTPException(status_code=404, detail="Field not found")
     
-    # Use NDVI service to fetch data from Sentinel 2
-    ndvi_service = NDVIService()
-    ndvi_data = ndvi_service.fetch_ndvi_for_field(field, date)
-    
-    # Save to database
-    db_ndvi = models.NDVIData(
-        field_id=field.id,
-        date=ndvi_data['date'],
-        ndvi_value=ndvi_data['ndvi_value'],
-        image_url=ndvi_data.get('image_url'),
-        ndvi_metadata=ndvi_data.get('ndvi_metadata')
+    # Fetch from Sentinel 2 on the async pipeline; stop if the client goes away
+    pipeline = ndvi_service.async_pipeline
+    ndvi_data = await _cancel_on_disconnect(
+        request, pipeline.run(pipeline.fetch_ndvi_for_field(field, date, index_names))
     )
-    db.add(db_ndvi)
+    
+    return await run_in_threadpool(_save_ndvi, db, field.id, ndvi_data)
+
+@router.post("/batch-fetch")
+def batch_fetch_ndvi_data(
+    batch: schemas.NDVIBatchFetchRequest,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    ndvi_service: NDVIService = Depends(get_ndvi_service)
+):
+    """
+    Fetch NDVI for many fields at once (by id list and/or bounding box).
+    Fields sharing a Sentinel 2 tile and acquisition are computed from a single band read.
+    """
+    if not batch.field_ids and not batch.bounds:
+        raise HTTPException(status_code=400, detail="Provide field_ids or bounds")
+    if batch.bounds is not None and len(batch.bounds) != 4:
+        raise HTTPException(status_code=400, detail="bounds must be [min_lat, min_lon, max_lat, max_lon]")
+    
+    index_names = _resolve_indices(batch.indices)
+    fields = select_fields(db, batch.field_ids, batch.bounds)
+    if not fields:
+        raise HTTPException(status_code=404, detail="No fields found")
+    
+    records = ndvi_service.fetch_ndvi_for_fields(fields, batch.date, index_names)
+    
+    # Single bulk insert for all fields
+    rows = insert_ndvi_records(db, fields, records)
     db.commit()
-    db.refresh(db_ndvi)
-    return db_ndvi
+    
+    return {
+        "fetched": len(rows),
+        "results": [
+            {"field_id": row["field_id"], "ndvi_value": row["ndvi_value"], "date": row["date"].isoformat()}
+            for row in rows
+        ]
+    }
 
-@router.get("/map")
-def get_ndvi_map_data(
-    bounds: Optional[str] = None,  # Format: "min_lat,min_lon,max_lat,max_lon"
+@router.post("/jobs", response_model=schemas.NDVIJobResponse, status_code=202)
+def submit_ndvi_job(
+    batch: schemas.NDVIBatchFetchRequest,
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
-    Get NDVI data for all fields in the map view
+    Queue an NDVI fetch (field_ids and/or bounds) and return the job right away.
+    Poll GET /jobs/{job_id} for progress and results.
     """
-    fields = db.query(models.Field).all()
+    if not batch.field_ids and not batch.bounds:
+        raise HTTPException(status_code=400, detail="Provide field_ids or bounds")
+    if batch.bounds is not None and len(batch.bounds) != 4:
+        raise HTTPException(status_code=400, detail="bounds must be [min_lat, min_lon, max_lat, max_lon]")
     
-    import json
+    payload = {
+        "field_ids": sorted(set(batch.field_ids)) if batch.field_ids else None,
+        "bounds": batch.bounds,
+        "date": batch.date.isoformat() if batch.date else None,
+        "indices": _resolve_indices(batch.indices)
+    }
+    return submit_job(db, payload, user_id=current_user.id)
+
+@router.get("/jobs/{job_id}", response_model=schemas.NDVIJobResponse)
+def get_ndvi_job(
+    job_id: int,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    job = db.query(models.NDVIJob).filter(
+        models.NDVIJob.id == job_id,
+        models.NDVIJob.created_by_id == current_user.id
+    ).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+def _map_rows(db: Session, view_bounds, include_polygons: bool):
+    """Fields in view (all if view_bounds is None) with their latest NDVI"""
+    visible_ids = field_ids_in_bounds(db, view_bounds) if view_bounds else None
+    ranked = latest_ndvi_subquery(db, visible_ids)
+    
+    rows = db.query(
+        models.Field.id,
+        models.Field.name,
+        models.Field.latitude,
+        models.Field.longitude,
+        models.Field.area_hectares,
+        models.Field.crop_type,
+        models.Field.polygon_coordinates if include_polygons else null().label("polygon_coordinates"),
+        ranked.c.ndvi_value,
+        ranked.c.date,
+        ranked.c.source,
+        ranked.c.is_real_data,
+        ranked.c.legacy_metadata
+    ).outerjoin(
+        ranked, and_(ranked.c.field_id == models.Field.id, ranked.c.rank == 1)
+    )
+    if visible_ids is not None:
+        rows = rows.filter(models.Field.id.in_(visible_ids))
+    return rows.all()
+
+@router.get("/map")
+async def get_ndvi_map_data(
+    bounds: Optional[str] = None,  # Format: "min_lat,min_lon,max_lat,max_lon"
+    zoom: Optional[int] = None,
+    current_user: models.User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get NDVI data for the fields in the map view (all fields if no bounds are given).
+    Below POLYGON_MIN_ZOOM polygons are left out, fields are drawn as markers.
+    """
+    try:
+        view_bounds = parse_bounds(bounds)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bounds must be 'min_lat,min_lon,max_lat,max_lon'")
+    include_polygons = zoom is None or zoom >= POLYGON_MIN_ZOOM
+    # Query API code on the async driver (run_sync), not in the threadpool
+    rows = await db.run_sync(_map_rows, view_bounds, include_polygons)
     
     result = []
-    for field in fields:
-        latest_ndvi = db.query(models.NDVIData).filter(
-            models.NDVIData.field_id == field.id
-        ).order_by(models.NDVIData.date.desc()).first()
-        
-        # Parse metadata to check if real data was used
-        is_real_data = False
-        data_source = "unknown"
-        if latest_ndvi and latest_ndvi.ndvi_metadata:
-            try:
-                metadata = json.loads(latest_ndvi.ndvi_metadata)
-                is_real_data = metadata.get("is_real_data", False) or metadata.get("sentinel_data_available", False)
-                data_source = metadata.get("source", "unknown")
-            except:
-                pass
+    for row in rows:
+        is_real_data, data_source = ndvi_data_source(row)
         
         result.append({
-            "field_id": field.id,
-            "name": field.name,
-            "latitude": field.latitude,
-            "longitude": field.longitude,
-            "area_hectares": field.area_hectares,
-            "crop_type": field.crop_type,
-            "polygon_coordinates": field.polygon_coordinates,
-            "latest_ndvi": latest_ndvi.ndvi_value if latest_ndvi else None,
-            "ndvi_date": latest_ndvi.date.isoformat() if latest_ndvi else None,
+            "field_id": row.id,
+            "name": row.name,
+            "latitude": row.latitude,
+            "longitude": row.longitude,
+            "area_hectares": row.area_hectares,
+            "crop_type": row.crop_type,
+            "polygon_coordinates": row.polygon_coordinates,
+            "latest_ndvi": row.ndvi_value,
+            "ndvi_date": row.date.isoformat() if row.date else None,
             "is_real_data": is_real_data,
             "data_source": data_source
         })
     
     return {"fields": result}
 
+@router.get("/analytics")
+def get_ndvi_analytics(
+    crop_type: Optional[str] = None,
+    history_days: int = Query(365, ge=30, le=3650),
+    limit: int = Query(50, ge=1, le=1000),
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Health of every field in scope from its latest NDVI: severity counts, per-crop NDVI and
+    ranked anomalies (z-score against the field's own history and against same-crop fields).
+    Farmers without an agronomist profile see their own fields, everyone else all fields.
+    """
+    farmer = current_user.farmer_profile
+    agronomist = current_user.agronomist_profile
+    farmer_id = farmer.id if farmer and not agronomist else None
+    return fleet_analytics(db, farmer_id, crop_type, history_days, limit)
+
+@router.get("/tiles/{z}/{x}/{y}.mvt")
+def get_ndvi_tile(
+    z: int,
+    x: int,
+    y: int,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Mapbox Vector Tile (layer "fields") of field geometries with latest NDVI and health class.
+    Points below POLYGON_MIN_ZOOM, simplified polygons from there on.
+    """
+    if not 0 <= z <= MAX_TILE_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=404, detail="Tile not found")
+    return Response(content=get_tile(db, z, x, y), media_type=MVT_MEDIA_TYPE)
+
+
+@router.get("/cache/stats")
+def get_cache_stats(current_user: models.User = Depends(get_current_user)):
+    """
+    Hit/miss counters of the NDVI caches
+    """
+    return {
+        "stac_search": get_stac_cache().stats(),
+        "vector_tiles": get_tile_cache().stats(),
+        "geometry_masks": get_mask_cache().stats(),
+        "band_windows": get_band_cache().stats() if get_band_cache() else None
+    }
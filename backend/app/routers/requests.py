@@ -1,14 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
-from datetime import datetime
-from app.database import get_db
+from typing import List, Optional
+from datetime import date, datetime
+from app.database import get_async_db, get_db
 from app import models, schemas
-from app.auth import get_current_agronomist, get_current_farmer, get_current_user
+from app.auth import get_current_agronomist, get_current_farmer, get_current_user, get_current_user_async
 from app.models import RequestStatus
+from app.services.pagination import PageParams, filter_date_range, paginate
+from app.services.query_shapes import REQUEST_LIST
 
 router = APIRouter()
 
+def request_list_query(db: Session, status: Optional[RequestStatus] = None, crop_type: Optional[str] = None,
+                       date_from: Optional[date] = None, date_to: Optional[date] = None):
+    """Treatment requests filtered by status, field crop and creation day"""
+    query = db.query(models.TreatmentRequest).options(*REQUEST_LIST)
+    if status:
+        query = query.filter(models.TreatmentRequest.status == status)
+    if crop_type:
+        query = query.filter(models.TreatmentRequest.field_id.in_(
+            db.query(models.Field.id).filter(models.Field.crop_type == crop_type)
+        ))
+    return filter_date_range(query, models.TreatmentRequest.created_at, date_from, date_to)
+
 @router.post("/", response_model=schemas.TreatmentRequestResponse)
 def create_treatment_request(
     request_data: schemas.TreatmentRequestCreate,
@@ -31,24 +47,36 @@ def create_treatment_request(
     return db_request
 
 @router.get("/", response_model=List[schemas.TreatmentRequestResponse])
-def get_requests(
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def get_requests(
+    response: Response,
+    page: PageParams = Depends(),
+    status: Optional[RequestStatus] = None,
+    crop_type: Optional[str] = None,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    current_user: models.User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     if current_user.role == models.UserRole.FARMER:
-        farmer = db.query(models.Farmer).filter(models.Farmer.user_id == current_user.id).first()
+        farmer = current_user.farmer_profile
         if not farmer:
             raise HTTPException(status_code=404, detail="Farmer profile not found")
         # Get requests for farmer's fields
-        requests = db.query(models.TreatmentRequest).join(models.Field).filter(
-            models.Field.farmer_id == farmer.id
-        ).all()
-        return requests
+        scope = models.TreatmentRequest.field_id.in_(
+            select(models.Field.id).where(models.Field.farmer_id == farmer.id)
+        )
     else:
-        agronomist = db.query(models.Agronomist).filter(models.Agronomist.user_id == current_user.id).first()
+        agronomist = current_user.agronomist_profile
         if not agronomist:
             raise HTTPException(status_code=404, detail="Agronomist profile not found")
-        return agronomist.requests
+        scope = models.TreatmentRequest.agronomist_id == agronomist.id
+    
+    def requests_page(session: Session):
+        query = request_list_query(session, status, crop_type, date_from, date_to).filter(scope)
+        return paginate(query, models.TreatmentRequest, page, response)
+    
+    # Query code shared with the sync endpoints, run on the async driver
+    return await db.run_sync(requests_page)
 
 @router.get("/{request_id}", response_model=schemas.TreatmentRequestResponse)
 def get_request(request_id: int, db: Session = Depends(get_db)):
@@ -116,7 +144,7 @@ def delete_request(
     db: Session = Depends(get_db)
 ):
     if current_user.role == models.UserRole.FARMER:
-        farmer = db.query(models.Farmer).filter(models.Farmer.user_id == current_user.id).first()
+        farmer = current_user.farmer_profile
         if not farmer:
             raise HTTPException(status_code=404, detail="Farmer profile not found")
         request = db.query(models.TreatmentRequest).join(models.Field).filter(
@@ -124,7 +152,7 @@ def delete_request(
             models.Field.farmer_id == farmer.id
         ).first()
     else:
-        agronomist = db.query(models.Agronomist).filter(models.Agronomist.user_id == current_user.id).first()
+        agronomist = current_user.agronomist_profile
         if not agronomist:
             raise HTTPException(status_code=404, detail="Agronomist profile not found")
         request = db.query(models.TreatmentRequest).filter(
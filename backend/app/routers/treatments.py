@@ -1,58 +1,58 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
-from datetime import datetime
-from app.database import get_db
+from typing import List, Optional
+from datetime import date, datetime
+from app.database import get_async_db, get_db
 from app import models, schemas
-from app.auth import get_current_agronomist, get_current_farmer, get_current_user
+from app.auth import get_current_agronomist, get_current_farmer, get_current_user_async
 from app.models import TreatmentStatus, RequestStatus
+from app.services.pagination import PageParams, filter_date_range, paginate
+from app.services.query_shapes import TREATMENT_LIST
 
 router = APIRouter()
 
 @router.get("/", response_model=List[schemas.TreatmentResponse])
-def get_treatments(
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def get_treatments(
+    response: Response,
+    page: PageParams = Depends(),
+    status: Optional[TreatmentStatus] = None,
+    crop_type: Optional[str] = None,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    current_user: models.User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    from sqlalchemy.orm import joinedload
-    
     if current_user.role == models.UserRole.FARMER:
-        farmer = db.query(models.Farmer).filter(models.Farmer.user_id == current_user.id).first()
+        farmer = current_user.farmer_profile
         if not farmer:
             raise HTTPException(status_code=404, detail="Farmer profile not found")
         # Get treatments for farmer's fields
-        treatments = db.query(models.Treatment).join(models.TreatmentRequest).join(models.Field).filter(
-            models.Field.farmer_id == farmer.id
-        ).options(joinedload(models.Treatment.request)).all()
+        scope = models.TreatmentRequest.field_id.in_(
+            select(models.Field.id).where(models.Field.farmer_id == farmer.id)
+        )
     else:
-        agronomist = db.query(models.Agronomist).filter(models.Agronomist.user_id == current_user.id).first()
+        agronomist = current_user.agronomist_profile
         if not agronomist:
             raise HTTPException(status_code=404, detail="Agronomist profile not found")
         # Get treatments for agronomist's requests
-        treatments = db.query(models.Treatment).join(models.TreatmentRequest).filter(
-            models.TreatmentRequest.agronomist_id == agronomist.id
-        ).options(joinedload(models.Treatment.request)).all()
+        scope = models.TreatmentRequest.agronomist_id == agronomist.id
+    
+    def treatments_page(session: Session):
+        query = session.query(models.Treatment).join(models.TreatmentRequest).options(*TREATMENT_LIST) \
+            .filter(scope)
+        if status:
+            query = query.filter(models.Treatment.status == status)
+        if crop_type:
+            query = query.filter(models.TreatmentRequest.field_id.in_(
+                select(models.Field.id).where(models.Field.crop_type == crop_type)
+            ))
+        query = filter_date_range(query, models.Treatment.created_at, date_from, date_to)
+        return paginate(query, models.Treatment, page, response)
     
-    # Convert to response format with before_ndvi_value
-    result = []
-    for treatment in treatments:
-        treatment_dict = {
-            "id": treatment.id,
-            "request_id": treatment.request_id,
-            "status": treatment.status,
-            "scheduled_date": treatment.scheduled_date,
-            "completed_date": treatment.completed_date,
-            "after_ndvi_value": treatment.after_ndvi_value,
-            "improvement_percentage": treatment.improvement_percentage,
-            "treatment_type": treatment.treatment_type,
-            "notes": treatment.notes,
-            "agronomist_confirmed": treatment.agronomist_confirmed,
-            "farmer_confirmed": treatment.farmer_confirmed,
-            "created_at": treatment.created_at,
-            "before_ndvi_value": treatment.request.before_ndvi_value if treatment.request else None
-        }
-        result.append(schemas.TreatmentResponse(**treatment_dict))
-    return result
+    # Query API code, run on the async driver by run_sync (no threadpool thread)
+    return await db.run_sync(treatments_page)
 
 @router.get("/{treatment_id}", response_model=schemas.TreatmentResponse)
 def get_treatment(treatment_id: int, db: Session = Depends(get_db)):
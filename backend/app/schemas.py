@@ -1,7 +1,7 @@
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List
 from datetime import datetime
-from app.models import UserRole, RequestStatus, TreatmentStatus
+from app.models import UserRole, RequestStatus, TreatmentStatus, JobStatus
 
 # User schemas
 class UserBase(BaseModel):
@@ -91,10 +91,58 @@ class NDVIDataBase(BaseModel):
 class NDVIDataCreate(NDVIDataBase):
     field_id: int
 
+class SpectralIndexValueResponse(BaseModel):
+    index_name: str
+    value: float
+    std: Optional[float] = None
+    median: Optional[float] = None
+    p10: Optional[float] = None
+    p90: Optional[float] = None
+    valid_pixels: Optional[int] = None
+    valid_fraction: Optional[float] = None
+    
+    class Config:
+        from_attributes = True
+
 class NDVIDataResponse(NDVIDataBase):
     id: int
     field_id: int
+    source: Optional[str] = None
+    is_real_data: Optional[bool] = None
+    ndvi_std: Optional[float] = None
+    ndvi_min: Optional[float] = None
+    ndvi_max: Optional[float] = None
+    ndvi_median: Optional[float] = None
+    ndvi_p10: Optional[float] = None
+    ndvi_p25: Optional[float] = None
+    ndvi_p75: Optional[float] = None
+    ndvi_p90: Optional[float] = None
+    valid_pixels: Optional[int] = None
+    valid_fraction: Optional[float] = None
+    index_values: List[SpectralIndexValueResponse] = []
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class NDVIBatchFetchRequest(BaseModel):
+    field_ids: Optional[List[int]] = None
+    bounds: Optional[List[float]] = None  # [min_lat, min_lon, max_lat, max_lon]
+    date: Optional[datetime] = None
+    indices: Optional[List[str]] = None  # e.g. ["evi", "ndre"]; NDVI is always computed
+
+class NDVIJobResponse(BaseModel):
+    id: int
+    status: JobStatus
+    progress: float
+    attempts: int
+    max_attempts: int
+    result: Optional[str] = None  # JSON summary
+    error: Optional[str] = None
+    next_run_at: Optional[datetime] = None
     created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
@@ -0,0 +1,207 @@
+"""
+On-disk cache of band windows read from remote COGs.
+
+An entry is one windowed read: the asset href (minus its SAS token, so the key
+names the STAC item and band) plus the window that was requested. Pixels and
+mask are stored as a compressed .npz next to a small JSON header (transform,
+CRS, window, overview level), so a repeat analysis of the same scene is served
+without opening the remote file at all.
+
+Entries are written to a temp file and moved into place with os.replace, so
+concurrent worker processes never see a partial file; the last writer wins with
+identical content. The directory is kept under NDVI_BAND_CACHE_MAX_BYTES by
+evicting the least recently used entries (file mtime, touched on every hit),
+with one process at a time holding the eviction lock.
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: eviction runs without the cross-process lock
+    fcntl = None
+
+ENTRY_SUFFIX = ".npz"
+LOCK_FILE = ".evict.lock"
+# Evict down to this fraction of the budget so eviction does not run on every write
+EVICT_TARGET_FRACTION = 0.9
+# Rescan the directory after writing this fraction of the budget
+RESCAN_FRACTION = 0.05
+
+REMOTE_PREFIXES = ("http://", "https://", "s3://", "gs://", "/vsi")
+
+
+def is_remote(path: str) -> bool:
+    return path.startswith(REMOTE_PREFIXES)
+
+
+def asset_key(path: str) -> str:
+    """Href without query string or fragment (SAS tokens change on every signing)"""
+    if path.startswith(("http://", "https://")):
+        parts = urlsplit(path)
+        return urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
+    return path
+
+
+class BandWindowCache:
+    """Byte-budgeted LRU of band windows in a directory shared by all worker processes"""
+
+    def __init__(self, directory: str, max_bytes: int = 2 * 1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._written_since_scan = 0
+        self._scanned = False
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, path: str, *window) -> str:
+        """Cache key of a read of `path` over `window` (any JSON-serializable description)"""
+        payload = json.dumps([asset_key(path), list(window)], sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ENTRY_SUFFIX)
+
+    def get(self, key: str) -> Tuple[bool, Optional[np.ma.MaskedArray], Optional[Dict]]:
+        """
+        (found, data, header). A cached empty result (the window missed the raster)
+        is (True, None, None).
+        """
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as entry:
+                header = json.loads(str(entry["header"]))
+                data = None
+                if not header.get("empty"):
+                    data = np.ma.MaskedArray(entry["data"], mask=entry["mask"])
+            os.utime(path)
+        except (FileNotFoundError, OSError, ValueError, KeyError):
+            # Missing, evicted by another process mid-read, or corrupt: treat as a miss
+            self.misses += 1
+            return False, None, None
+        self.hits += 1
+        return True, data, (None if header.get("empty") else header)
+
+    def put(self, key: str, data: Optional[np.ma.MaskedArray], header: Optional[Dict]):
+        """Store a window (or an empty result when data is None)"""
+        if data is None:
+            arrays = {"header": np.array(json.dumps({"empty": True}))}
+        else:
+            arrays = {
+                "header": np.array(json.dumps(header)),
+                "data": np.ma.getdata(data),
+                "mask": np.ma.getmaskarray(data),
+            }
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(buffer.getbuffer())
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Band cache write failed for {key}: {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            self.writes += 1
+            self.total_bytes += buffer.tell()
+            self._written_since_scan += buffer.tell()
+            rescan = not self._scanned or self._written_since_scan >= self.max_bytes * RESCAN_FRACTION
+        if rescan or self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(ENTRY_SUFFIX):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    yield entry.path, stat.st_size, stat.st_mtime
+
+    def evict(self):
+        """Remove least recently used entries until the directory is under budget"""
+        lock_file = open(os.path.join(self.directory, LOCK_FILE), "a")
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return  # another process is evicting
+            entries = list(self._entries())
+            total = sum(size for _, size, _ in entries)
+            evicted = 0
+            if total > self.max_bytes:
+                target = self.max_bytes * EVICT_TARGET_FRACTION
+                for path, size, _ in sorted(entries, key=lambda e: e[2]):
+                    if total <= target:
+                        break
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                    evicted += 1
+            with self._lock:
+                self.total_bytes = total
+                self.evictions += evicted
+                self._written_since_scan = 0
+                self._scanned = True
+        finally:
+            lock_file.close()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "directory": self.directory,
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+_band_cache: Optional[BandWindowCache] = None
+_band_cache_lock = threading.Lock()
+
+
+def get_band_cache() -> Optional[BandWindowCache]:
+    """Process-wide band window cache; None if NDVI_BAND_CACHE_DIR is empty"""
+    global _band_cache
+    if _band_cache is None:
+        directory = os.getenv("NDVI_BAND_CACHE_DIR", "./band_cache")
+        if not directory:
+            return None
+        with _band_cache_lock:
+            if _band_cache is None:
+                _band_cache = BandWindowCache(
+                    directory,
+                    max_bytes=int(os.getenv("NDVI_BAND_CACHE_MAX_BYTES", str(2 * 1024 ** 3))),
+                )
+    return _band_cache
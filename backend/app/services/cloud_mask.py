@@ -0,0 +1,107 @@
+"""
+Cloud masking for Sentinel 2 L2A scenes.
+
+The Scene Classification Layer (SCL, 20 m) labels every pixel; cloud, cloud
+shadow, cirrus, saturated and no-data pixels are dropped before NDVI is
+computed. The SCL window of a field is read first (it is a quarter of the
+size of a 10 m band) and scenes whose clear fraction inside the field is below
+NDVI_MIN_CLEAR_FRACTION are skipped before red/NIR are downloaded.
+
+If an item carries a cloud probability band (CLD, 0-100) and
+NDVI_MAX_CLOUD_PROBABILITY is set, pixels above it are dropped as well.
+"""
+import os
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from app.services.cog_reader import BandWindow, geometry_pixel_window, read_geometries_window, read_window_like
+
+# SCL classes
+SCL_NO_DATA = 0
+SCL_SATURATED_OR_DEFECTIVE = 1
+SCL_DARK_AREA = 2
+SCL_CLOUD_SHADOW = 3
+SCL_VEGETATION = 4
+SCL_NOT_VEGETATED = 5
+SCL_WATER = 6
+SCL_UNCLASSIFIED = 7
+SCL_CLOUD_MEDIUM_PROBABILITY = 8
+SCL_CLOUD_HIGH_PROBABILITY = 9
+SCL_THIN_CIRRUS = 10
+SCL_SNOW = 11
+
+DEFAULT_INVALID_SCL_CLASSES = (
+    SCL_NO_DATA, SCL_SATURATED_OR_DEFECTIVE, SCL_CLOUD_SHADOW,
+    SCL_CLOUD_MEDIUM_PROBABILITY, SCL_CLOUD_HIGH_PROBABILITY, SCL_THIN_CIRRUS,
+)
+
+SCL_ASSET = "SCL"
+CLOUD_PROBABILITY_ASSET = "CLD"
+
+SCL_MASKING_ENABLED = os.getenv("NDVI_SCL_MASKING", "true").lower() in ("1", "true", "yes")
+INVALID_SCL_CLASSES = tuple(
+    int(value) for value in
+    os.getenv("NDVI_INVALID_SCL_CLASSES", ",".join(str(c) for c in DEFAULT_INVALID_SCL_CLASSES)).split(",")
+    if value.strip()
+)
+MIN_CLEAR_FRACTION = float(os.getenv("NDVI_MIN_CLEAR_FRACTION", "0.5"))
+# 0 disables the cloud probability band
+MAX_CLOUD_PROBABILITY = float(os.getenv("NDVI_MAX_CLOUD_PROBABILITY", "0"))
+
+
+def mask_asset_urls(feature: Dict) -> Tuple[Optional[str], Optional[str]]:
+    """(SCL href, cloud probability href) of a STAC item; None where not available or disabled"""
+    if not SCL_MASKING_ENABLED:
+        return None, None
+    assets = feature.get("assets", {})
+    scl_url = assets.get(SCL_ASSET, {}).get("href")
+    cld_url = assets.get(CLOUD_PROBABILITY_ASSET, {}).get("href") if MAX_CLOUD_PROBABILITY > 0 else None
+    return scl_url, cld_url
+
+
+def invalid_scl_pixels(scl: BandWindow) -> np.ndarray:
+    """True for pixels with an invalid SCL class (or outside the SCL raster)"""
+    return np.ma.getmaskarray(scl.data) | np.isin(scl.data.filled(SCL_NO_DATA), INVALID_SCL_CLASSES)
+
+
+def clear_fractions(scl_url: str, geometries: Dict[int, Dict]) -> Dict[int, float]:
+    """
+    Fraction of each geometry's SCL pixels with a valid class, from one SCL read over
+    all geometries. Geometries outside the SCL raster get 0.
+    """
+    scl = read_geometries_window(scl_url, list(geometries.values()), choose_overview=False)
+    if scl is None:
+        return {key: 0.0 for key in geometries}
+    invalid = invalid_scl_pixels(scl)
+
+    result = {}
+    for key, geometry in geometries.items():
+        window = geometry_pixel_window(scl, geometry)
+        if window is None:
+            result[key] = 0.0
+            continue
+        pixels, outside = window
+        inside = ~outside
+        total = np.count_nonzero(inside)
+        result[key] = float(np.count_nonzero(inside & ~invalid[pixels]) / total) if total else 0.0
+    return result
+
+
+def invalid_pixels_like(like: BandWindow, scl_url: Optional[str],
+                        cld_url: Optional[str] = None) -> Optional[np.ndarray]:
+    """
+    Cloud/shadow/no-data mask (True = drop) on the grid of `like`, from SCL and the
+    optional cloud probability band. None if there is nothing to mask with.
+    """
+    invalid = None
+    if scl_url:
+        scl = read_window_like(scl_url, like)
+        if scl is not None:
+            invalid = invalid_scl_pixels(scl)
+    if cld_url:
+        cld = read_window_like(cld_url, like)
+        if cld is not None:
+            cloudy = np.ma.getmaskarray(cld.data) | (cld.data.filled(100) > MAX_CLOUD_PROBABILITY)
+            invalid = cloudy if invalid is None else invalid | cloudy
+    return invalid
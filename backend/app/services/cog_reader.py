@@ -0,0 +1,364 @@
+"""
+Windowed reads from Cloud-Optimized GeoTIFFs.
+
+Only the internal tiles overlapping a field are fetched: with GDAL's /vsicurl/
+driver that turns into a handful of HTTP range requests instead of a full
+100 MB band download. The same code path works on local COG files, which is
+what the fixtures use.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import rasterio
+from affine import Affine
+from rasterio.errors import WindowError
+from rasterio.features import geometry_mask
+from rasterio.warp import transform_geom
+from rasterio.enums import Resampling
+from rasterio.crs import CRS
+from rasterio.windows import Window, from_bounds
+
+from app.services.band_cache import get_band_cache, is_remote
+
+# GDAL settings for range-request access to remote COGs
+COG_ENV_OPTIONS = {
+    "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",  # don't list the container on open
+    "CPL_VSIL_CURL_ALLOWED_EXTENSIONS": ".tif,.TIF,.tiff",
+    "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+    "GDAL_HTTP_MULTIPLEX": "YES",
+    "GDAL_INGESTED_BYTES_AT_OPEN": "32768",  # header + tile index in one request
+    "VSI_CACHE": "TRUE",
+}
+
+# Don't coarsen below this many pixels across the field's shorter side
+DEFAULT_MIN_PIXELS = 16
+
+
+class BandWindow:
+    """Pixels of one band clipped to a field, plus where they came from"""
+
+    def __init__(self, data: np.ma.MaskedArray, transform, crs, window: Window, overview_level: Optional[int]):
+        self.data = data
+        self.transform = transform
+        self.crs = crs
+        self.window = window
+        self.overview_level = overview_level
+        # Pixels inside the field geometry (set by read_field_window)
+        self.geometry_pixels: Optional[int] = None
+
+    @property
+    def bytes_read(self) -> int:
+        """Decoded pixel bytes for the window (lower bound on transferred bytes)"""
+        return int(self.data.size * self.data.dtype.itemsize)
+
+
+def cog_env():
+    """rasterio.Env configured for COG range requests"""
+    return rasterio.Env(**COG_ENV_OPTIONS)
+
+
+def select_overview_level(src, window: Window, min_pixels: int = DEFAULT_MIN_PIXELS) -> Optional[int]:
+    """
+    Coarsest overview level at which the window still spans at least `min_pixels`
+    on both axes. None means full resolution.
+    """
+    level = None
+    for i, factor in enumerate(src.overviews(1)):
+        if window.width / factor >= min_pixels and window.height / factor >= min_pixels:
+            level = i
+        else:
+            break
+    return level
+
+
+def _bounds_window(src, bounds: Tuple[float, float, float, float]) -> Optional[Window]:
+    window = from_bounds(*bounds, transform=src.transform)
+    window = window.round_offsets(op="floor").round_lengths(op="ceil")
+    try:
+        window = window.intersection(Window(0, 0, src.width, src.height))
+    except WindowError:
+        return None
+    if window.width <= 0 or window.height <= 0:
+        return None
+    return window
+
+
+def _geometries_bounds(geometries: List[Dict]) -> Tuple[float, float, float, float]:
+    xs = [pt[0] for geometry in geometries for ring in geometry["coordinates"] for pt in ring]
+    ys = [pt[1] for geometry in geometries for ring in geometry["coordinates"] for pt in ring]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _cache_header(band: BandWindow) -> Dict:
+    window = band.window
+    return {
+        "transform": list(band.transform)[:6],
+        "crs": band.crs.to_string(),
+        "window": [window.col_off, window.row_off, window.width, window.height],
+        "overview_level": band.overview_level,
+    }
+
+
+def _cached_read(path: str, window_key: Tuple, read):
+    """
+    read() through the on-disk band cache for remote paths; `window_key` describes the
+    requested window. Cached empty results (None) are returned as well.
+    """
+    cache = get_band_cache() if is_remote(path) else None
+    if cache is None:
+        return read()
+    key = cache.key(path, *window_key)
+    found, data, header = cache.get(key)
+    if found:
+        if data is None:
+            return None
+        return BandWindow(data, Affine(*header["transform"]), CRS.from_user_input(header["crs"]),
+                          Window(*header["window"]), header["overview_level"])
+    band = read()
+    cache.put(key, None if band is None else band.data, None if band is None else _cache_header(band))
+    return band
+
+
+def read_geometries_window(path: str, geometries: List[Dict], min_pixels: int = DEFAULT_MIN_PIXELS,
+                           overview_level: Optional[int] = None,
+                           choose_overview: bool = True) -> Optional[BandWindow]:
+    """
+    Read band 1 of `path` over the bounding window of all `geometries` (GeoJSON, EPSG:4326).
+    Only nodata pixels are masked; use mask_to_geometry to clip to a single field.
+    Returns None if the geometries do not overlap the raster.
+    """
+    window_key = ("geometries", [round(v, 7) for v in _geometries_bounds(geometries)],
+                  min_pixels, overview_level, choose_overview)
+    return _cached_read(path, window_key, lambda: _read_geometries_window(
+        path, geometries, min_pixels, overview_level, choose_overview))
+
+
+def _read_geometries_window(path: str, geometries: List[Dict], min_pixels: int,
+                            overview_level: Optional[int], choose_overview: bool) -> Optional[BandWindow]:
+    with cog_env():
+        with rasterio.open(path) as src:
+            crs = src.crs
+            bounds = _geometries_bounds([transform_geom("EPSG:4326", crs, g) for g in geometries])
+            window = _bounds_window(src, bounds)
+            if window is None:
+                return None
+            if overview_level is None and choose_overview:
+                overview_level = select_overview_level(src, window, min_pixels)
+
+        open_kwargs = {"overview_level": overview_level} if overview_level is not None else {}
+        with rasterio.open(path, **open_kwargs) as src:
+            window = _bounds_window(src, bounds)
+            if window is None:
+                return None
+            data = src.read(1, window=window, masked=True)
+            transform = src.window_transform(window)
+
+    return BandWindow(data, transform, crs, window, overview_level)
+
+
+def read_window_like(path: str, like: BandWindow, resampling: Resampling = Resampling.nearest) -> Optional[BandWindow]:
+    """
+    Read band 1 of `path` resampled onto the pixel grid of `like` (e.g. a 20 m band onto
+    a 10 m window). Pixels outside the raster are masked. Returns None if `path` is in
+    another CRS.
+    """
+    window_key = ("like", like.crs.to_string(), [round(v, 6) for v in list(like.transform)[:6]],
+                  list(like.data.shape), like.overview_level, resampling.name)
+    return _cached_read(path, window_key, lambda: _read_window_like(path, like, resampling))
+
+
+def _read_window_like(path: str, like: BandWindow, resampling: Resampling) -> Optional[BandWindow]:
+    west, north = like.transform * (0, 0)
+    east, south = like.transform * (like.data.shape[1], like.data.shape[0])
+    with cog_env():
+        with rasterio.open(path) as src:
+            if src.crs != like.crs:
+                return None
+            window = from_bounds(west, south, east, north, transform=src.transform)
+            # Boundless reads go through a VRT; only needed when the window leaves the raster
+            inside = (window.col_off >= 0 and window.row_off >= 0
+                      and window.col_off + window.width <= src.width
+                      and window.row_off + window.height <= src.height)
+            data = src.read(1, window=window, out_shape=like.data.shape, resampling=resampling,
+                            boundless=not inside, masked=True)
+    return BandWindow(data, like.transform, like.crs, window, like.overview_level)
+
+
+def read_band_set(paths: Dict[str, str], geometries: List[Dict], reference: str,
+                  min_pixels: int = DEFAULT_MIN_PIXELS, choose_overview: bool = True,
+                  resampling: Resampling = Resampling.bilinear) -> Optional[Dict[str, BandWindow]]:
+    """
+    Read several bands over the bounding window of `geometries`, each exactly once, on the
+    pixel grid of `paths[reference]` (coarser bands, e.g. 20 m, are resampled onto it).
+    Returns None if the geometries do not overlap the reference raster.
+    """
+    reference_band = read_geometries_window(paths[reference], geometries, min_pixels=min_pixels,
+                                            choose_overview=choose_overview)
+    if reference_band is None:
+        return None
+    bands = {reference: reference_band}
+    for name, path in paths.items():
+        if name != reference:
+            band = read_window_like(path, reference_band, resampling=resampling)
+            if band is None:
+                return None
+            bands[name] = band
+    return bands
+
+
+class GeometryMaskCache:
+    """
+    LRU of rasterized geometry masks, keyed by geometry and pixel grid.
+
+    A mask covers only the geometry's own pixel-aligned window, positioned by its
+    absolute origin, so it is reused for any read window on the same grid
+    (same tile and overview level), whatever other fields that read covered.
+    """
+
+    def __init__(self, max_entries: int = 20000):
+        self.max_entries = max_entries
+        self._masks: "OrderedDict[Tuple, np.ndarray]" = OrderedDict()
+        self._projected: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lru_get(self, cache: OrderedDict, key):
+        with self._lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+
+    def _lru_put(self, cache: OrderedDict, key, value):
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.max_entries:
+                cache.popitem(last=False)
+
+    def projected(self, geometry: Dict, crs) -> Tuple[str, Dict]:
+        """(digest, geometry in `crs`), reprojecting once per geometry and CRS"""
+        digest = hashlib.sha1(json.dumps(geometry, sort_keys=True).encode("utf-8")).hexdigest()
+        key = (digest, crs.to_string())
+        geometry_crs = self._lru_get(self._projected, key)
+        if geometry_crs is None:
+            geometry_crs = transform_geom("EPSG:4326", crs, geometry)
+            self._lru_put(self._projected, key, geometry_crs)
+        return digest, geometry_crs
+
+    def window_mask(self, band: BandWindow, geometry: Dict) -> Optional[Tuple[Tuple[slice, slice], np.ndarray]]:
+        """
+        ((rows, cols) slices of the band's grid covering `geometry`, mask of that sub-window
+        with True outside the geometry); None if the geometry misses the band window
+        """
+        digest, geometry_crs = self.projected(geometry, band.crs)
+        height, width = band.data.shape
+
+        window = from_bounds(*_geometries_bounds([geometry_crs]), transform=band.transform)
+        window = window.round_offsets(op="floor").round_lengths(op="ceil")
+        row_off, col_off = int(window.row_off), int(window.col_off)
+        rows, cols = int(window.height) + 1, int(window.width) + 1
+        transform = band.transform * Affine.translation(col_off, row_off)
+
+        key = (digest, band.crs.to_string(), tuple(round(v, 6) for v in transform[:6]), rows, cols)
+        field_mask = self._lru_get(self._masks, key)
+        if field_mask is None:
+            self.misses += 1
+            field_mask = geometry_mask([geometry_crs], out_shape=(rows, cols), transform=transform, all_touched=True)
+            self._lru_put(self._masks, key, field_mask)
+        else:
+            self.hits += 1
+
+        # Clip the field window to the band window (either may extend past the other)
+        r0, c0 = max(row_off, 0), max(col_off, 0)
+        r1, c1 = min(row_off + rows, height), min(col_off + cols, width)
+        if r0 >= r1 or c0 >= c1:
+            return None
+        return (slice(r0, r1), slice(c0, c1)), field_mask[r0 - row_off:r1 - row_off, c0 - col_off:c1 - col_off]
+
+    def mask(self, band: BandWindow, geometry: Dict) -> np.ndarray:
+        """Boolean array on the band's grid, True for pixels outside `geometry`"""
+        outside = np.ones(band.data.shape, dtype=bool)
+        window = self.window_mask(band, geometry)
+        if window is not None:
+            outside[window[0]] = window[1]
+        return outside
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._masks),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+_mask_cache = GeometryMaskCache(int(os.getenv("NDVI_MASK_CACHE_MAX_ENTRIES", "20000")))
+
+
+def get_mask_cache() -> GeometryMaskCache:
+    return _mask_cache
+
+
+def geometry_pixel_mask(band: BandWindow, geometry: Dict) -> np.ndarray:
+    """Boolean array on the band's grid, True for pixels outside `geometry` (EPSG:4326)"""
+    return _mask_cache.mask(band, geometry)
+
+
+def geometry_pixel_window(band: BandWindow, geometry: Dict) -> Optional[Tuple[Tuple[slice, slice], np.ndarray]]:
+    """(slices of the band's grid around `geometry`, True-outside mask of that slice), or None"""
+    return _mask_cache.window_mask(band, geometry)
+
+
+def read_field_window(path: str, geometry: Dict, min_pixels: int = DEFAULT_MIN_PIXELS,
+                      overview_level: Optional[int] = None, choose_overview: bool = True) -> Optional[BandWindow]:
+    """
+    Read the pixels of band 1 of `path` that fall inside `geometry` (GeoJSON, EPSG:4326).
+    Pixels outside the geometry and nodata pixels are masked.
+    Returns None if the geometry does not overlap the raster.
+    """
+    band = read_geometries_window(path, [geometry], min_pixels=min_pixels,
+                                  overview_level=overview_level, choose_overview=choose_overview)
+    if band is None:
+        return None
+    outside = geometry_pixel_mask(band, geometry)
+    band.data.mask = np.ma.getmaskarray(band.data) | outside
+    band.geometry_pixels = int(outside.size - np.count_nonzero(outside))
+    return band
+
+
+def ndvi_statistics(ndvi: np.ma.MaskedArray, total_pixels: Optional[int] = None) -> Optional[Dict]:
+    """
+    Zonal statistics over the unmasked, finite NDVI pixels.
+    `total_pixels` is the number of pixels inside the field (defaults to the array size);
+    valid_fraction is valid_pixels / total_pixels.
+    """
+    values = ndvi.compressed()
+    values = values[np.isfinite(values)]
+    if values.size == 0:
+        return None
+    if total_pixels is None:
+        total_pixels = int(ndvi.size)
+    p10, p25, median, p75, p90 = np.percentile(values, [10, 25, 50, 75, 90])
+    return {
+        "mean": float(values.mean(dtype=np.float64)),
+        "std": float(values.std(dtype=np.float64)),
+        "median": float(median),
+        "p10": float(p10),
+        "p25": float(p25),
+        "p75": float(p75),
+        "p90": float(p90),
+        "min": float(values.min()),
+        "max": float(values.max()),
+        "valid_pixels": int(values.size),
+        "total_pixels": total_pixels,
+        "valid_fraction": float(values.size / total_pixels) if total_pixels else 0.0,
+    }
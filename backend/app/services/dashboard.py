@@ -0,0 +1,226 @@
+"""
+Dashboard summary: counts by status, average treatment improvement, fields
+below the NDVI threshold and recent activity for one farmer or agronomist.
+
+Everything comes from a few grouped aggregates over indexed columns, and the
+result is cached per (role, profile) for DASHBOARD_CACHE_TTL_SECONDS. Commits
+that touch fields, requests, treatments or NDVI rows (ORM flushes or bulk
+statements, caught with session events) clear the cache of this process;
+other workers' entries expire with the TTL.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import case, event, func, select
+from sqlalchemy.orm import Session
+
+from app import models
+from app.services.ndvi_store import latest_ndvi_id
+
+DASHBOARD_CACHE_TTL_SECONDS = float(os.getenv("DASHBOARD_CACHE_TTL_SECONDS", "30"))
+DASHBOARD_CACHE_MAX_ENTRIES = int(os.getenv("DASHBOARD_CACHE_MAX_ENTRIES", "10000"))
+# "poor" and below on the map legend (vector_tiles.health_class)
+DASHBOARD_NDVI_THRESHOLD = float(os.getenv("DASHBOARD_NDVI_THRESHOLD", "0.5"))
+RECENT_ACTIVITY = 10
+LOWEST_FIELDS = 5
+
+# Writes to these tables change some summary
+SUMMARY_TABLES = {
+    models.Field.__tablename__,
+    models.NDVIData.__tablename__,
+    models.TreatmentRequest.__tablename__,
+    models.Treatment.__tablename__,
+}
+
+
+class SummaryCache:
+    """Short-TTL cache of (role, profile id) -> summary, cleared by invalidate()"""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def get(self, key: Tuple[str, int]) -> Tuple[Optional[Dict], int]:
+        """(cached summary or None, generation to pass to put)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            return (entry[1] if entry else None), self._generation
+
+    def put(self, key: Tuple[str, int], summary: Dict, generation: int):
+        if self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            # A write committed while the summary was computed: it may already be stale
+            if generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, summary)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+_summary_cache = SummaryCache(DASHBOARD_CACHE_TTL_SECONDS, DASHBOARD_CACHE_MAX_ENTRIES)
+
+
+def invalidate_dashboard():
+    _summary_cache.invalidate()
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_flushed_writes(session, flush_context):
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(instance, "__tablename__", None)
+        if table in SUMMARY_TABLES:
+            session.info["dashboard_dirty"] = True
+            return
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_bulk_writes(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None and table.name in SUMMARY_TABLES:
+            orm_execute_state.session.info["dashboard_dirty"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session):
+    if session.info.pop("dashboard_dirty", False):
+        invalidate_dashboard()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop("dashboard_dirty", None)
+
+
+def _field_summary(connection, conditions: List, threshold: float) -> Dict:
+    latest = models.NDVIData.id == latest_ndvi_id(models.Field.id)
+    below = models.NDVIData.ndvi_value < threshold
+    total, with_ndvi, below_count = connection.execute(
+        select(
+            func.count(models.Field.id),
+            func.count(models.NDVIData.id),
+            func.count(case((below, 1))),
+        ).select_from(models.Field).outerjoin(models.NDVIData, latest).where(*conditions)
+    ).one()
+    lowest = connection.execute(
+        select(models.Field.id, models.Field.name, models.Field.crop_type, models.NDVIData.ndvi_value,
+               models.NDVIData.date)
+        .join(models.NDVIData, latest).where(below, *conditions)
+        .order_by(models.NDVIData.ndvi_value, models.Field.id).limit(LOWEST_FIELDS)
+    ).all()
+    return {
+        "total": total,
+        "with_ndvi": with_ndvi,
+        "below_threshold": below_count,
+        "threshold": threshold,
+        "lowest": [
+            {"field_id": row.id, "name": row.name, "crop_type": row.crop_type,
+             "ndvi": round(row.ndvi_value, 3), "date": row.date.isoformat() if row.date else None}
+            for row in lowest
+        ],
+    }
+
+
+def _by_status(rows, statuses) -> Dict[str, int]:
+    counts = {status.value: 0 for status in statuses}
+    for row in rows:
+        if row.status is not None:
+            counts[row.status.value] = row.count
+    return counts
+
+
+def _activity(rows, kind: str) -> List[Dict]:
+    return [
+        {"type": kind, "id": row.id, "status": row.status.value if row.status else None,
+         "field_id": row.field_id, "field_name": row.name, "at": row.created_at}
+        for row in rows
+    ]
+
+
+def build_summary(db: Session, role: models.UserRole, profile_id: int,
+                  threshold: float = DASHBOARD_NDVI_THRESHOLD) -> Dict:
+    """Summary of a farmer's fields or of an agronomist's requests (agronomists see every field)"""
+    Request, Treatment = models.TreatmentRequest, models.Treatment
+    if role == models.UserRole.FARMER:
+        field_conditions = [models.Field.farmer_id == profile_id]
+        request_scope = Request.field_id.in_(select(models.Field.id).where(*field_conditions))
+    else:
+        field_conditions = []
+        request_scope = Request.agronomist_id == profile_id
+
+    # Core rows through the session's connection, as in ndvi_analytics
+    connection = db.connection()
+    fields = _field_summary(connection, field_conditions, threshold)
+    requests = connection.execute(
+        select(Request.status, func.count(Request.id).label("count")).where(request_scope).group_by(Request.status)
+    ).all()
+    treatments = connection.execute(
+        select(
+            Treatment.status,
+            func.count(Treatment.id).label("count"),
+            func.sum(Treatment.improvement_percentage).label("improvement_sum"),
+            func.count(Treatment.improvement_percentage).label("improvement_count"),
+        ).join(Request, Treatment.request_id == Request.id).where(request_scope).group_by(Treatment.status)
+    ).all()
+    improvement_count = sum(row.improvement_count for row in treatments)
+    improvement_sum = sum(row.improvement_sum or 0.0 for row in treatments)
+
+    recent_requests = connection.execute(
+        select(Request.id, Request.status, Request.field_id, models.Field.name, Request.created_at)
+        .join(models.Field, Request.field_id == models.Field.id).where(request_scope)
+        .order_by(Request.created_at.desc(), Request.id.desc()).limit(RECENT_ACTIVITY)
+    ).all()
+    updated_at = func.coalesce(Treatment.completed_date, Treatment.created_at)
+    recent_treatments = connection.execute(
+        select(Treatment.id, Treatment.status, Request.field_id, models.Field.name, updated_at.label("created_at"))
+        .join(Request, Treatment.request_id == Request.id)
+        .join(models.Field, Request.field_id == models.Field.id).where(request_scope)
+        .order_by(updated_at.desc(), Treatment.id.desc()).limit(RECENT_ACTIVITY)
+    ).all()
+    activity = sorted(
+        _activity(recent_requests, "request") + _activity(recent_treatments, "treatment"),
+        key=lambda item: (item["at"] is not None, item["at"] or datetime.min), reverse=True
+    )[:RECENT_ACTIVITY]
+    for item in activity:
+        item["at"] = item["at"].isoformat() if item["at"] else None
+
+    return {
+        "role": role.value,
+        "fields": fields,
+        "requests": {"total": sum(row.count for row in requests), "by_status": _by_status(requests, models.RequestStatus)},
+        "treatments": {
+            "total": sum(row.count for row in treatments),
+            "by_status": _by_status(treatments, models.TreatmentStatus),
+            "average_improvement_percentage":
+                round(improvement_sum / improvement_count, 2) if improvement_count else None,
+        },
+        "recent_activity": activity,
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def dashboard_summary(db: Session, role: models.UserRole, profile_id: int) -> Dict:
+    """build_summary, served from the per-profile cache when fresh"""
+    key = (role.value, profile_id)
+    summary, generation = _summary_cache.get(key)
+    if summary is None:
+        summary = build_summary(db, role, profile_id)
+        _summary_cache.put(key, summary, generation)
+    return summary
@@ -0,0 +1,72 @@
+import json
+from typing import Dict, List, Optional, Tuple
+
+# Half-size (degrees) of the box used when a field has no polygon (~100 m)
+DEFAULT_POINT_BUFFER = 0.001
+
+
+def _close_ring(ring: List[List[float]]) -> List[List[float]]:
+    if ring and ring[0] != ring[-1]:
+        ring = ring + [ring[0]]
+    return ring
+
+
+def point_box(lat: float, lon: float, buffer_deg: float = DEFAULT_POINT_BUFFER) -> Dict:
+    """Square GeoJSON polygon (lon/lat order) around a point"""
+    return {
+        "type": "Polygon",
+        "coordinates": [[
+            [lon - buffer_deg, lat - buffer_deg],
+            [lon + buffer_deg, lat - buffer_deg],
+            [lon + buffer_deg, lat + buffer_deg],
+            [lon - buffer_deg, lat + buffer_deg],
+            [lon - buffer_deg, lat - buffer_deg],
+        ]]
+    }
+
+
+def parse_polygon_coordinates(polygon_coordinates: Optional[str]) -> Optional[Dict]:
+    """
+    Parse Field.polygon_coordinates into a GeoJSON Polygon.
+    The frontend stores Leaflet positions, i.e. [[lat, lon], ...] or a list of such rings.
+    Returns None if the value is missing or not a usable polygon.
+    """
+    if not polygon_coordinates:
+        return None
+    try:
+        coords = json.loads(polygon_coordinates)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(coords, list) or not coords:
+        return None
+
+    # A single ring is [[lat, lon], ...]; multiple rings are [[[lat, lon], ...], ...]
+    rings = coords if isinstance(coords[0], list) and coords[0] and isinstance(coords[0][0], list) else [coords]
+
+    geojson_rings = []
+    try:
+        for ring in rings:
+            geojson_ring = [[float(pt[1]), float(pt[0])] for pt in ring]
+            geojson_ring = _close_ring(geojson_ring)
+            if len(geojson_ring) < 4:
+                return None
+            geojson_rings.append(geojson_ring)
+    except (TypeError, ValueError, IndexError):
+        return None
+
+    return {"type": "Polygon", "coordinates": geojson_rings}
+
+
+def field_geometry(field, buffer_deg: float = DEFAULT_POINT_BUFFER) -> Dict:
+    """GeoJSON geometry (EPSG:4326) of a field: its polygon if stored, else a box around its point"""
+    geometry = parse_polygon_coordinates(getattr(field, "polygon_coordinates", None))
+    if geometry is None:
+        geometry = point_box(field.latitude, field.longitude, buffer_deg)
+    return geometry
+
+
+def geometry_bounds(geometry: Dict) -> Tuple[float, float, float, float]:
+    """(west, south, east, north) of a GeoJSON Polygon"""
+    xs = [pt[0] for ring in geometry["coordinates"] for pt in ring]
+    ys = [pt[1] for ring in geometry["coordinates"] for pt in ring]
+    return min(xs), min(ys), max(xs), max(ys)
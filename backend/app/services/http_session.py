@@ -0,0 +1,28 @@
+import os
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+def build_session(pool_size: int = None, retries: int = None, backoff_factor: float = None) -> requests.Session:
+    """
+    requests.Session with a bounded keep-alive connection pool per host and
+    retry with exponential backoff on connection errors, 429 and 5xx responses.
+    """
+    pool_size = pool_size or int(os.getenv("NDVI_HTTP_POOL_SIZE", "20"))
+    retries = retries if retries is not None else int(os.getenv("NDVI_HTTP_RETRIES", "3"))
+    backoff_factor = backoff_factor if backoff_factor is not None else float(os.getenv("NDVI_HTTP_BACKOFF", "0.5"))
+
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "POST"}),  # STAC search is a read-only POST
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry, pool_block=True)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
@@ -0,0 +1,171 @@
+"""
+Fleet-wide NDVI health analytics.
+
+The latest NDVI of every field in scope (one index seek per field) and each
+field's history aggregates (count, sum, sum of squares over the history
+window) come back from two queries, one row per field. Severity and anomaly scores are then
+computed on whole columns with pandas/NumPy:
+
+- own z-score: latest NDVI against the field's own history (latest excluded)
+- peer z-score: latest NDVI against the latest NDVI of fields with the same crop
+
+Only drops count as anomalies (a field greening up faster than its peers is
+not a problem), so the anomaly score is the larger of the two negated z-scores.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app import models
+from app.services.ndvi_archive import ARCHIVE_AFTER_DAYS, read_archive
+from app.services.ndvi_store import latest_ndvi_id
+
+# Same NDVI thresholds as the map legend (vector_tiles.health_class)
+HIGH_SEVERITY_NDVI = 0.3
+MEDIUM_SEVERITY_NDVI = 0.5
+HIGH_SEVERITY_Z = 3.0
+MEDIUM_SEVERITY_Z = 2.0
+# z-scores need a minimum sample to mean anything
+MIN_HISTORY = 3
+MIN_PEERS = 5
+MIN_STD = 1e-6
+
+SEVERITIES = ("high", "medium", "low", "no_data")
+ANOMALY_COLUMNS = ["field_id", "name", "crop_type", "ndvi", "date", "own_z", "peer_z", "anomaly_score", "severity"]
+
+
+def load_field_frame(db: Session, farmer_id: Optional[int] = None, crop_type: Optional[str] = None,
+                     history_days: int = 365, now: Optional[datetime] = None) -> pd.DataFrame:
+    """
+    One row per field in scope: field_id, name, crop_type, ndvi, date (latest) and
+    hist_count / hist_sum / hist_sumsq over the last `history_days` (latest included).
+    """
+    conditions = []
+    if farmer_id is not None:
+        conditions.append(models.Field.farmer_id == farmer_id)
+    if crop_type is not None:
+        conditions.append(models.Field.crop_type == crop_type)
+    scope = select(models.Field.id).where(*conditions)
+
+    # Core rows through the session's connection: no ORM row processing for 50k+ rows
+    connection = db.connection()
+    latest = connection.execute(
+        select(
+            models.Field.id,
+            models.Field.name,
+            models.Field.crop_type,
+            models.NDVIData.ndvi_value,
+            models.NDVIData.date,
+        ).outerjoin(
+            models.NDVIData, models.NDVIData.id == latest_ndvi_id(models.Field.id)
+        ).where(*conditions)
+    ).all()
+    frame = pd.DataFrame(latest, columns=["field_id", "name", "crop_type", "ndvi", "date"])
+    frame["ndvi"] = frame["ndvi"].astype(float)
+
+    since = (now or datetime.now(timezone.utc)) - timedelta(days=history_days)
+    history = connection.execute(
+        select(
+            models.NDVIData.field_id,
+            func.count(models.NDVIData.ndvi_value),
+            func.sum(models.NDVIData.ndvi_value),
+            func.sum(models.NDVIData.ndvi_value * models.NDVIData.ndvi_value),
+        ).where(
+            models.NDVIData.field_id.in_(scope),
+            models.NDVIData.date >= since
+        ).group_by(models.NDVIData.field_id)
+    ).all()
+    history = pd.DataFrame(history, columns=["field_id", "hist_count", "hist_sum", "hist_sumsq"])
+
+    # Windows reaching past the archive cutoff also aggregate archived observations
+    if history_days > ARCHIVE_AFTER_DAYS:
+        archived = read_archive(["field_id", "ndvi_value"], frame["field_id"].tolist(), since.date())
+        if archived is not None and archived.num_rows:
+            values = archived.to_pandas()
+            values["sq"] = values["ndvi_value"] ** 2
+            cold = values.groupby("field_id").agg(
+                hist_count=("ndvi_value", "count"), hist_sum=("ndvi_value", "sum"), hist_sumsq=("sq", "sum")
+            ).reset_index()
+            history = pd.concat([history, cold]).groupby("field_id", as_index=False).sum()
+
+    frame = frame.merge(history, on="field_id", how="left")
+    frame[["hist_count", "hist_sum", "hist_sumsq"]] = frame[["hist_count", "hist_sum", "hist_sumsq"]].fillna(0)
+    return frame
+
+
+def score_fields(frame: pd.DataFrame) -> pd.DataFrame:
+    """Add own_z, peer_z, anomaly_score and severity columns (vectorized over all fields)"""
+    ndvi = frame["ndvi"].to_numpy(dtype=float)
+    has_ndvi = ~np.isnan(ndvi)
+
+    # Field's own history without the latest observation
+    count = frame["hist_count"].to_numpy(dtype=float) - has_ndvi
+    total = frame["hist_sum"].to_numpy(dtype=float) - np.where(has_ndvi, ndvi, 0.0)
+    total_sq = frame["hist_sumsq"].to_numpy(dtype=float) - np.where(has_ndvi, ndvi * ndvi, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+        std = np.sqrt(np.maximum(total_sq / count - mean * mean, 0.0))
+        own_z = np.where((count >= MIN_HISTORY) & (std > MIN_STD), (ndvi - mean) / std, np.nan)
+
+    crops = frame["crop_type"].fillna("")
+    peers = frame.groupby(crops)["ndvi"]
+    peer_count = peers.transform("count").to_numpy(dtype=float)
+    peer_mean = peers.transform("mean").to_numpy(dtype=float)
+    peer_std = peers.transform("std").to_numpy(dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        peer_z = np.where((peer_count >= MIN_PEERS) & (peer_std > MIN_STD) & (crops != "").to_numpy(),
+                          (ndvi - peer_mean) / peer_std, np.nan)
+
+    score = np.fmax(-own_z, -peer_z)
+    frame["own_z"] = own_z
+    frame["peer_z"] = peer_z
+    frame["anomaly_score"] = score
+    frame["severity"] = np.select(
+        [~has_ndvi,
+         (ndvi < HIGH_SEVERITY_NDVI) | (score >= HIGH_SEVERITY_Z),
+         (ndvi < MEDIUM_SEVERITY_NDVI) | (score >= MEDIUM_SEVERITY_Z)],
+        ["no_data", "high", "medium"],
+        default="low",
+    )
+    return frame
+
+
+def _records(frame: pd.DataFrame) -> List[Dict]:
+    frame = frame[ANOMALY_COLUMNS].copy()
+    frame["date"] = frame["date"].map(lambda value: value.isoformat() if pd.notna(value) else None)
+    for column in ("ndvi", "own_z", "peer_z", "anomaly_score"):
+        frame[column] = frame[column].round(3)
+    frame = frame.astype(object).where(frame.notna(), None)
+    return frame.to_dict(orient="records")
+
+
+def fleet_analytics(db: Session, farmer_id: Optional[int] = None, crop_type: Optional[str] = None,
+                    history_days: int = 365, limit: int = 50) -> Dict:
+    """Severity counts, per-crop NDVI and ranked anomaly lists for the fields in scope"""
+    frame = score_fields(load_field_frame(db, farmer_id, crop_type, history_days))
+    with_data = frame[frame["severity"] != "no_data"]
+
+    crops = with_data.groupby(with_data["crop_type"].fillna("unknown"))["ndvi"].agg(["count", "mean", "std"])
+    severity_counts = frame["severity"].value_counts()
+    return {
+        "fields": int(len(frame)),
+        "with_data": int(len(with_data)),
+        "severity_counts": {severity: int(severity_counts.get(severity, 0)) for severity in SEVERITIES},
+        "crops": [
+            {"crop_type": crop, "fields": int(row["count"]), "mean_ndvi": round(float(row["mean"]), 3),
+             "std_ndvi": None if pd.isna(row["std"]) else round(float(row["std"]), 3)}
+            for crop, row in crops.iterrows()
+        ],
+        "anomalies": {
+            "own_history": _records(with_data[with_data["own_z"] < 0].nsmallest(limit, "own_z")),
+            "peers": _records(with_data[with_data["peer_z"] < 0].nsmallest(limit, "peer_z")),
+            "combined": _records(
+                with_data[with_data["anomaly_score"] >= MEDIUM_SEVERITY_Z].nlargest(limit, "anomaly_score")
+            ),
+            "lowest_ndvi": _records(with_data.nsmallest(limit, "ndvi")),
+        },
+    }
@@ -0,0 +1,218 @@
+"""
+Parquet archive of historical NDVI observations.
+
+NDVIData rows older than NDVI_ARCHIVE_AFTER_DAYS (except each field's latest
+row, which the map and tiles read) are moved out of the database into Parquet
+files under NDVI_ARCHIVE_DIR, hive-partitioned by year, month and field bucket
+(field_id % NDVI_ARCHIVE_FIELD_BUCKETS):
+
+    ndvi_archive/year=2023/month=7/field_bucket=12/<run>-0.parquet
+
+One row per acquisition; the spectral index values of the acquisition become
+columns (evi_value, evi_std, ...). Readers filter on the partition columns
+(whole directories are skipped) and on field_id/date (row groups are skipped
+from Parquet statistics), so a field's history costs a few small reads however
+large the archive grows.
+
+Archive runs write to _staging/<run> first, delete the rows from the database,
+then move the files into place, so a row is never in both tiers. A staged run
+left behind by a crash is published if its rows are gone from the database and
+dropped otherwise.
+"""
+import os
+import shutil
+import uuid
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+from sqlalchemy import func
+from sqlalchemy.orm import Session, selectinload
+
+from app import models
+from app.services.ndvi_store import ZONAL_STATS_COLUMNS
+from app.services.spectral_indices import INDICES
+
+ARCHIVE_DIR = os.getenv("NDVI_ARCHIVE_DIR", "./ndvi_archive")
+FIELD_BUCKETS = int(os.getenv("NDVI_ARCHIVE_FIELD_BUCKETS", "64"))
+ARCHIVE_AFTER_DAYS = int(os.getenv("NDVI_ARCHIVE_AFTER_DAYS", "365"))
+STAGING_DIR = "_staging"  # skipped by dataset discovery (leading underscore)
+
+INDEX_STAT_COLUMNS = ("value", "std", "median", "p10", "p90", "valid_pixels", "valid_fraction")
+
+PARTITIONING = ds.partitioning(
+    pa.schema([("year", pa.int16()), ("month", pa.int8()), ("field_bucket", pa.int16())]), flavor="hive"
+)
+
+
+def _column_type(name: str) -> pa.DataType:
+    return pa.int64() if name.endswith("valid_pixels") else pa.float64()
+
+
+def index_column(index: str, stat: str = "value") -> str:
+    return f"{index}_{stat}"
+
+
+def archive_schema() -> pa.Schema:
+    """Columns of archived rows; new spectral indices simply add columns (null in older files)"""
+    columns = [
+        ("id", pa.int64()),
+        ("field_id", pa.int64()),
+        ("date", pa.timestamp("us")),  # UTC
+        ("ndvi_value", pa.float64()),
+        ("image_url", pa.string()),
+        ("ndvi_metadata", pa.string()),
+        ("source", pa.string()),
+        ("is_real_data", pa.bool_()),
+    ]
+    columns += [(column, _column_type(column)) for column in ZONAL_STATS_COLUMNS.values()]
+    columns += [
+        (index_column(name, stat), _column_type(stat))
+        for name in INDICES if name != "ndvi" for stat in INDEX_STAT_COLUMNS
+    ]
+    return pa.schema(columns)
+
+
+def _utc_naive(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _dataset_schema() -> pa.Schema:
+    schema = archive_schema()
+    for name in PARTITIONING.schema.names:
+        schema = schema.append(PARTITIONING.schema.field(name))
+    return schema
+
+
+def _archive_table(rows: List[models.NDVIData]) -> pa.Table:
+    records = []
+    for row in rows:
+        record = {name: getattr(row, name) for name in ("id", "field_id", "ndvi_value", "image_url", "ndvi_metadata",
+                                                        "source", "is_real_data", *ZONAL_STATS_COLUMNS.values())}
+        record["date"] = _utc_naive(row.date)
+        for value in row.index_values:
+            for stat in INDEX_STAT_COLUMNS:
+                record[index_column(value.index_name, stat)] = getattr(value, stat)
+        record["year"] = record["date"].year
+        record["month"] = record["date"].month
+        record["field_bucket"] = row.field_id % FIELD_BUCKETS
+        records.append(record)
+    # Columns of indices no longer registered are dropped by the schema
+    return pa.Table.from_pylist(records, schema=_dataset_schema())
+
+
+def _archivable_ids(db: Session, before: datetime, limit: int) -> List[int]:
+    """Ids of rows older than `before`, leaving every field's latest row in the database"""
+    ranked = db.query(
+        models.NDVIData.id.label("id"),
+        models.NDVIData.date.label("date"),
+        func.row_number().over(
+            partition_by=models.NDVIData.field_id,
+            order_by=(models.NDVIData.date.desc(), models.NDVIData.id.desc())
+        ).label("rank")
+    ).subquery()
+    rows = db.query(ranked.c.id).filter(ranked.c.date < before, ranked.c.rank > 1) \
+        .order_by(ranked.c.id).limit(limit).all()
+    return [row.id for row in rows]
+
+
+def _publish(run_dir: str, archive_dir: str):
+    """Move a staged run's files into the archive tree"""
+    for root, _, files in os.walk(run_dir):
+        target_dir = os.path.join(archive_dir, os.path.relpath(root, run_dir))
+        os.makedirs(target_dir, exist_ok=True)
+        for name in files:
+            os.replace(os.path.join(root, name), os.path.join(target_dir, name))
+    shutil.rmtree(run_dir, ignore_errors=True)
+
+
+def recover_staging(db: Session, archive_dir: str = ARCHIVE_DIR) -> int:
+    """Finish or drop staged runs left by an interrupted archive run; returns runs published"""
+    staging = os.path.join(archive_dir, STAGING_DIR)
+    if not os.path.isdir(staging):
+        return 0
+    published = 0
+    for run in os.listdir(staging):
+        run_dir = os.path.join(staging, run)
+        ids = ds.dataset(run_dir, format="parquet", partitioning=PARTITIONING).to_table(columns=["id"])
+        ids = ids.column("id").to_pylist()
+        # Rows are deleted in one transaction, so one id tells whether the run was committed
+        still_hot = ids and db.query(models.NDVIData.id).filter(models.NDVIData.id == ids[0]).first()
+        if still_hot:
+            shutil.rmtree(run_dir, ignore_errors=True)
+        else:
+            _publish(run_dir, archive_dir)
+            published += 1
+    return published
+
+
+def archive_ndvi_data(db: Session, before: Optional[datetime] = None, batch_size: int = 5000,
+                      archive_dir: str = ARCHIVE_DIR) -> Dict:
+    """
+    Move NDVIData rows (and their spectral index values) dated before `before` (default
+    NDVI_ARCHIVE_AFTER_DAYS ago) from the database into the Parquet archive.
+    """
+    before = before or datetime.now(timezone.utc) - timedelta(days=ARCHIVE_AFTER_DAYS)
+    summary = {"before": before.isoformat(), "rows": 0, "files": 0, "recovered_runs": recover_staging(db, archive_dir)}
+
+    while True:
+        ids = _archivable_ids(db, before, batch_size)
+        if not ids:
+            break
+        rows = db.query(models.NDVIData).options(selectinload(models.NDVIData.index_values)) \
+            .filter(models.NDVIData.id.in_(ids)).order_by(models.NDVIData.id).all()
+
+        run = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        run_dir = os.path.join(archive_dir, STAGING_DIR, run)
+        written = []
+        ds.write_dataset(
+            _archive_table(rows), run_dir, format="parquet", partitioning=PARTITIONING,
+            basename_template=f"{run}-{{i}}.parquet", existing_data_behavior="overwrite_or_ignore",
+            file_visitor=lambda f: written.append(f.path),
+        )
+
+        db.query(models.SpectralIndexValue).filter(models.SpectralIndexValue.ndvi_data_id.in_(ids)) \
+            .delete(synchronize_session=False)
+        db.query(models.NDVIData).filter(models.NDVIData.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        db.expunge_all()
+        _publish(run_dir, archive_dir)
+
+        summary["rows"] += len(ids)
+        summary["files"] += len(written)
+    return summary
+
+
+def archive_filter(field_ids: Optional[Iterable[int]] = None, start: Optional[date] = None,
+                   end: Optional[date] = None) -> Optional[ds.Expression]:
+    """Partition + row filter for fields and an inclusive day range"""
+    conditions = []
+    if field_ids is not None:
+        field_ids = sorted(set(field_ids))
+        conditions.append(ds.field("field_bucket").isin(sorted({i % FIELD_BUCKETS for i in field_ids})))
+        conditions.append(ds.field("field_id").isin(field_ids))
+    if start is not None:
+        conditions.append(ds.field("year") >= start.year)
+        conditions.append(ds.field("date") >= pa.scalar(datetime.combine(start, time.min), pa.timestamp("us")))
+    if end is not None:
+        conditions.append(ds.field("year") <= end.year)
+        conditions.append(ds.field("date") < pa.scalar(datetime.combine(end + timedelta(days=1), time.min),
+                                                      pa.timestamp("us")))
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def read_archive(columns: List[str], field_ids: Optional[Iterable[int]] = None, start: Optional[date] = None,
+                 end: Optional[date] = None, archive_dir: str = ARCHIVE_DIR) -> Optional[pa.Table]:
+    """Archived rows (only `columns`) of `field_ids` between `start` and `end`; None if the archive is empty"""
+    if not os.path.isdir(archive_dir):
+        return None
+    dataset = ds.dataset(archive_dir, format="parquet", partitioning=PARTITIONING, schema=_dataset_schema())
+    if not dataset.files:
+        return None
+    return dataset.to_table(columns=columns, filter=archive_filter(field_ids, start, end))
@@ -0,0 +1,252 @@
+"""
+asyncio-native NDVI acquisition: STAC search -> URL signing -> concurrent
+band window reads -> NDVI (and other index) statistics.
+
+The pipeline runs on its own event loop thread, so the same connection pool
+and concurrency limits serve async endpoints (await `run`) and sync callers
+(`run_sync`, used by NDVIService.fetch_ndvi_for_field). Each provider has its
+own semaphore; blocking work (GDAL reads, SciHub) goes to a bounded executor.
+Cancelling the awaiting task cancels the work on the pipeline loop.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Coroutine, Dict, List, Optional
+
+import httpx
+from rasterio.enums import Resampling
+from shapely.geometry import Point, shape
+
+from app.services.cloud_mask import MIN_CLEAR_FRACTION, clear_fractions, invalid_pixels_like, mask_asset_urls
+from app.services.cog_reader import read_geometries_window, read_window_like
+from app.services.ndvi_kernel import l2a_reflectance_offset
+from app.services.spectral_indices import DEFAULT_INDICES, RED
+from app.services.geometry import field_geometry
+from app.services.stac_cache import get_stac_cache, search_cache_key
+
+
+class AsyncNDVIPipeline:
+    def __init__(self, service, stac_concurrency: int = None, scihub_concurrency: int = None,
+                 read_concurrency: int = None):
+        self.service = service
+        self.stac_concurrency = stac_concurrency or int(os.getenv("NDVI_STAC_CONCURRENCY", "8"))
+        self.scihub_concurrency = scihub_concurrency or int(os.getenv("NDVI_SCIHUB_CONCURRENCY", "2"))
+        self.read_concurrency = read_concurrency or int(os.getenv("NDVI_READ_CONCURRENCY", "16"))
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        # Two band reads per field in flight
+        self._executor = ThreadPoolExecutor(max_workers=self.read_concurrency * 2, thread_name_prefix="ndvi-read")
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="ndvi-pipeline", daemon=True)
+                thread.start()
+                asyncio.run_coroutine_threadsafe(self._setup(), loop).result()
+                self._loop, self._thread = loop, thread
+        return self._loop
+
+    async def _setup(self):
+        pool_size = int(os.getenv("NDVI_HTTP_POOL_SIZE", "20"))
+        self._client = httpx.AsyncClient(
+            timeout=30,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            transport=httpx.AsyncHTTPTransport(retries=int(os.getenv("NDVI_HTTP_RETRIES", "3"))),
+        )
+        self._semaphores = {
+            "planetary_computer": asyncio.Semaphore(self.stac_concurrency),
+            "scihub": asyncio.Semaphore(self.scihub_concurrency),
+            "cog": asyncio.Semaphore(self.read_concurrency),
+        }
+
+    def submit(self, coro: Coroutine) -> Future:
+        """Schedule a coroutine on the pipeline loop"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_started())
+
+    async def run(self, coro: Coroutine):
+        """Await a pipeline coroutine from any event loop; cancelling the caller cancels the work"""
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def run_sync(self, coro: Coroutine):
+        """Run a pipeline coroutine from synchronous code"""
+        return self.submit(coro).result()
+
+    def close(self):
+        with self._start_lock:
+            if self._loop is not None:
+                asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._thread.join()
+                self._loop.close()
+                self._loop = None
+        self._executor.shutdown(wait=False)
+
+    async def _blocking(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def search_items(self, bbox: List[float], date: datetime,
+                           max_cloud_cover: float = 30, limit: int = 100) -> List[Dict]:
+        """Async counterpart of NDVIService.search_planetary_computer_items (same cache)"""
+        from app.services.ndvi_service import PLANETARY_COMPUTER_STAC_URL, _slim_stac_item
+
+        search_params = self.service._stac_search_params(bbox, date, max_cloud_cover, limit)
+        cache = get_stac_cache()
+        cache_key = search_cache_key(search_params)
+        features = cache.get(cache_key)
+
+        if features is None:
+            try:
+                async with self._semaphores["planetary_computer"]:
+                    response = await self._client.post(f"{PLANETARY_COMPUTER_STAC_URL}/search", json=search_params)
+                response.raise_for_status()
+                features = [_slim_stac_item(f) for f in response.json().get("features", [])]
+            except httpx.HTTPError as e:
+                print(f"Error searching Planetary Computer: {e}")
+                return []
+            cache.put(cache_key, features)
+
+        return self.service._sort_items(features, date)
+
+    async def sign(self, url: str) -> str:
+        """Async counterpart of NDVIService.sign_planetary_computer_url (same token cache)"""
+        from app.services.ndvi_service import _append_token, _sas_container
+
+        try:
+            key = _sas_container(url)
+            if key is None:
+                return url
+            token = self.service._cached_sas_token(key)
+            if token is None:
+                token_url, headers = self.service._sas_token_request(key)
+                async with self._semaphores["planetary_computer"]:
+                    response = await self._client.get(token_url, headers=headers)
+                response.raise_for_status()
+                token = self.service._store_sas_token(key, response.json())
+            return _append_token(url, token)
+        except Exception as e:
+            print(f"Error signing URL: {e}")
+            return url
+
+    async def clear_fraction(self, scl_url: str, geometry: Dict) -> Optional[float]:
+        """Cloud free fraction of the field from the SCL band; None if it could not be read"""
+        try:
+            async with self._semaphores["cog"]:
+                return (await self._blocking(clear_fractions, scl_url, {0: geometry}))[0]
+        except Exception as e:
+            print(f"Error reading SCL band: {e}")
+            return None
+
+    async def read_stats(self, band_urls: Dict[str, str], geometry: Dict, indices: List[str],
+                         scl_url: Optional[str] = None, cld_url: Optional[str] = None,
+                         offset: float = 0.0) -> Optional[Dict]:
+        """
+        Read the red window (choosing the overview), then every other band concurrently on
+        its grid, and compute index statistics (cloudy pixels masked)
+        """
+        others = [band for band in band_urls if band != RED]
+        try:
+            async with self._semaphores["cog"]:
+                reference = await self._blocking(read_geometries_window, band_urls[RED], [geometry])
+                if reference is None:
+                    print("Field does not overlap the Sentinel 2 tile")
+                    return None
+                reads = [self._blocking(read_window_like, band_urls[band], reference, Resampling.bilinear)
+                         for band in others]
+                if scl_url or cld_url:
+                    reads.append(self._blocking(invalid_pixels_like, reference, scl_url, cld_url))
+                results = await asyncio.gather(*reads)
+        except Exception as e:
+            print(f"Error calculating NDVI from URLs: {e}")
+            return None
+        windows = results[:len(others)]
+        invalid = results[len(others)] if len(results) > len(others) else None
+        if any(window is None for window in windows):
+            print("Bands are not on the same grid")
+            return None
+        bands = {RED: reference, **dict(zip(others, windows))}
+        return self.service.band_set_stats(bands, {0: geometry}, indices, invalid, offset).get(0)
+
+    async def fetch_ndvi_for_field(self, field, date: Optional[datetime] = None,
+                                   indices: Optional[List[str]] = None) -> Dict:
+        """
+        Fetch and calculate NDVI (and the other `indices`) for a field; same sources,
+        fallbacks and record format as the sync NDVIService.fetch_ndvi_for_field
+        """
+        from app.services.ndvi_service import MAX_SCENE_CANDIDATES, _index_band_urls
+
+        lat = field.latitude
+        lon = field.longitude
+        geometry = field_geometry(field)
+
+        if not date:
+            date = datetime.now(timezone.utc) - timedelta(days=7)
+        elif date.tzinfo is None:
+            date = date.replace(tzinfo=timezone.utc)
+
+        # Planetary Computer first: only items whose footprint contains the field
+        location = Point(lon, lat)
+        bbox = [lon - 0.01, lat - 0.01, lon + 0.01, lat + 0.01]
+
+        def covering(features):
+            return [f for f in features if not f.get("geometry") or shape(f["geometry"]).contains(location)]
+
+        features = covering(await self.search_items(bbox, date, max_cloud_cover=30))
+        if not features:
+            features = covering(await self.search_items(bbox, date, max_cloud_cover=50))
+
+        # Least cloudy covering scene first; a scene too cloudy over the field is skipped
+        # after reading only its SCL window
+        estimate_feature = None
+        for feature in features[:MAX_SCENE_CANDIDATES]:
+            band_urls, feature_indices = _index_band_urls(feature, indices or DEFAULT_INDICES)
+            if not band_urls:
+                continue
+            estimate_feature = estimate_feature or feature
+
+            scl_url, cld_url = mask_asset_urls(feature)
+            clear = None
+            if scl_url:
+                scl_url = await self.sign(scl_url)
+                clear = await self.clear_fraction(scl_url, geometry)
+                if clear is None:
+                    scl_url = None
+                elif clear < MIN_CLEAR_FRACTION:
+                    print(f"Skipping scene {feature.get('id')}: {clear:.0%} of the field is cloud free")
+                    continue
+
+            signed = await asyncio.gather(*(self.sign(url) for url in band_urls.values()))
+            band_urls = dict(zip(band_urls, signed))
+            cld_url = await self.sign(cld_url) if cld_url else None
+            ndvi_stats = await self.read_stats(
+                band_urls, geometry, feature_indices, scl_url, cld_url, offset=l2a_reflectance_offset(feature)
+            )
+            if ndvi_stats is not None:
+                ndvi_stats["clear_fraction"] = clear
+                return self.service._ndvi_record(
+                    field, date, ndvi_stats["mean"], "planetary_computer", True,
+                    sentinel_source="planetary_computer",
+                    product_id=feature.get("id"),
+                    ndvi_stats=ndvi_stats
+                )
+
+        if estimate_feature is not None:
+            return self.service._ndvi_record(
+                field, date, self.service._estimated_ndvi(lat, lon, date), "planetary_computer_estimated", True,
+                sentinel_source="planetary_computer",
+                product_id=estimate_feature.get("id")
+            )
+
+        # SciHub only provides product metadata, so its fetches still end in the mock value
+        async with self._semaphores["scihub"]:
+            scihub_data = await self._blocking(self.service.fetch_sentinel2_from_scihub, lat, lon, date)
+        return self.service._ndvi_record(
+            field, date, self.service._mock_ndvi(lat, lon, date), "mock", False,
+            sentinel_source="scihub" if scihub_data else "mock"
+        )
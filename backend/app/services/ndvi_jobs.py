@@ -0,0 +1,261 @@
+"""
+Background NDVI fetch jobs.
+
+Jobs are rows in the `ndvi_jobs` table, so they survive restarts and can be
+picked up by workers in any process: a worker claims a job with a conditional
+UPDATE (pending -> running), so two workers never run the same job. Identical
+pending/running jobs of the same user are deduplicated by `dedup_key`, backed by
+a partial unique index so concurrent submissions cannot both queue; failed
+attempts are retried with exponential backoff until `max_attempts`. Each chunk's
+rows are committed together with the job's `completed_fields`, so a retry (or a
+requeued stale job) resumes after the last committed chunk instead of inserting
+those rows again.
+"""
+import hashlib
+import json
+import os
+import threading
+import traceback
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import models
+from app.database import SessionLocal
+from app.models import JobStatus
+from app.services.ndvi_service import get_ndvi_service
+from app.services.ndvi_store import insert_ndvi_records, select_fields
+
+# Fields per unit of work (progress is reported after each chunk)
+JOB_CHUNK_SIZE = 200
+RETRY_BASE_SECONDS = 30
+POLL_SECONDS = 1.0
+
+
+def _dedup_key(payload: Dict, user_id: Optional[int]) -> str:
+    # Per user: jobs are only visible to their creator (GET /api/ndvi/jobs/{id})
+    canonical = json.dumps({"user_id": user_id, "payload": payload}, sort_keys=True,
+                           separators=(",", ":"), default=str)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def _active_job(db: Session, dedup_key: str) -> Optional[models.NDVIJob]:
+    return db.query(models.NDVIJob).filter(
+        models.NDVIJob.dedup_key == dedup_key,
+        models.NDVIJob.status.in_([JobStatus.PENDING, JobStatus.RUNNING])
+    ).first()
+
+
+def submit_job(db: Session, payload: Dict, user_id: Optional[int] = None,
+               max_attempts: int = 3) -> models.NDVIJob:
+    """
+    Queue an NDVI fetch job (payload: field_ids, bounds, date, indices).
+    Returns the user's existing job if an identical one is already pending or running.
+    """
+    dedup_key = _dedup_key(payload, user_id)
+    existing = _active_job(db, dedup_key)
+    if existing:
+        return existing
+
+    job = models.NDVIJob(
+        created_by_id=user_id,
+        dedup_key=dedup_key,
+        payload=json.dumps(payload, default=str),
+        status=JobStatus.PENDING,
+        progress=0.0,
+        completed_fields=0,
+        attempts=0,
+        max_attempts=max_attempts,
+        next_run_at=datetime.utcnow()
+    )
+    db.add(job)
+    try:
+        db.commit()
+    except IntegrityError:
+        # An identical submission committed first (uq_ndvi_jobs_active_dedup_key)
+        db.rollback()
+        existing = _active_job(db, dedup_key)
+        if existing is None:
+            raise
+        return existing
+    db.refresh(job)
+    if _worker_pool is not None:
+        _worker_pool.wake()
+    return job
+
+
+def claim_next_job(db: Session) -> Optional[models.NDVIJob]:
+    """Atomically move the next due pending job to running; None if there is none"""
+    now = datetime.utcnow()
+    while True:
+        candidate = db.query(models.NDVIJob.id).filter(
+            models.NDVIJob.status == JobStatus.PENDING,
+            models.NDVIJob.next_run_at <= now
+        ).order_by(models.NDVIJob.next_run_at, models.NDVIJob.id).first()
+        if candidate is None:
+            return None
+        claimed = db.query(models.NDVIJob).filter(
+            models.NDVIJob.id == candidate.id,
+            models.NDVIJob.status == JobStatus.PENDING
+        ).update({
+            models.NDVIJob.status: JobStatus.RUNNING,
+            models.NDVIJob.started_at: now,
+            models.NDVIJob.attempts: models.NDVIJob.attempts + 1
+        }, synchronize_session=False)
+        db.commit()
+        if claimed == 1:
+            return db.query(models.NDVIJob).filter(models.NDVIJob.id == candidate.id).first()
+        # Another worker claimed it first; try the next one
+
+
+def _job_fields(db: Session, job: models.NDVIJob, payload: Dict) -> List[models.Field]:
+    """
+    The job's fields in run order. Resolved once and saved on the job, so retries see the
+    same order even if fields were added inside the bounds since (deleted fields are skipped).
+    """
+    if job.field_order is not None:
+        field_ids = json.loads(job.field_order)
+        by_id = {field.id: field for field in select_fields(db, field_ids)} if field_ids else {}
+        return [by_id.get(field_id) for field_id in field_ids]
+
+    fields = select_fields(db, payload.get("field_ids"), payload.get("bounds"))
+    # Spatial order keeps fields sharing a tile in the same chunk
+    fields.sort(key=lambda f: (round(f.latitude, 1), round(f.longitude, 1), f.id))
+    job.field_order = json.dumps([field.id for field in fields])
+    db.commit()
+    return fields
+
+
+def run_job(db: Session, job: models.NDVIJob):
+    """
+    Fetch NDVI for the job's fields in chunks, committing each chunk's rows with the job's
+    progress; starts after the chunks an earlier attempt already committed
+    """
+    payload = json.loads(job.payload)
+    date = datetime.fromisoformat(payload["date"]) if payload.get("date") else None
+    fields = _job_fields(db, job, payload)
+    saved = json.loads(job.result).get("saved", 0) if job.result else 0
+
+    ndvi_service = get_ndvi_service()
+    for start in range(job.completed_fields or 0, len(fields), JOB_CHUNK_SIZE):
+        chunk = [field for field in fields[start:start + JOB_CHUNK_SIZE] if field is not None]
+        if len(chunk) == 1:
+            records = [ndvi_service.fetch_ndvi_for_field(chunk[0], date, payload.get("indices"))]
+        elif chunk:
+            records = ndvi_service.fetch_ndvi_for_fields(chunk, date, payload.get("indices"))
+        else:
+            records = []
+        saved += len(insert_ndvi_records(db, chunk, records))
+        job.completed_fields = min(start + JOB_CHUNK_SIZE, len(fields))
+        job.progress = job.completed_fields / len(fields)
+        job.result = json.dumps({"fields": len(fields), "saved": saved})
+        db.commit()
+
+    job.status = JobStatus.COMPLETED
+    job.progress = 1.0
+    job.completed_fields = len(fields)
+    job.error = None
+    job.result = json.dumps({"fields": len(fields), "saved": saved})
+    job.finished_at = datetime.utcnow()
+    db.commit()
+
+
+def _fail_job(db: Session, job_id: int, error: str):
+    db.rollback()
+    job = db.query(models.NDVIJob).filter(models.NDVIJob.id == job_id).first()
+    if job is None:
+        return
+    job.error = error
+    if job.attempts < job.max_attempts:
+        job.status = JobStatus.PENDING
+        job.next_run_at = datetime.utcnow() + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (job.attempts - 1))
+    else:
+        job.status = JobStatus.FAILED
+        job.finished_at = datetime.utcnow()
+    db.commit()
+
+
+def requeue_stale_jobs(db: Session, stale_after: timedelta) -> int:
+    """Jobs left running by a crashed worker go back to pending"""
+    count = db.query(models.NDVIJob).filter(
+        models.NDVIJob.status == JobStatus.RUNNING,
+        models.NDVIJob.started_at < datetime.utcnow() - stale_after
+    ).update({
+        models.NDVIJob.status: JobStatus.PENDING,
+        models.NDVIJob.next_run_at: datetime.utcnow()
+    }, synchronize_session=False)
+    db.commit()
+    return count
+
+
+class JobWorkerPool:
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        db = SessionLocal()
+        try:
+            stale_seconds = int(os.getenv("NDVI_JOB_STALE_SECONDS", "3600"))
+            requeued = requeue_stale_jobs(db, timedelta(seconds=stale_seconds))
+            if requeued:
+                print(f"Requeued {requeued} stale NDVI job(s)")
+        finally:
+            db.close()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"ndvi-job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout=30)
+        self._threads = []
+
+    def _work(self):
+        while not self._stop.is_set():
+            db = SessionLocal()
+            try:
+                job = claim_next_job(db)
+                if job is None:
+                    db.close()
+                    self._wake.wait(POLL_SECONDS)
+                    self._wake.clear()
+                    continue
+                try:
+                    run_job(db, job)
+                except Exception as e:
+                    print(f"NDVI job {job.id} failed: {e}")
+                    _fail_job(db, job.id, f"{e}\n{traceback.format_exc()}")
+            except Exception as e:
+                print(f"NDVI job worker error: {e}")
+                self._stop.wait(POLL_SECONDS)
+            finally:
+                db.close()
+
+
+_worker_pool: Optional[JobWorkerPool] = None
+
+
+def start_job_workers():
+    global _worker_pool
+    workers = int(os.getenv("NDVI_JOB_WORKERS", "2"))
+    if _worker_pool is None and workers > 0:
+        _worker_pool = JobWorkerPool(workers)
+        _worker_pool.start()
+
+
+def stop_job_workers():
+    global _worker_pool
+    if _worker_pool is not None:
+        _worker_pool.stop()
+        _worker_pool = None
@@ -0,0 +1,211 @@
+"""
+NDVI (and other spectral index) time series for charts.
+
+Observations are bucketed by week or month in SQL, so a multi-year history comes
+back as one row per bucket with its count, sum and max. Archived observations
+(Parquet, see ndvi_archive) are bucketed the same way and merged in. Empty buckets between observations are linearly
+interpolated, and the series can be smoothed with a Savitzky-Golay filter.
+The result is columnar: one array per quantity, one entry per bucket.
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app import models
+from app.services.ndvi_archive import index_column, read_archive
+
+BUCKETS = ("week", "month")
+AGGREGATES = ("mean", "max")
+FILLS = ("linear", "none")
+SAVGOL_POLYORDER = 2
+
+
+def bucket_start(day: date, bucket: str) -> date:
+    """First day of the week (Monday) or month containing `day`"""
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def next_bucket(day: date, bucket: str) -> date:
+    if bucket == "week":
+        return day + timedelta(days=7)
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def bucket_expression(db: Session, column, bucket: str):
+    """SQL expression truncating `column` to the start of its week (Monday) or month"""
+    if db.get_bind().dialect.name == "postgresql":
+        return func.date_trunc(bucket, column)
+    if bucket == "week":
+        return func.date(column, "weekday 0", "-6 days")
+    return func.strftime("%Y-%m-01", column)
+
+
+def _as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _value_column(index: str):
+    """(model, value column) holding `index`"""
+    if index == "ndvi":
+        return models.NDVIData, models.NDVIData.ndvi_value
+    return models.SpectralIndexValue, models.SpectralIndexValue.value
+
+
+def bucket_rows(db: Session, field_id: int, bucket: str, start: Optional[date] = None,
+                end: Optional[date] = None, index: str = "ndvi") -> Dict[date, Dict]:
+    """
+    {bucket start: {"count", "sum", "max"}} of the field's observations of `index` between
+    `start` and `end` (inclusive days), aggregated in SQL
+    """
+    model, value = _value_column(index)
+    period = bucket_expression(db, model.date, bucket).label("bucket")
+    query = db.query(
+        period,
+        func.count(value).label("count"),
+        func.sum(value).label("sum"),
+        func.max(value).label("max"),
+    ).filter(model.field_id == field_id, value.isnot(None))
+    if model is models.SpectralIndexValue:
+        query = query.filter(model.index_name == index)
+    if start is not None:
+        query = query.filter(model.date >= datetime.combine(start, time.min))
+    if end is not None:
+        query = query.filter(model.date < datetime.combine(end + timedelta(days=1), time.min))
+    rows = query.group_by(period).all()
+    return {_as_date(row.bucket): {"count": row.count, "sum": row.sum, "max": row.max} for row in rows}
+
+
+def archive_bucket_rows(field_id: int, bucket: str, start: Optional[date] = None, end: Optional[date] = None,
+                        index: str = "ndvi") -> Dict[date, Dict]:
+    """bucket_rows() over the field's archived observations"""
+    column = "ndvi_value" if index == "ndvi" else index_column(index)
+    table = read_archive(["date", column], [field_id], start, end)
+    if table is None or table.num_rows == 0:
+        return {}
+    frame = table.to_pandas().dropna(subset=[column])
+    days = frame["date"].dt.normalize()
+    if bucket == "week":
+        frame["bucket"] = (days - pd.to_timedelta(days.dt.weekday, unit="D")).dt.date
+    else:
+        frame["bucket"] = days.dt.to_period("M").dt.start_time.dt.date
+    grouped = frame.groupby("bucket")[column].agg(["count", "sum", "max"])
+    return {day: {"count": int(row["count"]), "sum": float(row["sum"]), "max": float(row["max"])}
+            for day, row in grouped.iterrows()}
+
+
+def merge_buckets(*sources: Dict[date, Dict]) -> Dict[date, Dict]:
+    merged: Dict[date, Dict] = {}
+    for source in sources:
+        for day, entry in source.items():
+            current = merged.get(day)
+            if current is None:
+                merged[day] = dict(entry)
+            else:
+                current["count"] += entry["count"]
+                current["sum"] += entry["sum"]
+                current["max"] = max(current["max"], entry["max"])
+    return merged
+
+
+def savgol_smooth(values: np.ndarray, window: int) -> np.ndarray:
+    """Savitzky-Golay filter over `values` (no NaN); the window shrinks to fit short series"""
+    from scipy.signal import savgol_filter
+
+    window = min(window, len(values) if len(values) % 2 else len(values) - 1)
+    if window <= SAVGOL_POLYORDER:
+        return values
+    return savgol_filter(values, window, SAVGOL_POLYORDER, mode="interp")
+
+
+def build_series(buckets: Dict[date, Dict], bucket: str, agg: str = "mean", start: Optional[date] = None,
+                 end: Optional[date] = None, fill: str = "linear", smooth: Optional[int] = None) -> Dict:
+    """
+    Columnar series over every bucket from `start` (else the first observation) to `end`
+    (else the last). Empty buckets inside the observed span are interpolated when
+    fill == "linear"; buckets before the first or after the last observation stay null.
+    """
+    if not buckets and (start is None or end is None):
+        return {"dates": [], "values": [], "observations": []}
+
+    first = bucket_start(start or min(buckets), bucket)
+    last = bucket_start(end or max(buckets), bucket)
+    dates = []
+    day = first
+    while day <= last:
+        dates.append(day)
+        day = next_bucket(day, bucket)
+
+    counts = np.array([buckets.get(day, {}).get("count", 0) for day in dates], dtype=np.int64)
+    values = np.full(len(dates), np.nan)
+    for i, day in enumerate(dates):
+        entry = buckets.get(day)
+        if entry and entry["count"]:
+            values[i] = entry["sum"] / entry["count"] if agg == "mean" else entry["max"]
+
+    observed = np.flatnonzero(~np.isnan(values))
+    span = slice(observed[0], observed[-1] + 1) if observed.size else slice(0, 0)
+    if fill == "linear" and observed.size:
+        positions = np.arange(len(dates))
+        values[span] = np.interp(positions[span], observed, values[observed])
+
+    result = {
+        "dates": [day.isoformat() for day in dates],
+        "values": _rounded(values),
+        "observations": counts.tolist(),
+    }
+    if smooth:
+        smoothed = np.full(len(dates), np.nan)
+        filled = values[span]
+        if fill != "linear" and filled.size:
+            inside = np.arange(filled.size)
+            known = ~np.isnan(filled)
+            filled = np.interp(inside, inside[known], filled[known])
+        if filled.size:
+            smoothed[span] = savgol_smooth(filled, smooth)
+        result["smoothed"] = _rounded(smoothed)
+    return result
+
+
+def _rounded(values: np.ndarray) -> List[Optional[float]]:
+    return [None if np.isnan(v) else round(float(v), 4) for v in values]
+
+
+def series_from_buckets(field_id: int, hot_buckets: Dict[date, Dict], bucket: str = "week", agg: str = "mean",
+                        start: Optional[date] = None, end: Optional[date] = None, index: str = "ndvi",
+                        fill: str = "linear", smooth: Optional[int] = None) -> Dict:
+    """The series from the database buckets plus the archived ones (Parquet reads, no database)"""
+    buckets = merge_buckets(hot_buckets, archive_bucket_rows(field_id, bucket, start, end, index))
+    series = build_series(buckets, bucket, agg, start, end, fill, smooth)
+    return {"field_id": field_id, "index": index, "bucket": bucket, "agg": agg, **series}
+
+
+def field_series(db: Session, field_id: int, bucket: str = "week", agg: str = "mean",
+                 start: Optional[date] = None, end: Optional[date] = None, index: str = "ndvi",
+                 fill: str = "linear", smooth: Optional[int] = None) -> Dict:
+    """Bucketed, gap-filled (and optionally smoothed) series of one field, database and archive"""
+    return series_from_buckets(field_id, bucket_rows(db, field_id, bucket, start, end, index),
+                               bucket, agg, start, end, index, fill, smooth)
+
+
+async def field_series_async(db: AsyncSession, field_id: int, bucket: str = "week", agg: str = "mean",
+                             start: Optional[date] = None, end: Optional[date] = None, index: str = "ndvi",
+                             fill: str = "linear", smooth: Optional[int] = None) -> Dict:
+    """
+    field_series on an AsyncSession: the aggregate query awaits on the event loop, the
+    archive reads and smoothing (blocking file and CPU work) run in the threadpool.
+    """
+    hot_buckets = await db.run_sync(bucket_rows, field_id, bucket, start, end, index)
+    return await run_in_threadpool(series_from_buckets, field_id, hot_buckets, bucket, agg, start, end, index,
+                                   fill, smooth)
@@ -2,7 +2,7 @@ import os
 import requests
 import numpy as np
 from datetime import datetime, timedelta
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 from huggingface_hub import hf_hub_download
 import rasterio
 from rasterio.warp import calculate_default_transform, reproject, Resampling
@@ -12,6 +12,18 @@ import base64
 from xml.etree import ElementTree as ET
 import zipfile
 import tempfile
+import threading
+from urllib.parse import urlparse
+from shapely.geometry import Point, shape
+from app.services.cloud_mask import MIN_CLEAR_FRACTION, clear_fractions, invalid_pixels_like, mask_asset_urls
+from app.services.ndvi_kernel import l2a_reflectance_offset, ndvi_kernel
+from app.services.cog_reader import BandWindow, read_band_set, geometry_pixel_window, ndvi_statistics
+from app.services.http_session import build_session
+from app.services.ndvi_async import AsyncNDVIPipeline
+from app.services.stac_cache import get_stac_cache, search_cache_key, snap_bbox
+from app.services.geometry import field_geometry, geometry_bounds, point_box
+from app.services.ndvi_store import ZONAL_STATS_COLUMNS
+from app.services.spectral_indices import DEFAULT_INDICES, INDICES, NIR, RED, compute_indices, required_bands, resolve_indices
 
 # Try to import Sentinel Hub and Earth Engine (optional)
 try:
@@ -26,6 +38,77 @@ try:
 except ImportError:
     EARTH_ENGINE_AVAILABLE = False
 
+PLANETARY_COMPUTER_STAC_URL = "https://planetarycomputer.microsoft.com/api/stac/v1"
+PLANETARY_COMPUTER_SAS_URL = "https://planetarycomputer.microsoft.com/api/sas/v1"
+# Re-sign this long before a SAS token expires (reads can take a while)
+SAS_TOKEN_EXPIRY_MARGIN = timedelta(minutes=5)
+
+# Batch fetches: fields within one search cell share a STAC search,
+# fields within one read cell (and the same item) share a band window read
+SEARCH_CELL_DEG = 1.0
+SHARED_READ_CELL_DEG = 0.25
+
+# Covering scenes (least cloudy first) tried per field before falling back to an estimate
+MAX_SCENE_CANDIDATES = int(os.getenv("NDVI_MAX_SCENE_CANDIDATES", "3"))
+
+
+def _group_by_cell(fields, cell_deg: float) -> Dict[Tuple[int, int], List]:
+    groups: Dict[Tuple[int, int], List] = {}
+    for field in fields:
+        key = (int(np.floor(field.latitude / cell_deg)), int(np.floor(field.longitude / cell_deg)))
+        groups.setdefault(key, []).append(field)
+    return groups
+
+
+def _slim_stac_item(feature: Dict) -> Dict:
+    """Keep only what NDVI processing needs from a STAC item (cached responses stay small)"""
+    properties = feature.get("properties", {})
+    return {
+        "id": feature.get("id"),
+        "bbox": feature.get("bbox"),
+        "geometry": feature.get("geometry"),
+        "properties": {
+            key: properties[key]
+            for key in ("datetime", "eo:cloud_cover", "s2:mgrs_tile", "s2:processing_baseline", "platform")
+            if key in properties
+        },
+        "assets": {key: {"href": asset.get("href")} for key, asset in feature.get("assets", {}).items()},
+    }
+
+
+def _index_band_urls(feature: Dict, indices: List[str]) -> Tuple[Dict[str, str], List[str]]:
+    """
+    Band hrefs of a STAC item needed for `indices`, and the indices those bands allow
+    (indices with a missing band are dropped; nothing without red/NIR)
+    """
+    indices = resolve_indices(indices)
+    assets = feature.get("assets", {})
+    hrefs = {band: assets.get(band, {}).get("href") for band in required_bands(indices)}
+    available = [name for name in indices if all(hrefs.get(band) for band in INDICES[name].bands)]
+    if "ndvi" not in available:
+        return {}, []
+    return {band: hrefs[band] for band in required_bands(available)}, available
+
+
+def _sas_container(url: str) -> Optional[Tuple[str, str]]:
+    """(storage account, container) of an unsigned Azure Blob URL, else None"""
+    parsed = urlparse(url)
+    if not parsed.netloc.endswith(".blob.core.windows.net") or "sig=" in parsed.query:
+        return None
+    return parsed.netloc.split(".")[0], parsed.path.lstrip("/").split("/")[0]
+
+
+def _append_token(url: str, token: str) -> str:
+    return f"{url}{'&' if urlparse(url).query else '?'}{token}"
+
+
+def _union_bounds(geometries: List[Dict]) -> Tuple[float, float, float, float]:
+    bounds = [geometry_bounds(g) for g in geometries]
+    return (
+        min(b[0] for b in bounds), min(b[1] for b in bounds),
+        max(b[2] for b in bounds), max(b[3] for b in bounds)
+    )
+
 class NDVIService:
     def __init__(self):
         self.huggingface_token = os.getenv("HUGGINGFACE_API_TOKEN")
@@ -63,19 +146,29 @@ class NDVIService:
                 self.ee_initialized = False
         else:
             self.ee_initialized = False
+        
+        # Pooled keep-alive HTTP session shared by all requests using this service
+        self.session = build_session()
+        
+        # Planetary Computer SAS tokens per (storage account, container), reused until expiry
+        self._sas_tokens: Dict[Tuple[str, str], Tuple[str, datetime]] = {}
+        self._sas_lock = threading.Lock()
+        
+        # asyncio acquisition path (own loop thread, per-provider concurrency limits)
+        self.async_pipeline = AsyncNDVIPipeline(self)
     
-    def calculate_ndvi(self, red_band: np.ndarray, nir_band: np.ndarray) -> np.ndarray:
-        """Calculate NDVI from red and NIR bands"""
-        # Avoid division by zero
-        denominator = (nir_band + red_band)
-        ndvi = np.where(
-            denominator != 0,
-            (nir_band - red_band) / denominator,
-            0
-        )
-        # Clip values to valid range [-1, 1]
-        ndvi = np.clip(ndvi, -1, 1)
-        return ndvi
+    def close(self):
+        """Release pooled HTTP connections and stop the async pipeline"""
+        self.async_pipeline.close()
+        self.session.close()
+    
+    def calculate_ndvi(self, red_band: np.ndarray, nir_band: np.ndarray,
+                       valid: Optional[np.ndarray] = None, offset: float = 0.0) -> np.ndarray:
+        """
+        Calculate NDVI (float32) from red and NIR L2A digital numbers.
+        Undefined pixels (zero denominator, or False in `valid`) are NaN.
+        """
+        return ndvi_kernel(red_band, nir_band, valid=valid, offset=offset)
     
     def fetch_sentinel2_from_scihub(self, lat: float, lon: float, date: Optional[datetime] = None, 
                                      bbox_size: float = 0.01) -> Optional[Dict]:
@@ -120,7 +213,7 @@ class NDVIService:
             }
             auth = (self.scihub_username, self.scihub_password)
             
-            response = requests.get(search_url, params=params, auth=auth, timeout=30)
+            response = self.session.get(search_url, params=params, auth=auth, timeout=30)
             response.raise_for_status()
             
             # Parse XML response
@@ -162,21 +255,118 @@ class NDVIService:
             print(f"Error fetching from SciHub: {e}")
             return None
     
+    def _cached_sas_token(self, key: Tuple[str, str]) -> Optional[str]:
+        from datetime import timezone
+        
+        with self._sas_lock:
+            cached = self._sas_tokens.get(key)
+        if cached and cached[1] - SAS_TOKEN_EXPIRY_MARGIN > datetime.now(timezone.utc):
+            return cached[0]
+        return None
+    
+    def _store_sas_token(self, key: Tuple[str, str], data: Dict) -> str:
+        expiry = datetime.fromisoformat(data["msft:expiry"].replace("Z", "+00:00"))
+        with self._sas_lock:
+            self._sas_tokens[key] = (data["token"], expiry)
+        return data["token"]
+    
+    def _sas_token_request(self, key: Tuple[str, str]) -> Tuple[str, Dict]:
+        """URL and headers of the SAS token endpoint for (storage account, container)"""
+        headers = {"Ocp-Apim-Subscription-Key": self.planetary_computer_key} if self.planetary_computer_key else {}
+        return f"{PLANETARY_COMPUTER_SAS_URL}/token/{key[0]}/{key[1]}", headers
+    
+    def _planetary_computer_token(self, account: str, container: str) -> Optional[str]:
+        """SAS token for a storage container, cached until shortly before it expires"""
+        key = (account, container)
+        token = self._cached_sas_token(key)
+        if token:
+            return token
+        
+        token_url, headers = self._sas_token_request(key)
+        response = self.session.get(token_url, headers=headers, timeout=30)
+        response.raise_for_status()
+        return self._store_sas_token(key, response.json())
+    
     def sign_planetary_computer_url(self, url: str) -> str:
         """
-        Sign Planetary Computer URL for access
+        Sign Planetary Computer URL for access (Azure Blob URLs get a cached SAS token appended)
         """
         try:
-            from planetary_computer import sign_url
-            return sign_url(url)
-        except ImportError:
-            # If planetary-computer package not installed, return original URL
-            # Some endpoints work without signing
-            return url
+            key = _sas_container(url)
+            if key is None:
+                # Some endpoints work without signing
+                return url
+            return _append_token(url, self._planetary_computer_token(*key))
         except Exception as e:
             print(f"Error signing URL: {e}")
             return url
     
+    def _stac_search_params(self, bbox: List[float], date: datetime,
+                            max_cloud_cover: float, limit: int) -> Dict:
+        return {
+            "collections": ["sentinel-2-l2a"],
+            "bbox": snap_bbox(bbox),
+            "datetime": f"{(date - timedelta(days=30)).strftime('%Y-%m-%d')}T00:00:00Z/"
+                        f"{(date + timedelta(days=5)).strftime('%Y-%m-%d')}T23:59:59Z",
+            "limit": limit,
+            "query": {
+                "eo:cloud_cover": {"lt": max_cloud_cover}
+            }
+        }
+    
+    def _sort_items(self, features: List[Dict], date: datetime) -> List[Dict]:
+        """Best first: lowest cloud cover, then closest to `date`"""
+        features.sort(key=lambda x: (
+            x.get("properties", {}).get("eo:cloud_cover", 100),
+            abs((datetime.fromisoformat(x.get("properties", {}).get("datetime", "").replace("Z", "+00:00")) - date).total_seconds())
+        ))
+        return features
+    
+    def search_planetary_computer_items(self, bbox: List[float], date: datetime,
+                                        max_cloud_cover: float = 30, limit: int = 100) -> List[Dict]:
+        """
+        STAC search for Sentinel-2 L2A items intersecting bbox [west, south, east, north],
+        acquired between 30 days before and 5 days after `date`.
+        Items are sorted best first (lowest cloud cover, then closest to `date`).
+        
+        The bbox is snapped outward to a coarse grid and responses are kept in the persistent
+        STAC cache, so neighbouring fields and repeated fetches reuse one search.
+        """
+        search_params = self._stac_search_params(bbox, date, max_cloud_cover, limit)
+        return self._sort_items(self._cached_stac_search(search_params), date)
+    
+    def search_planetary_computer_items_between(self, bbox: List[float], start: datetime, end: datetime,
+                                                max_cloud_cover: float = 30, limit: int = 100) -> List[Dict]:
+        """
+        STAC search for Sentinel-2 L2A items intersecting bbox acquired in (start, end],
+        sorted oldest first. Used by incremental ingestion.
+        """
+        search_params = self._stac_search_params(bbox, start, max_cloud_cover, limit)
+        search_params["datetime"] = (
+            f"{(start + timedelta(seconds=1)).strftime('%Y-%m-%dT%H:%M:%SZ')}/{end.strftime('%Y-%m-%dT%H:%M:%SZ')}"
+        )
+        # Oldest first, so a truncated page is picked up where it stopped on the next run
+        search_params["sortby"] = [{"field": "datetime", "direction": "asc"}]
+        features = self._cached_stac_search(search_params)
+        return sorted(features, key=lambda x: x.get("properties", {}).get("datetime", ""))
+    
+    def _cached_stac_search(self, search_params: Dict) -> List[Dict]:
+        """POST a STAC search through the persistent cache; [] on errors (which are not cached)"""
+        cache = get_stac_cache()
+        cache_key = search_cache_key(search_params)
+        features = cache.get(cache_key)
+        
+        if features is None:
+            try:
+                response = self.session.post(f"{PLANETARY_COMPUTER_STAC_URL}/search", json=search_params, timeout=30)
+                response.raise_for_status()
+                features = [_slim_stac_item(f) for f in response.json().get("features", [])]
+            except Exception as e:
+                print(f"Error searching Planetary Computer: {e}")
+                return []
+            cache.put(cache_key, features)
+        return features
+    
     def fetch_sentinel2_from_planetary_computer(self, lat: float, lon: float, 
                                                   date: Optional[datetime] = None) -> Optional[Dict]:
         """
@@ -191,58 +381,21 @@ class NDVIService:
             date = date.replace(tzinfo=timezone.utc)
         
         try:
-            # STAC API endpoint
-            stac_url = "https://planetarycomputer.microsoft.com/api/stac/v1"
-            
-            # Search for Sentinel-2 L2A products
-            search_url = f"{stac_url}/search"
-            
             # Create bounding box (small area around point - ~1km)
             bbox_size = 0.01
             bbox = [lon - bbox_size, lat - bbox_size, lon + bbox_size, lat + bbox_size]
             
-            # Format dates - search wider range for better coverage
+            # Searches cover a snapped bbox, so keep only items whose footprint contains the field
+            location = Point(lon, lat)
             
-            start_date = (date - timedelta(days=30)).strftime("%Y-%m-%d")
-            end_date = (date + timedelta(days=5)).strftime("%Y-%m-%d")
+            def covering(features):
+                return [f for f in features if not f.get("geometry") or shape(f["geometry"]).contains(location)]
             
-            # First try with low cloud cover
-            search_params = {
-                "collections": ["sentinel-2-l2a"],
-                "bbox": bbox,
-                "datetime": f"{start_date}T00:00:00Z/{end_date}T23:59:59Z",
-                "limit": 10,
-                "query": {
-                    "eo:cloud_cover": {"lt": 30}
-                }
-            }
-            
-            response = requests.post(search_url, json=search_params, timeout=30)
-            response.raise_for_status()
-            
-            data = response.json()
-            features = data.get("features", [])
-            
-            # If no low-cloud products, try with higher cloud cover
+            # First try with low cloud cover, then with higher cloud cover
+            features = covering(self.search_planetary_computer_items(bbox, date, max_cloud_cover=30))
             if not features:
                 print("No low-cloud products found, trying with higher cloud cover...")
-                search_params["query"] = {"eo:cloud_cover": {"lt": 50}}
-                response = requests.post(search_url, json=search_params, timeout=30)
-                response.raise_for_status()
-                data = response.json()
-                features = data.get("features", [])
-            
-            # Sort by cloud cover and date (prefer recent, low cloud)
-            if features:
-                features.sort(key=lambda x: (
-                    x.get("properties", {}).get("eo:cloud_cover", 100),
-                    -abs((datetime.fromisoformat(x.get("properties", {}).get("datetime", "").replace("Z", "+00:00")) - date).total_seconds())
-                ))
-            
-            response = requests.post(search_url, json=search_params, timeout=30)
-            response.raise_for_status()
-            
-            data = response.json()
+                features = covering(self.search_planetary_computer_items(bbox, date, max_cloud_cover=50))
             
             if not features:
                 print("No Sentinel 2 products found in Planetary Computer")
@@ -330,132 +483,285 @@ class NDVIService:
             }
         }
     
+    def _sign_if_remote(self, url: str) -> str:
+        """Sign Planetary Computer URLs; local paths and already-signed URLs pass through"""
+        if not url.startswith(("http://", "https://")) or "sig=" in url:
+            return url
+        return self.sign_planetary_computer_url(url)
+    
+    def calculate_ndvi_stats_from_urls(self, red_band_url: str, nir_band_url: str,
+                                       lat: float, lon: float, geometry: Optional[Dict] = None,
+                                       scl_band_url: Optional[str] = None,
+                                       cloud_probability_url: Optional[str] = None,
+                                       reflectance_offset: float = 0.0) -> Optional[Dict]:
+        """
+        Calculate NDVI statistics for a field from Sentinel 2 B04/B08 COGs.
+        Only the window overlapping the field is read (HTTP range requests for remote COGs),
+        at the coarsest overview that still resolves the field.
+        `geometry` is a GeoJSON polygon in EPSG:4326; defaults to a ~100m box around the point.
+        With an SCL band, cloudy pixels are dropped and the scene is skipped (None) without
+        reading red/NIR if less than MIN_CLEAR_FRACTION of the field is clear.
+        Returns None if the field does not overlap the tile or has no valid pixels.
+        """
+        red_band_url = self._sign_if_remote(red_band_url)
+        nir_band_url = self._sign_if_remote(nir_band_url)
+        scl_band_url = self._sign_if_remote(scl_band_url) if scl_band_url else None
+        cloud_probability_url = self._sign_if_remote(cloud_probability_url) if cloud_probability_url else None
+        
+        if geometry is None:
+            geometry = point_box(lat, lon)
+        
+        stats = self._shared_window_stats(
+            {RED: red_band_url, NIR: nir_band_url}, {0: geometry}, ["ndvi"],
+            scl_band_url, cloud_probability_url, offset=reflectance_offset, choose_overview=True
+        )
+        return stats.get(0)
+    
+    def band_set_stats(self, bands: Dict[str, BandWindow], geometries: Dict[int, Dict], indices: List[str],
+                       invalid: Optional[np.ndarray] = None, offset: float = 0.0) -> Dict[int, Dict]:
+        """
+        Zonal statistics per geometry from bands read on one grid (see read_band_set).
+        NDVI stats are the top level; other indices go under "indices". Pixels that are
+        nodata in any band, or `invalid` (clouds), are left out. Indices are computed once
+        over the shared window; each geometry's stats only look at its own sub-window.
+        """
+        reference = bands[RED]
+        nodata = np.zeros(reference.data.shape, dtype=bool)
+        for band in bands.values():
+            nodata |= np.ma.getmaskarray(band.data)
+        if invalid is not None:
+            nodata |= invalid
+        values = compute_indices(
+            {name: band.data.data for name, band in bands.items()}, indices, valid=~nodata, offset=offset
+        )
+        bytes_read = sum(band.bytes_read for band in bands.values())
+        
+        result = {}
+        for key, geometry in geometries.items():
+            window = geometry_pixel_window(reference, geometry)
+            if window is None:
+                continue
+            pixels, outside = window
+            mask = nodata[pixels] | outside
+            total_pixels = int(outside.size - np.count_nonzero(outside))
+            stats = ndvi_statistics(np.ma.masked_array(values["ndvi"][pixels], mask=mask), total_pixels=total_pixels)
+            if stats is None:
+                continue
+            stats["overview_level"] = reference.overview_level
+            # Bytes of the read these stats came from, shared by `shared_by` geometries
+            stats["bytes_read"] = bytes_read
+            stats["shared_by"] = len(geometries)
+            stats["indices"] = {}
+            for name in indices:
+                if name == "ndvi":
+                    continue
+                index_stats = ndvi_statistics(np.ma.masked_array(values[name][pixels], mask=mask),
+                                              total_pixels=total_pixels)
+                if index_stats is not None:
+                    stats["indices"][name] = index_stats
+            result[key] = stats
+        return result
+    
     def calculate_ndvi_from_urls(self, red_band_url: str, nir_band_url: str, 
-                                  lat: float, lon: float) -> Optional[float]:
+                                  lat: float, lon: float, geometry: Optional[Dict] = None) -> Optional[float]:
         """
-        Download and calculate NDVI from Sentinel 2 band URLs
-        Uses simplified approach: download small sample around the point
+        Mean NDVI of a field from Sentinel 2 band URLs (see calculate_ndvi_stats_from_urls)
         """
-        try:
-            # Sign URLs for Planetary Computer
-            red_band_url = self.sign_planetary_computer_url(red_band_url)
-            nir_band_url = self.sign_planetary_computer_url(nir_band_url)
-            
-            # Download a small sample around the point (simplified approach)
-            # In production, you'd download full tiles and process properly
-            # For now, we'll use a simplified method: download small window
-            
-            # Create a small bounding box around the point (100m x 100m)
-            bbox_size = 0.001  # ~100 meters
-            bbox = {
-                "west": lon - bbox_size,
-                "south": lat - bbox_size,
-                "east": lon + bbox_size,
-                "north": lat + bbox_size
-            }
-            
-            # For Planetary Computer, we can use their COG (Cloud Optimized GeoTIFF) API
-            # to get a small window without downloading entire tiles
-            try:
-                # Try to get a small sample using COG API
-                # This is a simplified approach - in production use proper raster processing
-                
-                # Download small samples (this is simplified - real implementation would use proper rasterio)
-                # For now, return None to use location-based calculation
-                # In production, you would:
-                # 1. Use rasterio to open COG URLs
-                # 2. Read a window around the point
-                # 3. Calculate NDVI from red and NIR bands
-                # 4. Return average NDVI
-                
-                return None  # Simplified - use fallback for now
-                
-            except Exception as e:
-                print(f"Error processing bands: {e}")
-                return None
-            
-        except Exception as e:
-            print(f"Error calculating NDVI from URLs: {e}")
-            return None
+        stats = self.calculate_ndvi_stats_from_urls(red_band_url, nir_band_url, lat, lon, geometry)
+        return stats["mean"] if stats else None
     
-    def fetch_ndvi_for_field(self, field, date: Optional[datetime] = None) -> Dict:
+    def fetch_ndvi_for_field(self, field, date: Optional[datetime] = None,
+                             indices: Optional[List[str]] = None) -> Dict:
         """
-        Fetch and calculate NDVI for a specific field using real Sentinel 2 data
+        Fetch and calculate NDVI (and the other `indices`) for a specific field using real
+        Sentinel 2 data (sync wrapper around the async acquisition pipeline)
         """
-        from datetime import timezone
+        return self.async_pipeline.run_sync(self.async_pipeline.fetch_ndvi_for_field(field, date, indices))
+    
+    def fetch_ndvi_for_fields(self, fields, date: Optional[datetime] = None,
+                              indices: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Fetch NDVI for many fields at once, reading each Sentinel 2 tile's bands once.
         
-        lat = field.latitude
-        lon = field.longitude
+        Fields are clustered into ~1° search cells (one STAC search per cell), each field is
+        assigned the best item covering it (item = MGRS tile + acquisition), and every item's
+        red/NIR bands are read once over the window enclosing its fields. Per-field statistics
+        are then computed from that shared read.
+        Returns one record per field, in the same format as fetch_ndvi_for_field.
+        """
+        from datetime import timezone
         
         if not date:
             date = datetime.now(timezone.utc) - timedelta(days=7)
         elif date.tzinfo is None:
-            # Make timezone-aware if not already
             date = date.replace(tzinfo=timezone.utc)
         
-        # Fetch Sentinel 2 data
-        sentinel_data = self.fetch_sentinel2_data(lat, lon, date)
+        geometries = {field.id: field_geometry(field) for field in fields}
         
-        ndvi_value = None
-        source = "mock"
+        # One STAC search per cell; each field keeps its covering items, least cloudy first
+        candidates: Dict[int, List[Dict]] = {}
+        for cell_fields in _group_by_cell(fields, SEARCH_CELL_DEG).values():
+            bbox = list(_union_bounds([geometries[f.id] for f in cell_fields]))
+            features = self.search_planetary_computer_items(bbox, date)
+            footprints = [(feature, shape(feature["geometry"])) for feature in features if feature.get("geometry")]
+            for field in cell_fields:
+                location = Point(field.longitude, field.latitude)
+                candidates[field.id] = [
+                    feature for feature, footprint in footprints if footprint.contains(location)
+                ][:MAX_SCENE_CANDIDATES]
         
-        # Try to calculate from real data
-        if sentinel_data and sentinel_data.get("source") == "planetary_computer":
-            source = "planetary_computer"
-            # Calculate NDVI from URLs
-            red_url = sentinel_data.get("red_band_url")
-            nir_url = sentinel_data.get("nir_band_url")
-            
-            if red_url and nir_url:
-                calculated_ndvi = self.calculate_ndvi_from_urls(red_url, nir_url, lat, lon)
-                if calculated_ndvi is not None:
-                    ndvi_value = calculated_ndvi
-                    print(f"✅ Calculated real NDVI from Planetary Computer: {ndvi_value}")
+        # Fields whose scene was too cloudy (or unreadable) move on to their next candidate
+        records = {}
+        items_read = set()
+        for attempt in range(MAX_SCENE_CANDIDATES):
+            item_fields: Dict[str, List] = {}
+            items: Dict[str, Dict] = {}
+            for field in fields:
+                field_candidates = candidates.get(field.id, [])
+                if field.id in records or attempt >= len(field_candidates):
+                    continue
+                feature = field_candidates[attempt]
+                items[feature["id"]] = feature
+                item_fields.setdefault(feature["id"], []).append(field)
+            if not item_fields:
+                break
+            for item_id, group in item_fields.items():
+                records.update(self.ndvi_records_for_item(items[item_id], group, date, indices))
+            items_read.update(items)
+        
+        print(f"Batch NDVI: {len(records)}/{len(fields)} fields from {len(items_read)} Sentinel 2 item(s)")
+        
+        # Same fallbacks as the single-field path
+        covered = {field_id for field_id, field_candidates in candidates.items() if field_candidates}
+        result = []
+        for field in fields:
+            record = records.get(field.id)
+            if record is None:
+                if field.id in covered:
+                    record = self._ndvi_record(
+                        field, date, self._estimated_ndvi(field.latitude, field.longitude, date),
+                        "planetary_computer_estimated", True, sentinel_source="planetary_computer"
+                    )
                 else:
-                    print("⚠️ Could not calculate NDVI from URLs, using location-based estimation")
-                    # Use a more realistic estimation based on location and season
-                    # This is still an approximation until full raster processing is implemented
-                    # But we mark it as coming from real data source
-                    base_ndvi = 0.4 + (hash(f"{lat}_{lon}") % 150) / 500  # More variation
-                    day_of_year = date.timetuple().tm_yday if date else 100
-                    seasonal_variation = 0.15 * np.sin(day_of_year / 365 * 2 * np.pi)
-                    ndvi_value = float(np.clip(base_ndvi + seasonal_variation, 0.15, 0.85))
-                    source = "planetary_computer_estimated"  # Mark as estimated from real data source
-                    print(f"✅ Using estimated NDVI based on real Planetary Computer data source: {ndvi_value}")
-        
-        elif sentinel_data and sentinel_data.get("source") == "scihub":
-            source = "scihub"
-            # SciHub requires downloading full product - simplified for now
-            pass
-        
-        # Fallback to location-based mock calculation if real data not available
-        if ndvi_value is None:
-            # Generate realistic NDVI based on location and season
-            base_ndvi = 0.5 + (hash(f"{lat}_{lon}") % 100) / 500  # Pseudo-random between 0.5-0.7
-            day_of_year = date.timetuple().tm_yday if date else 100
-            seasonal_variation = 0.1 * np.sin(day_of_year / 365 * 2 * np.pi)
-            ndvi_value = float(np.clip(base_ndvi + seasonal_variation, 0.2, 0.9))
-            source = "mock"
-            print("⚠️ Using MOCK data - real Sentinel 2 data not available")
-        
-        # Determine if real data was used
-        is_real_data = (
-            sentinel_data is not None and 
-            sentinel_data.get("source") != "mock" and
-            (source == "planetary_computer" or source == "planetary_computer_estimated" or source == "scihub")
-        )
+                    record = self._ndvi_record(
+                        field, date, self._mock_ndvi(field.latitude, field.longitude, date),
+                        "mock", False
+                    )
+            result.append(record)
+        return result
+    
+    def ndvi_records_for_item(self, feature: Dict, fields, date: datetime,
+                              indices: Optional[List[str]] = None,
+                              failed: Optional[Set[int]] = None) -> Dict[int, Dict]:
+        """
+        NDVI records (with the other `indices`, default DEFAULT_INDICES) for fields covered by
+        one STAC item, from shared band reads: one read per band per ~0.25° sub-cell of the
+        tile. Fields without valid pixels, or too cloudy in this scene, are left out.
+        Ids of fields left out because a read failed (network, expired signature, GDAL)
+        are added to `failed`, so callers can tell them from fields with no clear pixels.
+        """
+        band_urls, indices = _index_band_urls(feature, indices or DEFAULT_INDICES)
+        if not band_urls:
+            return {}
+        band_urls = {band: self._sign_if_remote(url) for band, url in band_urls.items()}
+        scl_url, cld_url = mask_asset_urls(feature)
+        scl_url = self._sign_if_remote(scl_url) if scl_url else None
+        cld_url = self._sign_if_remote(cld_url) if cld_url else None
+        
+        records = {}
+        for read_fields in _group_by_cell(fields, SHARED_READ_CELL_DEG).values():
+            stats_by_field = self._shared_window_stats(
+                band_urls, {f.id: field_geometry(f) for f in read_fields}, indices, scl_url, cld_url,
+                offset=l2a_reflectance_offset(feature), failed=failed
+            )
+            for field in read_fields:
+                stats = stats_by_field.get(field.id)
+                if stats is None:
+                    continue
+                records[field.id] = self._ndvi_record(
+                    field, date, stats["mean"], "planetary_computer", True,
+                    sentinel_source="planetary_computer",
+                    product_id=feature.get("id"),
+                    ndvi_stats=stats
+                )
+        return records
+    
+    def _shared_window_stats(self, band_urls: Dict[str, str], geometries: Dict[int, Dict], indices: List[str],
+                             scl_url: Optional[str] = None, cld_url: Optional[str] = None,
+                             offset: float = 0.0, choose_overview: bool = False,
+                             failed: Optional[Set[int]] = None) -> Dict[int, Dict]:
+        """
+        Read each band once over all geometries and return index stats per key.
+        With an SCL band, geometries below MIN_CLEAR_FRACTION are dropped first (no band
+        read at all if none is clear enough) and cloudy pixels are masked.
+        If a read fails, the keys still being read are added to `failed`.
+        """
+        clear = {}
+        try:
+            if scl_url:
+                clear = clear_fractions(scl_url, geometries)
+                geometries = {key: g for key, g in geometries.items() if clear[key] >= MIN_CLEAR_FRACTION}
+                if not geometries:
+                    print(f"Skipping scene: none of {len(clear)} field(s) is cloud free enough")
+                    return {}
+            bands = read_band_set(band_urls, list(geometries.values()), RED, choose_overview=choose_overview)
+            if bands is None:
+                print("Field(s) do not overlap the Sentinel 2 tile")
+                return {}
+            invalid = invalid_pixels_like(bands[RED], scl_url, cld_url)
+        except Exception as e:
+            print(f"Error reading band window: {e}")
+            if failed is not None:
+                failed.update(geometries)
+            return {}
         
+        result = self.band_set_stats(bands, geometries, indices, invalid, offset)
+        for key, stats in result.items():
+            stats["clear_fraction"] = clear.get(key)
+        return result
+    
+    def _estimated_ndvi(self, lat: float, lon: float, date: datetime) -> float:
+        """Location/season based estimate, used when a real product exists but could not be read"""
+        base_ndvi = 0.4 + (hash(f"{lat}_{lon}") % 150) / 500  # More variation
+        day_of_year = date.timetuple().tm_yday if date else 100
+        seasonal_variation = 0.15 * np.sin(day_of_year / 365 * 2 * np.pi)
+        return float(np.clip(base_ndvi + seasonal_variation, 0.15, 0.85))
+    
+    def _mock_ndvi(self, lat: float, lon: float, date: datetime) -> float:
+        """Realistic-looking NDVI based on location and season (no real data available)"""
+        base_ndvi = 0.5 + (hash(f"{lat}_{lon}") % 100) / 500  # Pseudo-random between 0.5-0.7
+        day_of_year = date.timetuple().tm_yday if date else 100
+        seasonal_variation = 0.1 * np.sin(day_of_year / 365 * 2 * np.pi)
+        return float(np.clip(base_ndvi + seasonal_variation, 0.2, 0.9))
+    
+    def _ndvi_record(self, field, date: datetime, ndvi_value: float, source: str, is_real_data: bool,
+                     sentinel_source: str = "none", product_id: Optional[str] = None,
+                     ndvi_stats: Optional[Dict] = None) -> Dict:
+        """NDVIData column values for one field, plus per-index stats under `indices`"""
+        zonal_stats = {
+            column: ndvi_stats.get(stat) if ndvi_stats else None
+            for stat, column in ZONAL_STATS_COLUMNS.items()
+        }
+        index_stats = (ndvi_stats or {}).get("indices", {})
+        if ndvi_stats:
+            ndvi_stats = {key: value for key, value in ndvi_stats.items() if key != "indices"}
         return {
+            **zonal_stats,
+            "indices": index_stats,
             "date": date,
             "ndvi_value": ndvi_value,
             "image_url": None,
+            "source": source,
+            "is_real_data": is_real_data,
             "ndvi_metadata": json.dumps({
                 "source": source,
                 "field_id": field.id,
-                "coordinates": {"lat": lat, "lon": lon},
+                "coordinates": {"lat": field.latitude, "lon": field.longitude},
                 "sentinel_data_available": is_real_data,
                 "is_real_data": is_real_data,
-                "sentinel_source": sentinel_data.get("source") if sentinel_data else "none"
+                "sentinel_source": sentinel_source,
+                "product_id": product_id,
+                "ndvi_stats": ndvi_stats
             })
         }
     
@@ -485,3 +791,27 @@ class NDVIService:
             "is_effective": improvement > 5  # Consider effective if >5% improvement
         }
 
+
+_ndvi_service: Optional[NDVIService] = None
+_ndvi_service_lock = threading.Lock()
+
+
+def get_ndvi_service() -> NDVIService:
+    """
+    Application-lifetime NDVIService (created at startup, see app.main lifespan).
+    Usable as a FastAPI dependency and from background code.
+    """
+    global _ndvi_service
+    if _ndvi_service is None:
+        with _ndvi_service_lock:
+            if _ndvi_service is None:
+                _ndvi_service = NDVIService()
+    return _ndvi_service
+
+
+def shutdown_ndvi_service():
+    global _ndvi_service
+    with _ndvi_service_lock:
+        if _ndvi_service is not None:
+            _ndvi_service.close()
+            _ndvi_service = None
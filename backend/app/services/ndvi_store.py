@@ -0,0 +1,133 @@
+import json
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import case, func, insert, select
+from sqlalchemy.orm import Session, aliased
+from app import models
+from app.services.spatial_index import field_ids_in_bounds
+
+# ndvi_statistics keys -> NDVIData columns
+ZONAL_STATS_COLUMNS = {
+    "std": "ndvi_std",
+    "min": "ndvi_min",
+    "max": "ndvi_max",
+    "median": "ndvi_median",
+    "p10": "ndvi_p10",
+    "p25": "ndvi_p25",
+    "p75": "ndvi_p75",
+    "p90": "ndvi_p90",
+    "valid_pixels": "valid_pixels",
+    "valid_fraction": "valid_fraction",
+}
+NDVI_RECORD_COLUMNS = ["date", "ndvi_value", "image_url", "ndvi_metadata", "source", "is_real_data",
+                       *ZONAL_STATS_COLUMNS.values()]
+
+
+def ndvi_row(field_id: int, record: Dict) -> Dict:
+    """NDVIData column values for a record built by NDVIService._ndvi_record"""
+    row = {column: record.get(column) for column in NDVI_RECORD_COLUMNS}
+    row["field_id"] = field_id
+    return row
+
+
+def index_value_rows(field_id: int, record: Dict) -> List[Dict]:
+    """SpectralIndexValue column values (without ndvi_data_id) for a record's non-NDVI indices"""
+    return [
+        {
+            "field_id": field_id,
+            "date": record["date"],
+            "index_name": name,
+            "value": stats["mean"],
+            "std": stats.get("std"),
+            "median": stats.get("median"),
+            "p10": stats.get("p10"),
+            "p90": stats.get("p90"),
+            "valid_pixels": stats.get("valid_pixels"),
+            "valid_fraction": stats.get("valid_fraction"),
+        }
+        for name, stats in (record.get("indices") or {}).items()
+    ]
+
+
+def select_fields(db: Session, field_ids: Optional[List[int]] = None,
+                  bounds: Optional[List[float]] = None) -> List[models.Field]:
+    """Fields by id list and/or bounds [min_lat, min_lon, max_lat, max_lon]"""
+    query = db.query(models.Field)
+    if field_ids:
+        query = query.filter(models.Field.id.in_(field_ids))
+    if bounds:
+        query = query.filter(models.Field.id.in_(field_ids_in_bounds(db, bounds)))
+    return query.all()
+
+
+def insert_ndvi_records(db: Session, fields: List[models.Field], records: List[Dict]) -> List[Dict]:
+    """
+    Write one NDVIData row per (field, record) with a single bulk insert, plus one bulk
+    insert of their SpectralIndexValue rows; returns the NDVIData rows
+    """
+    rows = [ndvi_row(field.id, record) for field, record in zip(fields, records)]
+    if not rows:
+        return rows
+    if not any(record.get("indices") for record in records):
+        db.execute(insert(models.NDVIData), rows)
+        return rows
+
+    ndvi_ids = db.scalars(
+        insert(models.NDVIData).returning(models.NDVIData.id, sort_by_parameter_order=True), rows
+    ).all()
+    index_rows = [
+        dict(index_row, ndvi_data_id=ndvi_id)
+        for ndvi_id, field, record in zip(ndvi_ids, fields, records)
+        for index_row in index_value_rows(field.id, record)
+    ]
+    if index_rows:
+        db.execute(insert(models.SpectralIndexValue), index_rows)
+    return rows
+
+
+def latest_ndvi_subquery(db: Session, field_ids=None):
+    """
+    Latest NDVI row per field (rank == 1) in one round-trip (window function, SQLite >= 3.25 and PostgreSQL).
+    `field_ids` is an optional id list or select to restrict the fields.
+    """
+    ranked = db.query(
+        models.NDVIData.field_id.label("field_id"),
+        models.NDVIData.ndvi_value.label("ndvi_value"),
+        models.NDVIData.date.label("date"),
+        models.NDVIData.source.label("source"),
+        models.NDVIData.is_real_data.label("is_real_data"),
+        # Only rows written before source/is_real_data existed need their metadata parsed
+        case((models.NDVIData.source.is_(None), models.NDVIData.ndvi_metadata), else_=None).label("legacy_metadata"),
+        func.row_number().over(
+            partition_by=models.NDVIData.field_id,
+            order_by=(models.NDVIData.date.desc(), models.NDVIData.id.desc())
+        ).label("rank")
+    )
+    if field_ids is not None:
+        ranked = ranked.filter(models.NDVIData.field_id.in_(field_ids))
+    return ranked.subquery()
+
+
+def latest_ndvi_id(field_id_column):
+    """
+    Correlated scalar subquery: id of the latest NDVI row of `field_id_column`.
+    One index seek per field (ix_ndvi_data_field_id_date), cheaper than ranking every row
+    when only the latest row of many fields is needed.
+    """
+    ndvi = aliased(models.NDVIData)
+    return select(ndvi.id).where(
+        ndvi.field_id == field_id_column
+    ).order_by(ndvi.date.desc(), ndvi.id.desc()).limit(1).correlate_except(ndvi).scalar_subquery()
+
+
+def ndvi_data_source(row) -> Tuple[bool, str]:
+    """(is_real_data, source) of a latest_ndvi_subquery row, falling back to legacy metadata"""
+    is_real_data = bool(row.is_real_data)
+    source = row.source or "unknown"
+    if row.legacy_metadata:
+        try:
+            metadata = json.loads(row.legacy_metadata)
+            is_real_data = metadata.get("is_real_data", False) or metadata.get("sentinel_data_available", False)
+            source = metadata.get("source", "unknown")
+        except (TypeError, ValueError, AttributeError):
+            pass
+    return is_real_data, source
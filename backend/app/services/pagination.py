@@ -0,0 +1,113 @@
+"""
+Keyset (cursor) pagination for list endpoints.
+
+Pages are ordered by id or by (created_at, id) (or another timestamp column
+an endpoint allows, e.g. NDVI observation date) and continue from the last row
+of the previous page (WHERE (created_at, id) > (:created_at, :id)), so every
+page is an index range scan however deep the client pages. The response body
+stays a plain list; paging metadata goes in headers:
+
+    X-Total-Count   rows matching the filters (all pages)
+    X-Next-Cursor   pass as ?cursor= for the next page (absent on the last page)
+"""
+import base64
+import json
+import os
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional
+
+from fastapi import HTTPException, Query, Response
+from sqlalchemy import DateTime, bindparam, tuple_
+from sqlalchemy.dialects import sqlite
+
+DEFAULT_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", "1000"))
+SORT_KEYS = ("id", "created_at")  # default keys; endpoints may allow other timestamp columns
+
+TOTAL_COUNT_HEADER = "X-Total-Count"
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+# SQLite keeps server_default=func.now() timestamps as "YYYY-MM-DD HH:MM:SS" text, but binds
+# datetimes with microseconds; a cursor at a whole second must compare equal to those rows
+_SQLITE_SECONDS = sqlite.DATETIME(
+    storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"
+)
+
+
+class PageParams:
+    """Query parameters shared by paginated endpoints (use as `page: PageParams = Depends()`)"""
+
+    def __init__(
+        self,
+        cursor: Optional[str] = None,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        sort: str = Query("id", description="id | created_at"),
+        order: str = Query("asc", description="asc | desc"),
+    ):
+        if order not in ("asc", "desc"):
+            raise HTTPException(status_code=400, detail="order must be asc or desc")
+        self.cursor = cursor
+        self.limit = limit
+        self.sort = sort
+        self.order = order
+
+
+def encode_cursor(values: List) -> str:
+    payload = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> List:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if sort == "id":
+            return [int(values[0])]
+        return [datetime.fromisoformat(values[0]) if values[0] else None, int(values[1])]
+    except (ValueError, TypeError, IndexError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def filter_date_range(query, column, start: Optional[date] = None, end: Optional[date] = None):
+    """Rows with `column` on or between the `start` and `end` days"""
+    if start is not None:
+        query = query.filter(column >= datetime.combine(start, time.min))
+    if end is not None:
+        query = query.filter(column < datetime.combine(end + timedelta(days=1), time.min))
+    return query
+
+
+def _bound(query, column, value):
+    if (value is not None and isinstance(column.type, DateTime) and column.server_default is not None
+            and value.microsecond == 0 and query.session.get_bind().dialect.name == "sqlite"):
+        return bindparam(None, value, type_=_SQLITE_SECONDS)
+    return bindparam(None, value, type_=column.type)
+
+
+def paginate(query, model, page: PageParams, response: Response, count: bool = True,
+             sort_keys=SORT_KEYS) -> list:
+    """
+    One page of `query` (already filtered) by keyset on model.id or (model.<sort>, model.id).
+    Sets the total-count and next-cursor headers on `response`.
+    """
+    if page.sort not in sort_keys:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(sort_keys)}")
+    if count:
+        response.headers[TOTAL_COUNT_HEADER] = str(query.order_by(None).count())
+
+    columns = [model.id] if page.sort == "id" else [getattr(model, page.sort), model.id]
+    if page.cursor:
+        values = [_bound(query, column, value) for column, value in zip(columns, decode_cursor(page.cursor, page.sort))]
+        key = columns[0] if len(columns) == 1 else tuple_(*columns)
+        bound = values[0] if len(values) == 1 else tuple_(*values)
+        query = query.filter(key > bound if page.order == "asc" else key < bound)
+
+    ordering = [column.asc() if page.order == "asc" else column.desc() for column in columns]
+    rows = query.order_by(*ordering).limit(page.limit + 1).all()
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            [last.id] if page.sort == "id" else [getattr(last, page.sort), last.id]
+        )
+    return rows
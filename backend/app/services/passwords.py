@@ -0,0 +1,108 @@
+"""
+bcrypt hashing and verification off the request threads.
+
+bcrypt is deliberately slow (~250 ms per hash at cost 12). Run inline, a login
+spike occupies the threadpool that every sync endpoint shares, so map and NDVI
+requests queue behind password checks. Here hashes run in a small process
+pool (PASSWORD_HASH_WORKERS processes, so they don't contend for the GIL
+either), and at most PASSWORD_HASH_MAX_PENDING hashes may be queued or
+running; callers that can't get a slot within PASSWORD_HASH_QUEUE_TIMEOUT
+seconds get PasswordHashBusy (the routers turn it into a 503). If a worker
+dies (OOM kill, failed spawn) the broken pool is replaced and the hash retried
+once.
+
+The bcrypt cost is BCRYPT_ROUNDS. verify_password_async returns a new hash
+when the stored one was made with another cost (or scheme), so hashes are
+upgraded transparently on the next successful login.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(PASSWORD_HASH_WORKERS * 4)))
+PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", "5"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+class PasswordHashBusy(Exception):
+    """Too many password hashes queued"""
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """(matches, new hash if the stored hash should be upgraded else None)"""
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_slots: Optional[asyncio.Semaphore] = None
+
+
+def get_password_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn: the API process runs threads, forking it is not safe
+                _pool = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _discard_pool(broken: ProcessPoolExecutor):
+    # Only the first caller to see the broken pool resets it; later ones already got a new one
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_password_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def _run(function, *args):
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(PASSWORD_HASH_MAX_PENDING)
+    try:
+        await asyncio.wait_for(_slots.acquire(), timeout=PASSWORD_HASH_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise PasswordHashBusy()
+    try:
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            pool = get_password_pool()
+            try:
+                return await loop.run_in_executor(pool, function, *args)
+            except BrokenProcessPool:
+                _discard_pool(pool)
+                if attempt:
+                    raise
+    finally:
+        _slots.release()
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run(hash_password, password)
+
+
+async def verify_password_async(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return await _run(verify_and_update, password, hashed_password)
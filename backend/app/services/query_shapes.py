@@ -0,0 +1,46 @@
+"""
+Loader options per response shape.
+
+Each list endpoint loads exactly the columns its response schema serializes
+(load_only) and the relationships it reads eagerly, so serialization never
+triggers a lazy load and the query count stays constant whatever the page
+size. Columns the response doesn't show (e.g. a treatment request's message
+and description Text columns in treatment lists) are never fetched.
+"""
+from typing import List, Type
+
+from pydantic import BaseModel
+from sqlalchemy import inspect
+from sqlalchemy.orm import contains_eager, load_only, selectinload
+
+from app import models, schemas
+
+
+def response_columns(model, schema: Type[BaseModel], *extra: str) -> List:
+    """Mapped columns of `model` that `schema` serializes (plus `extra` attribute names)"""
+    names = set(schema.model_fields) | set(extra)
+    return [attr for attr in inspect(model).column_attrs if attr.key in names]
+
+
+def load_response(model, schema: Type[BaseModel], *extra: str):
+    return load_only(*(getattr(model, attr.key) for attr in response_columns(model, schema, *extra)))
+
+
+FIELD_LIST = [load_response(models.Field, schemas.FieldResponse)]
+
+REQUEST_LIST = [load_response(models.TreatmentRequest, schemas.TreatmentRequestResponse)]
+
+# Lists join TreatmentRequest to filter, and read before_ndvi_value from the same join
+TREATMENT_LIST = [
+    load_response(models.Treatment, schemas.TreatmentResponse),
+    contains_eager(models.Treatment.request).load_only(
+        models.TreatmentRequest.id, models.TreatmentRequest.before_ndvi_value
+    ),
+]
+
+NDVI_LIST = [
+    load_response(models.NDVIData, schemas.NDVIDataResponse),
+    selectinload(models.NDVIData.index_values).options(
+        load_response(models.SpectralIndexValue, schemas.SpectralIndexValueResponse, "ndvi_data_id")
+    ),
+]
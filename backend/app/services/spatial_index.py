@@ -0,0 +1,122 @@
+"""
+Spatial index on field bounding boxes (Field.bbox_*).
+
+SQLite: an R*Tree virtual table `fields_rtree` kept in sync with `fields` by triggers.
+PostgreSQL: a GiST index on box(bbox) queried with the && overlap operator (no PostGIS needed).
+Other databases fall back to plain comparisons on the bbox columns.
+"""
+from typing import List, Optional
+
+from sqlalchemy import Column, Float, Integer, MetaData, Table, and_, func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app import models
+from app.services.geometry import field_geometry, geometry_bounds
+
+# Not part of Base.metadata: created (SQLite only) by ensure_spatial_index
+fields_rtree = Table(
+    "fields_rtree", MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("min_lon", Float),
+    Column("max_lon", Float),
+    Column("min_lat", Float),
+    Column("max_lat", Float),
+)
+
+_SQLITE_RTREE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS fields_rtree USING rtree(id, min_lon, max_lon, min_lat, max_lat)",
+    "CREATE TRIGGER IF NOT EXISTS fields_rtree_ai AFTER INSERT ON fields WHEN NEW.bbox_west IS NOT NULL BEGIN "
+    "INSERT OR REPLACE INTO fields_rtree VALUES (NEW.id, NEW.bbox_west, NEW.bbox_east, NEW.bbox_south, NEW.bbox_north); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS fields_rtree_au AFTER UPDATE OF bbox_west, bbox_south, bbox_east, bbox_north ON fields BEGIN "
+    "DELETE FROM fields_rtree WHERE id = OLD.id; "
+    "INSERT INTO fields_rtree SELECT NEW.id, NEW.bbox_west, NEW.bbox_east, NEW.bbox_south, NEW.bbox_north "
+    "WHERE NEW.bbox_west IS NOT NULL; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS fields_rtree_ad AFTER DELETE ON fields BEGIN "
+    "DELETE FROM fields_rtree WHERE id = OLD.id; "
+    "END",
+    "INSERT INTO fields_rtree "
+    "SELECT id, bbox_west, bbox_east, bbox_south, bbox_north FROM fields "
+    "WHERE bbox_west IS NOT NULL AND id NOT IN (SELECT id FROM fields_rtree)",
+]
+
+_POSTGRES_GIST_DDL = (
+    "CREATE INDEX IF NOT EXISTS ix_fields_bbox_gist ON fields "
+    "USING gist (box(point(bbox_west, bbox_south), point(bbox_east, bbox_north)))"
+)
+
+_rtree_available = False
+
+
+def backfill_field_bboxes(db: Session, batch_size: int = 1000) -> int:
+    """Compute bbox columns for fields created before they existed"""
+    count = 0
+    while True:
+        fields = db.query(models.Field).filter(models.Field.bbox_west.is_(None)).limit(batch_size).all()
+        if not fields:
+            return count
+        for field in fields:
+            field.bbox_west, field.bbox_south, field.bbox_east, field.bbox_north = geometry_bounds(field_geometry(field))
+        db.commit()
+        count += len(fields)
+
+
+def ensure_spatial_index(engine: Engine, db: Session):
+    """Backfill field bboxes and create the dialect's spatial index (idempotent)"""
+    global _rtree_available
+    backfill_field_bboxes(db)
+
+    if engine.dialect.name == "sqlite":
+        try:
+            with engine.begin() as conn:
+                for statement in _SQLITE_RTREE_DDL:
+                    conn.exec_driver_sql(statement)
+            _rtree_available = True
+        except Exception as e:
+            # SQLite built without the R*Tree module
+            print(f"R*Tree spatial index unavailable, using bbox columns: {e}")
+            _rtree_available = False
+    elif engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            conn.exec_driver_sql(_POSTGRES_GIST_DDL)
+
+
+def parse_bounds(bounds: Optional[str]) -> Optional[List[float]]:
+    """'min_lat,min_lon,max_lat,max_lon' -> [min_lat, min_lon, max_lat, max_lon]; raises ValueError"""
+    if not bounds:
+        return None
+    values = [float(v) for v in bounds.split(",")]
+    if len(values) != 4 or values[0] > values[2] or values[1] > values[3]:
+        raise ValueError("bounds must be 'min_lat,min_lon,max_lat,max_lon'")
+    return values
+
+
+def field_ids_in_bounds(db: Session, bounds: List[float]):
+    """Select of Field.id whose bbox intersects bounds [min_lat, min_lon, max_lat, max_lon]"""
+    min_lat, min_lon, max_lat, max_lon = bounds
+    dialect = db.get_bind().dialect.name
+
+    if dialect == "sqlite" and _rtree_available:
+        return select(fields_rtree.c.id).where(
+            fields_rtree.c.max_lon >= min_lon,
+            fields_rtree.c.min_lon <= max_lon,
+            fields_rtree.c.max_lat >= min_lat,
+            fields_rtree.c.min_lat <= max_lat,
+        )
+
+    if dialect == "postgresql":
+        field_box = func.box(
+            func.point(models.Field.bbox_west, models.Field.bbox_south),
+            func.point(models.Field.bbox_east, models.Field.bbox_north)
+        )
+        view_box = func.box(func.point(min_lon, min_lat), func.point(max_lon, max_lat))
+        return select(models.Field.id).where(field_box.op("&&")(view_box))
+
+    return select(models.Field.id).where(and_(
+        models.Field.bbox_east >= min_lon,
+        models.Field.bbox_west <= max_lon,
+        models.Field.bbox_north >= min_lat,
+        models.Field.bbox_south <= max_lat,
+    ))
@@ -0,0 +1,145 @@
+"""
+Spectral index engine (NDVI, EVI, NDRE, SAVI, NDWI).
+
+Each index declares the Sentinel 2 bands it needs. For a set of requested
+indices the union of bands is read once (20 m bands resampled onto the 10 m
+grid by the caller), converted to float32 reflectance block by block, and
+every index is computed from the same block. Adding an index adds at most its
+missing bands to the read, never another pass.
+
+New indices are registered with register_index().
+"""
+import os
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.ndvi_kernel import DEFAULT_BLOCK_ROWS, L2A_SCALE
+
+BLUE, GREEN, RED, RED_EDGE, NIR, SWIR = "B02", "B03", "B04", "B05", "B08", "B11"
+
+# Bands read at 10 m; anything else (B05, B11, ...) is resampled onto the 10 m grid
+NATIVE_10M_BANDS = (BLUE, GREEN, RED, NIR)
+
+# Computes an index from a dict of reflectance blocks into `out` (float32);
+# `defined` is set to False where the index is undefined (zero denominator)
+IndexFunction = Callable[[Dict[str, np.ndarray], np.ndarray, np.ndarray], None]
+
+
+class SpectralIndex:
+    """`value_range` (lo, hi) clips computed values to the index's bounds; None leaves them unclipped"""
+
+    def __init__(self, name: str, bands: Iterable[str], compute: IndexFunction, description: str = "",
+                 value_range: Optional[Tuple[float, float]] = (-1.0, 1.0)):
+        self.name = name
+        self.bands = tuple(bands)
+        self.compute = compute
+        self.description = description
+        self.value_range = value_range
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray, out: np.ndarray, defined: np.ndarray):
+    np.greater(denominator, 0, out=defined)
+    np.divide(numerator, denominator, out=out, where=defined)
+
+
+def _normalized_difference(a: str, b: str) -> IndexFunction:
+    def compute(bands: Dict[str, np.ndarray], out: np.ndarray, defined: np.ndarray):
+        _ratio(bands[a] - bands[b], bands[a] + bands[b], out, defined)
+    return compute
+
+
+def _evi(bands: Dict[str, np.ndarray], out: np.ndarray, defined: np.ndarray):
+    nir, red, blue = bands[NIR], bands[RED], bands[BLUE]
+    _ratio(2.5 * (nir - red), nir + 6.0 * red - 7.5 * blue + 1.0, out, defined)
+
+
+def _savi(bands: Dict[str, np.ndarray], out: np.ndarray, defined: np.ndarray, soil_factor: float = 0.5):
+    nir, red = bands[NIR], bands[RED]
+    _ratio((1.0 + soil_factor) * (nir - red), nir + red + soil_factor, out, defined)
+
+
+INDICES: Dict[str, SpectralIndex] = {}
+
+
+def register_index(index: SpectralIndex):
+    INDICES[index.name] = index
+
+
+register_index(SpectralIndex("ndvi", (RED, NIR), _normalized_difference(NIR, RED), "Vegetation vigour"))
+# EVI has no fixed bound (it exceeds 1 over bright targets); SAVI spans ±(1 + soil factor)
+register_index(SpectralIndex("evi", (BLUE, RED, NIR), _evi, "Enhanced vegetation index, less saturated over dense canopy",
+                             value_range=None))
+register_index(SpectralIndex("ndre", (RED_EDGE, NIR), _normalized_difference(NIR, RED_EDGE), "Red-edge chlorophyll / nitrogen status"))
+register_index(SpectralIndex("savi", (RED, NIR), _savi, "Soil-adjusted vegetation index for sparse canopy",
+                             value_range=(-1.5, 1.5)))
+register_index(SpectralIndex("ndwi", (NIR, SWIR), _normalized_difference(NIR, SWIR), "Canopy moisture (Gao, NIR/SWIR)"))
+
+
+def resolve_indices(names: Optional[Iterable[str]]) -> List[str]:
+    """Known index names in request order, always starting with ndvi; raises ValueError on unknown names"""
+    result = ["ndvi"]
+    for name in names or []:
+        name = name.strip().lower()
+        if not name:
+            continue
+        if name not in INDICES:
+            raise ValueError(f"Unknown spectral index '{name}' (known: {', '.join(INDICES)})")
+        if name not in result:
+            result.append(name)
+    return result
+
+
+def required_bands(names: Iterable[str]) -> List[str]:
+    """Union of the bands needed by `names`, each once, 10 m bands first"""
+    bands = []
+    for name in names:
+        for band in INDICES[name].bands:
+            if band not in bands:
+                bands.append(band)
+    return sorted(bands, key=lambda band: (band not in NATIVE_10M_BANDS, band))
+
+
+def compute_indices(bands: Dict[str, np.ndarray], names: Iterable[str], valid: Optional[np.ndarray] = None,
+                    scale: float = L2A_SCALE, offset: float = 0.0,
+                    block_rows: int = DEFAULT_BLOCK_ROWS) -> Dict[str, np.ndarray]:
+    """
+    Compute every index in `names` (float32, NaN where undefined or not `valid`, clipped to
+    the index's value_range) from digital-number arrays on one grid. Bands are converted to
+    reflectance once per row block.
+    """
+    names = list(names)
+    value_ranges = {name: INDICES[name].value_range for name in names}
+    rows, cols = next(iter(bands.values())).shape
+    block_rows = max(1, min(block_rows, rows))
+    scale = np.float32(scale)
+    offset = np.float32(offset)
+
+    outputs = {name: np.empty((rows, cols), dtype=np.float32) for name in names}
+    reflectance = {band: np.empty((block_rows, cols), dtype=np.float32) for band in bands}
+    defined = np.empty((block_rows, cols), dtype=bool)
+
+    for start in range(0, rows, block_rows):
+        stop = min(start + block_rows, rows)
+        n = stop - start
+        block = {}
+        for band, data in bands.items():
+            block[band] = reflectance[band][:n]
+            np.multiply(data[start:stop], scale, out=block[band], casting="unsafe")
+            block[band] += offset
+
+        for name in names:
+            out = outputs[name][start:stop]
+            block_defined = defined[:n]
+            out.fill(np.nan)
+            INDICES[name].compute(block, out, block_defined)
+            if valid is not None:
+                out[~valid[start:stop]] = np.nan
+            if value_ranges[name] is not None:
+                np.clip(out, *value_ranges[name], out=out)
+
+    return outputs
+
+
+# Indices computed on every fetch unless a request asks for others (ndvi is always included)
+DEFAULT_INDICES = resolve_indices(os.getenv("NDVI_SPECTRAL_INDICES", "evi,ndre,savi,ndwi").split(","))
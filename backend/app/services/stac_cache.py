@@ -0,0 +1,133 @@
+"""
+Persistent cache for STAC search responses.
+
+Entries live in a small SQLite file so they survive restarts and are shared by
+worker processes. The cache is bounded by entry count (least recently used
+entries are evicted first) and every entry expires after a TTL, so newly
+published acquisitions show up once the TTL has passed.
+"""
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+# Search bboxes are snapped outward to this grid so neighbouring fields share one entry
+BBOX_SNAP_DEG = 0.05
+
+
+def snap_bbox(bbox: List[float], snap_deg: float = BBOX_SNAP_DEG) -> List[float]:
+    """Expand [west, south, east, north] outward to the snap grid"""
+    west, south, east, north = bbox
+    return [
+        round(math.floor(west / snap_deg) * snap_deg, 6),
+        round(math.floor(south / snap_deg) * snap_deg, 6),
+        round(math.ceil(east / snap_deg) * snap_deg, 6),
+        round(math.ceil(north / snap_deg) * snap_deg, 6),
+    ]
+
+
+def search_cache_key(search_params: Dict) -> str:
+    """Stable key for a STAC search body (collections, bbox, datetime, query, limit)"""
+    canonical = json.dumps(search_params, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class STACSearchCache:
+    def __init__(self, path: str, max_entries: int = 5000, ttl_seconds: int = 6 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS stac_search_cache ("
+            "key TEXT PRIMARY KEY, "
+            "response TEXT NOT NULL, "
+            "created_at REAL NOT NULL, "
+            "last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_stac_search_cache_last_access "
+            "ON stac_search_cache (last_access)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM stac_search_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self._conn.execute("DELETE FROM stac_search_cache WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE stac_search_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, features: List[Dict]):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO stac_search_cache (key, response, created_at, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(features), now, now)
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM stac_search_cache").fetchone()[0]
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM stac_search_cache WHERE key IN ("
+                    "SELECT key FROM stac_search_cache ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,)
+                )
+                self.evictions += overflow
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM stac_search_cache")
+            self._conn.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM stac_search_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+_stac_cache: Optional[STACSearchCache] = None
+_stac_cache_lock = threading.Lock()
+
+
+def get_stac_cache() -> STACSearchCache:
+    """Process-wide STAC search cache configured from the environment"""
+    global _stac_cache
+    if _stac_cache is None:
+        with _stac_cache_lock:
+            if _stac_cache is None:
+                _stac_cache = STACSearchCache(
+                    os.getenv("STAC_CACHE_PATH", "./stac_cache.db"),
+                    max_entries=int(os.getenv("STAC_CACHE_MAX_ENTRIES", "5000")),
+                    ttl_seconds=int(os.getenv("STAC_CACHE_TTL_SECONDS", str(6 * 3600))),
+                )
+    return _stac_cache
@@ -0,0 +1,333 @@
+"""
+Mapbox Vector Tiles of fields colored by their latest NDVI.
+
+Tiles are XYZ (Web Mercator) with one layer, `fields`. From POLYGON_MIN_ZOOM
+fields are polygons simplified to about a pixel at the tile's zoom, below it
+they are points. Encoded tiles are kept in an in-process LRU cache; a tile is
+dropped when a field in it (or its latest NDVI) changes, tracked through
+session events and applied once the change is committed. Changes made by other
+processes are picked up after NDVI_TILE_CACHE_TTL_SECONDS.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import mapbox_vector_tile
+import numpy as np
+import shapely
+from shapely.geometry import Point, box, shape
+from sqlalchemy import and_, event
+from sqlalchemy.orm import Session
+
+from app import models
+from app.services.geometry import field_geometry
+from app.services.ndvi_store import latest_ndvi_subquery, ndvi_data_source
+from app.services.spatial_index import field_ids_in_bounds
+
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+LAYER_NAME = "fields"
+TILE_EXTENT = 4096
+# Features are kept this far (tile units) past the tile edge so polygon edges don't show seams
+TILE_BUFFER = 64
+# Simplification tolerance in tile units (4096 per tile, 16 ~ 1 screen pixel of a 256 px tile)
+SIMPLIFY_TOLERANCE = 16
+MAX_TILE_ZOOM = 22
+# Zoom level from which fields are drawn as polygons instead of points
+POLYGON_MIN_ZOOM = 12
+
+MERCATOR_ORIGIN = math.pi * 6378137.0
+MAX_LATITUDE = 85.0511287798
+
+TileKey = Tuple[int, int, int]
+
+
+def health_class(ndvi: Optional[float]) -> str:
+    """NDVI health class, same thresholds as the map legend"""
+    if ndvi is None:
+        return "no_data"
+    if ndvi < 0.3:
+        return "unhealthy"
+    if ndvi < 0.5:
+        return "poor"
+    if ndvi < 0.7:
+        return "moderate"
+    return "healthy"
+
+
+def _to_mercator(coords: np.ndarray) -> np.ndarray:
+    lon = coords[:, 0]
+    lat = np.clip(coords[:, 1], -MAX_LATITUDE, MAX_LATITUDE)
+    x = np.radians(lon) * 6378137.0
+    y = np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)) * 6378137.0
+    return np.column_stack([x, y])
+
+
+def tile_bounds_mercator(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    span = 2 * MERCATOR_ORIGIN / 2 ** z
+    west = -MERCATOR_ORIGIN + x * span
+    north = MERCATOR_ORIGIN - y * span
+    return west, north - span, west + span, north
+
+
+def tile_bounds_lonlat(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    n = 2 ** z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+
+def tiles_covering(z: int, west: float, south: float, east: float, north: float) -> Iterable[TileKey]:
+    """XYZ tiles at zoom z intersecting a lon/lat bbox"""
+    n = 2 ** z
+
+    def column(lon):
+        return min(n - 1, max(0, int((lon + 180.0) / 360.0 * n)))
+
+    def row(lat):
+        lat = math.radians(max(-MAX_LATITUDE, min(MAX_LATITUDE, lat)))
+        return min(n - 1, max(0, int((1 - math.asinh(math.tan(lat)) / math.pi) / 2 * n)))
+
+    for x in range(column(west), column(east) + 1):
+        for y in range(row(north), row(south) + 1):
+            yield z, x, y
+
+
+class TileCache:
+    """LRU of encoded tiles, remembering which fields each tile contains"""
+
+    def __init__(self, max_entries: int = 5000, ttl_seconds: float = 300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._tiles: "OrderedDict[TileKey, Tuple[float, bytes, Set[int]]]" = OrderedDict()
+        self._field_tiles: Dict[int, Set[TileKey]] = {}
+        self._zooms: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: TileKey) -> Optional[bytes]:
+        with self._lock:
+            entry = self._tiles.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl_seconds:
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._tiles.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: TileKey, data: bytes, field_ids: Iterable[int]):
+        field_ids = set(field_ids)
+        with self._lock:
+            if key in self._tiles:
+                self._drop(key)
+            self._tiles[key] = (time.monotonic(), data, field_ids)
+            self._zooms[key[0]] = self._zooms.get(key[0], 0) + 1
+            for field_id in field_ids:
+                self._field_tiles.setdefault(field_id, set()).add(key)
+            while len(self._tiles) > self.max_entries:
+                self._drop(next(iter(self._tiles)))
+
+    def invalidate(self, field_ids: Iterable[int] = (),
+                   bboxes: Iterable[Tuple[float, float, float, float]] = ()):
+        """Drop tiles containing any of `field_ids` or intersecting any (w, s, e, n) bbox"""
+        with self._lock:
+            keys = set()
+            for field_id in field_ids:
+                keys |= self._field_tiles.get(field_id, set())
+            for bbox in bboxes:
+                # Only zoom levels with cached tiles need to be checked
+                for z in list(self._zooms):
+                    keys.update(key for key in tiles_covering(z, *bbox) if key in self._tiles)
+            for key in keys:
+                if key in self._tiles:
+                    self._drop(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._tiles.clear()
+            self._field_tiles.clear()
+            self._zooms.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._tiles),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+    def _drop(self, key: TileKey):
+        _, _, field_ids = self._tiles.pop(key)
+        for field_id in field_ids:
+            tiles = self._field_tiles.get(field_id)
+            if tiles is not None:
+                tiles.discard(key)
+                if not tiles:
+                    del self._field_tiles[field_id]
+        self._zooms[key[0]] -= 1
+        if not self._zooms[key[0]]:
+            del self._zooms[key[0]]
+
+
+_tile_cache: Optional[TileCache] = None
+_tile_cache_lock = threading.Lock()
+
+
+def get_tile_cache() -> TileCache:
+    global _tile_cache
+    if _tile_cache is None:
+        with _tile_cache_lock:
+            if _tile_cache is None:
+                _tile_cache = TileCache(
+                    max_entries=int(os.getenv("NDVI_TILE_CACHE_MAX_ENTRIES", "5000")),
+                    ttl_seconds=float(os.getenv("NDVI_TILE_CACHE_TTL_SECONDS", "300"))
+                )
+    return _tile_cache
+
+
+def mark_fields_changed(db: Session, field_ids: Iterable[int] = (),
+                        bboxes: Iterable[Tuple[float, float, float, float]] = ()):
+    """Queue tile invalidation for these fields/bboxes; applied when `db` commits"""
+    pending = db.info.setdefault("tile_invalidations", (set(), set()))
+    pending[0].update(field_ids)
+    pending[1].update(bboxes)
+
+
+def _field_bbox(field: models.Field) -> Optional[Tuple[float, float, float, float]]:
+    if field.bbox_west is None:
+        return None
+    return field.bbox_west, field.bbox_south, field.bbox_east, field.bbox_north
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_tile_invalidations(session, flush_context):
+    field_ids, bboxes = set(), set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, models.Field):
+            if obj.id is not None:
+                field_ids.add(obj.id)
+            bbox = _field_bbox(obj)
+            if bbox is not None:
+                bboxes.add(bbox)
+        elif isinstance(obj, models.NDVIData) and obj.field_id is not None:
+            field_ids.add(obj.field_id)
+    if field_ids or bboxes:
+        mark_fields_changed(session, field_ids, bboxes)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_ndvi_inserts(orm_execute_state):
+    # insert_ndvi_records writes NDVIData with a bulk INSERT, which skips flush events
+    mapper = orm_execute_state.bind_mapper
+    if orm_execute_state.is_insert and mapper is not None and mapper.class_ is models.NDVIData:
+        params = orm_execute_state.parameters
+        rows = params if isinstance(params, list) else [params or {}]
+        mark_fields_changed(orm_execute_state.session, {row["field_id"] for row in rows if "field_id" in row})
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_tile_invalidations(session):
+    pending = session.info.pop("tile_invalidations", None)
+    if pending and _tile_cache is not None:
+        _tile_cache.invalidate(*pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_tile_invalidations(session):
+    session.info.pop("tile_invalidations", None)
+
+
+def _tile_rows(db: Session, z: int, x: int, y: int) -> List:
+    west, south, east, north = tile_bounds_lonlat(z, x, y)
+    pad_x = (east - west) * TILE_BUFFER / TILE_EXTENT
+    pad_y = (north - south) * TILE_BUFFER / TILE_EXTENT
+    tile_ids = field_ids_in_bounds(db, [south - pad_y, west - pad_x, north + pad_y, east + pad_x])
+    ranked = latest_ndvi_subquery(db, tile_ids)
+    return db.query(
+        models.Field.id,
+        models.Field.name,
+        models.Field.crop_type,
+        models.Field.area_hectares,
+        models.Field.latitude,
+        models.Field.longitude,
+        models.Field.polygon_coordinates,
+        ranked.c.ndvi_value,
+        ranked.c.date,
+        ranked.c.source,
+        ranked.c.is_real_data,
+        ranked.c.legacy_metadata
+    ).outerjoin(
+        ranked, and_(ranked.c.field_id == models.Field.id, ranked.c.rank == 1)
+    ).filter(models.Field.id.in_(tile_ids)).all()
+
+
+def encode_tile(db: Session, z: int, x: int, y: int) -> Tuple[bytes, List[int]]:
+    """Encode tile z/x/y; returns (mvt bytes, ids of the fields in it)"""
+    tile_bounds = tile_bounds_mercator(z, x, y)
+    span = tile_bounds[2] - tile_bounds[0]
+    clip_box = box(*tile_bounds).buffer(span * TILE_BUFFER / TILE_EXTENT, join_style="mitre")
+    tolerance = span * SIMPLIFY_TOLERANCE / TILE_EXTENT
+
+    features = []
+    field_ids = []
+    for row in _tile_rows(db, z, x, y):
+        if z >= POLYGON_MIN_ZOOM:
+            geometry = shapely.transform(shape(field_geometry(row)), _to_mercator)
+            geometry = geometry.simplify(tolerance, preserve_topology=True).intersection(clip_box)
+        else:
+            geometry = shapely.transform(Point(row.longitude, row.latitude), _to_mercator)
+            if not geometry.intersects(clip_box):
+                continue
+        if geometry.is_empty:
+            continue
+
+        is_real_data, data_source = ndvi_data_source(row)
+        properties = {
+            "field_id": row.id,
+            "name": row.name,
+            "crop_type": row.crop_type or "",
+            "area_hectares": row.area_hectares,
+            "health": health_class(row.ndvi_value),
+            "is_real_data": is_real_data,
+            "data_source": data_source,
+        }
+        # MVT has no null values, missing NDVI is left out
+        if row.ndvi_value is not None:
+            properties["ndvi"] = round(row.ndvi_value, 4)
+            properties["ndvi_date"] = row.date.isoformat()
+        features.append({"geometry": geometry, "properties": properties, "id": row.id})
+        field_ids.append(row.id)
+
+    data = mapbox_vector_tile.encode(
+        [{"name": LAYER_NAME, "features": features}],
+        default_options={
+            "quantize_bounds": tile_bounds,
+            "extents": TILE_EXTENT,
+            "on_invalid_geometry": mapbox_vector_tile.encoder.on_invalid_geometry_make_valid,
+        }
+    )
+    return data, field_ids
+
+
+def get_tile(db: Session, z: int, x: int, y: int) -> bytes:
+    """Tile z/x/y from the cache, encoding it on a miss"""
+    cache = get_tile_cache()
+    key = (z, x, y)
+    data = cache.get(key)
+    if data is None:
+        data, field_ids = encode_tile(db, z, x, y)
+        cache.put(key, data, field_ids)
+    return data
@@ -0,0 +1,29 @@
+"""
+Tests run against a throwaway SQLite database: DATABASE_URL is set here, before
+anything imports app.database.
+"""
+import os
+import tempfile
+
+_workdir = tempfile.mkdtemp(prefix="agrimonitor-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_workdir, 'tests.db')}"
+os.environ["DATABASE_READ_URL"] = ""
+# Caches would hide queries
+os.environ["IDENTITY_CACHE_TTL_SECONDS"] = "0"
+os.environ["DASHBOARD_CACHE_TTL_SECONDS"] = "0"
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def app():
+    from app.main import app
+
+    return app
+
+
+@pytest.fixture(scope="session")
+def client(app):
+    from fastapi.testclient import TestClient
+
+    return TestClient(app)
@@ -0,0 +1,46 @@
+"""
+Count the SQL statements a block of code executes.
+
+    with count_queries() as counter:
+        client.get("/api/treatments/")
+    print(counter.count, counter.statements)
+
+Used by tests/test_query_counts.py to catch N+1 regressions.
+"""
+from contextlib import contextmanager
+from typing import List
+
+from sqlalchemy import event
+
+from app.database import async_engines, async_sessionmakers, engine as default_engine, read_engine
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements: List[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+
+@contextmanager
+def count_queries(engine=None):
+    """Record every statement executed on `engine` (default: the app's sync and async engines) inside the block"""
+    if engine is None:
+        async_sessionmakers()
+        engines = list({default_engine, read_engine, *(async_engine.sync_engine for async_engine in async_engines())})
+    else:
+        engines = [engine]
+    counter = QueryCounter()
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        counter.statements.append(statement)
+
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield counter
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", record)
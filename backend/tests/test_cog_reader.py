@@ -0,0 +1,85 @@
+"""NDVI from local Cloud Optimized GeoTIFFs (no network): the reader works on any rasterio path."""
+import json
+import types
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.shutil import copy as copy_raster
+from rasterio.transform import from_origin
+from rasterio.warp import transform
+
+from app.services.ndvi_service import NDVIService
+
+# A 5 km UTM 39N tile at 10 m
+CRS = "EPSG:32639"
+WEST, NORTH, PIXEL, SIZE = 400000.0, 4500000.0, 10.0, 512
+RED_DN, NIR_DN = 1000, 5000
+EXPECTED_NDVI = (NIR_DN - RED_DN) / (NIR_DN + RED_DN)
+
+
+def write_cog(path, value: int):
+    """Constant-valued uint16 COG (tiled, with overviews) like a Sentinel 2 L2A band"""
+    source = path.with_suffix(".src.tif")
+    profile = {"driver": "GTiff", "width": SIZE, "height": SIZE, "count": 1, "dtype": "uint16",
+               "crs": CRS, "transform": from_origin(WEST, NORTH, PIXEL, PIXEL), "nodata": 0}
+    with rasterio.open(source, "w", **profile) as dataset:
+        dataset.write(np.full((SIZE, SIZE), value, dtype=np.uint16), 1)
+    copy_raster(source, path, driver="COG", blocksize=256, overview_resampling="average")
+    return str(path)
+
+
+def lat_lon(x: float, y: float):
+    lon, lat = transform(CRS, "EPSG:4326", [x], [y])
+    return lat[0], lon[0]
+
+
+@pytest.fixture(scope="module")
+def bands(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("cog")
+    return write_cog(directory / "B04.tif", RED_DN), write_cog(directory / "B08.tif", NIR_DN)
+
+
+@pytest.fixture(scope="module")
+def ndvi_service():
+    return NDVIService()
+
+
+def test_calculate_ndvi_from_local_cog(bands, ndvi_service):
+    red, nir = bands
+    lat, lon = lat_lon(WEST + 2500, NORTH - 2500)
+    assert ndvi_service.calculate_ndvi_from_urls(red, nir, lat, lon) == pytest.approx(EXPECTED_NDVI, abs=1e-6)
+
+
+def test_stats_report_bytes_read(bands, ndvi_service):
+    red, nir = bands
+    lat, lon = lat_lon(WEST + 2500, NORTH - 2500)
+    stats = ndvi_service.calculate_ndvi_stats_from_urls(red, nir, lat, lon)
+    assert stats["valid_pixels"] > 0
+    assert stats["bytes_read"] > 0
+    assert stats["shared_by"] == 1
+
+
+def test_field_outside_tile(bands, ndvi_service):
+    red, nir = bands
+    lat, lon = lat_lon(WEST - 5000, NORTH + 5000)
+    assert ndvi_service.calculate_ndvi_from_urls(red, nir, lat, lon) is None
+
+
+def test_shared_read_reports_bytes_read_per_field(bands, ndvi_service):
+    red, nir = bands
+    fields = []
+    for i, offset in enumerate((1000, 1500, 4000)):
+        lat, lon = lat_lon(WEST + offset, NORTH - offset)
+        fields.append(types.SimpleNamespace(id=i + 1, latitude=lat, longitude=lon, polygon_coordinates=None))
+    feature = {"id": "local", "properties": {}, "assets": {"B04": {"href": red}, "B08": {"href": nir}}}
+
+    records = ndvi_service.ndvi_records_for_item(feature, fields, None, ["ndvi"])
+    assert set(records) == {1, 2, 3}
+    stats = [json.loads(record["ndvi_metadata"])["ndvi_stats"] for record in records.values()]
+    for record in records.values():
+        assert record["ndvi_value"] == pytest.approx(EXPECTED_NDVI, abs=1e-6)
+    # One read covered all three fields; each reports it under the same key
+    assert {item["shared_by"] for item in stats} == {3}
+    assert len({item["bytes_read"] for item in stats}) == 1
+    assert stats[0]["bytes_read"] > 0
@@ -0,0 +1,46 @@
+from app import models
+from app.services import ndvi_jobs
+
+PAYLOAD = {"field_ids": [1], "bounds": None, "date": None, "indices": None}
+
+
+def _clear_jobs(db):
+    db.query(models.NDVIJob).delete()
+    db.commit()
+
+
+def test_identical_jobs_are_deduplicated_per_user(app):
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        _clear_jobs(db)
+        first = ndvi_jobs.submit_job(db, PAYLOAD, user_id=1)
+        assert ndvi_jobs.submit_job(db, PAYLOAD, user_id=1).id == first.id
+        assert ndvi_jobs.submit_job(db, PAYLOAD, user_id=2).id != first.id
+    finally:
+        db.close()
+
+
+def test_concurrent_identical_submissions_queue_one_job(app, monkeypatch):
+    from app.database import SessionLocal
+
+    first_db, second_db = SessionLocal(), SessionLocal()
+    try:
+        _clear_jobs(first_db)
+        # Both submissions miss the dedup lookup, as two simultaneous requests would
+        lookups = []
+        active_job = ndvi_jobs._active_job
+
+        def racing_lookup(db, dedup_key):
+            lookups.append(dedup_key)
+            return None if len(lookups) <= 2 else active_job(db, dedup_key)
+
+        monkeypatch.setattr(ndvi_jobs, "_active_job", racing_lookup)
+        first = ndvi_jobs.submit_job(first_db, PAYLOAD, user_id=1)
+        second = ndvi_jobs.submit_job(second_db, PAYLOAD, user_id=1)
+        assert second.id == first.id
+        assert first_db.query(models.NDVIJob).count() == 1
+    finally:
+        first_db.close()
+        second_db.close()
@@ -0,0 +1,93 @@
+"""
+List endpoints must run the same number of queries for any page size; a count
+that grows with the page means a lazy load per row (an N+1).
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from tests.query_count import count_queries
+
+ROWS = 60
+SMALL_PAGE, LARGE_PAGE = 2, ROWS
+
+# Endpoint, extra query parameters
+LIST_ENDPOINTS = [
+    ("/api/fields/", {}),
+    ("/api/farmers/fields", {}),
+    ("/api/requests/", {}),
+    ("/api/agronomists/requests", {}),
+    ("/api/treatments/", {}),
+    ("/api/treatments/", {"crop_type": "wheat"}),
+    ("/api/ndvi/field/{field_id}", {"sort": "date", "order": "desc"}),
+    ("/api/ndvi/field/{field_id}/series", {"bucket": "month"}),
+    ("/api/ndvi/map", {}),
+    ("/api/dashboard/summary", {}),
+]
+
+
+def seed(db, rows: int):
+    """A user with farmer and agronomist profiles, `rows` fields, requests, treatments and NDVI rows"""
+    from app import models
+
+    user = models.User(email="queries@example.com", hashed_password="-", full_name="Query Check",
+                       role=models.UserRole.FARMER)
+    db.add(user)
+    db.flush()
+    farmer = models.Farmer(user_id=user.id)
+    agronomist = models.Agronomist(user_id=user.id)
+    db.add_all([farmer, agronomist])
+    db.flush()
+    fields = []
+    for i in range(rows):
+        field = models.Field(farmer_id=farmer.id, name=f"Field {i}", area_hectares=1.0,
+                             crop_type="wheat" if i % 2 else "corn", latitude=40.0 + i * 0.01, longitude=49.8)
+        db.add(field)
+        db.flush()
+        fields.append(field)
+        request = models.TreatmentRequest(agronomist_id=agronomist.id, field_id=field.id, message="Check",
+                                          proposed_price=10.0, before_ndvi_value=0.4)
+        db.add(request)
+        db.flush()
+        db.add(models.Treatment(request_id=request.id))
+    start = datetime(2024, 1, 1)
+    for i in range(rows):
+        ndvi = models.NDVIData(field_id=fields[0].id, date=start + timedelta(days=5 * i), ndvi_value=0.5)
+        db.add(ndvi)
+        db.flush()
+        for index_name in ("evi", "ndre"):
+            db.add(models.SpectralIndexValue(ndvi_data_id=ndvi.id, field_id=fields[0].id, date=ndvi.date,
+                                             index_name=index_name, value=0.3))
+    db.commit()
+    return user.email, fields[0].id
+
+
+@pytest.fixture(scope="module")
+def seeded(app):
+    from app.auth import create_access_token
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        email, field_id = seed(db, ROWS)
+    finally:
+        db.close()
+    return {"Authorization": f"Bearer {create_access_token({'sub': email})}"}, field_id
+
+
+@pytest.mark.parametrize("path, params", LIST_ENDPOINTS, ids=[
+    f"{path} {params}" if params else path for path, params in LIST_ENDPOINTS
+])
+def test_query_count_does_not_grow_with_page_size(client, seeded, path, params):
+    headers, field_id = seeded
+    path = path.format(field_id=field_id)
+    counts = []
+    for limit in (SMALL_PAGE, LARGE_PAGE):
+        with count_queries() as counter:
+            response = client.get(path, params={**params, "limit": limit}, headers=headers)
+        assert response.status_code == 200, response.text
+        counts.append(counter.count)
+    assert counts[0] == counts[1], (
+        f"{path}: {counts[0]} queries for {SMALL_PAGE} rows, {counts[1]} for {LARGE_PAGE}\n"
+        + "\n".join(counter.statements)
+    )
@@ -0,0 +1,26 @@
+import React from 'react'
+import { Box, Button, CircularProgress, Typography } from '@mui/material'
+
+// "Showing n of total" under a paged table, with a button for the next page
+const LoadMore = ({ shown, total, hasMore, loading, onLoadMore }) => {
+  if (!hasMore && (total == null || shown >= total)) {
+    return null
+  }
+
+  return (
+    <Box display="flex" justifyContent="center" alignItems="center" gap={2} mt={2}>
+      {total != null && (
+        <Typography variant="body2" color="text.secondary">
+          Showing {shown} of {total}
+        </Typography>
+      )}
+      {hasMore && (
+        <Button variant="outlined" onClick={onLoadMore} disabled={loading}>
+          {loading ? <CircularProgress size={20} /> : 'Load more'}
+        </Button>
+      )}
+    </Box>
+  )
+}
+
+export default LoadMore
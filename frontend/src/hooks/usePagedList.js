@@ -0,0 +1,90 @@
+import { useCallback, useEffect, useState } from 'react'
+import axios from 'axios'
+
+// List endpoints return one page at a time; paging metadata is in headers
+export const PAGE_SIZE = 100
+const MAX_PAGE_SIZE = 1000
+
+const readPage = (response) => ({
+  items: response.data,
+  nextCursor: response.headers['x-next-cursor'] || null,
+  total: response.headers['x-total-count'] != null ? parseInt(response.headers['x-total-count']) : null,
+})
+
+// Every page of a list endpoint (for pickers that need all rows)
+export const fetchAllPages = async (url, params = {}) => {
+  const items = []
+  let cursor = null
+  do {
+    const response = await axios.get(url, {
+      params: { ...params, limit: MAX_PAGE_SIZE, ...(cursor ? { cursor } : {}) },
+    })
+    const page = readPage(response)
+    items.push(...page.items)
+    cursor = page.nextCursor
+  } while (cursor)
+  return items
+}
+
+// First page of `url` (reloaded when `deps` change), more with loadMore();
+// refresh() reloads as many rows as are shown
+function usePagedList(url, params = {}, deps = []) {
+  const [items, setItems] = useState([])
+  const [total, setTotal] = useState(null)
+  const [nextCursor, setNextCursor] = useState(null)
+  const [loading, setLoading] = useState(true)
+  const [loadingMore, setLoadingMore] = useState(false)
+  const paramsKey = JSON.stringify(params)
+
+  const refresh = useCallback(async (shown = PAGE_SIZE) => {
+    try {
+      const response = await axios.get(url, {
+        params: { ...JSON.parse(paramsKey), limit: Math.min(Math.max(shown, PAGE_SIZE), MAX_PAGE_SIZE) },
+      })
+      const page = readPage(response)
+      setItems(page.items)
+      setNextCursor(page.nextCursor)
+      setTotal(page.total)
+    } catch (error) {
+      console.error(`Failed to fetch ${url}:`, error)
+    } finally {
+      setLoading(false)
+    }
+  }, [url, paramsKey, ...deps])
+
+  useEffect(() => {
+    refresh()
+  }, [refresh])
+
+  const loadMore = async () => {
+    if (!nextCursor || loadingMore) {
+      return
+    }
+    setLoadingMore(true)
+    try {
+      const response = await axios.get(url, {
+        params: { ...JSON.parse(paramsKey), limit: PAGE_SIZE, cursor: nextCursor },
+      })
+      const page = readPage(response)
+      setItems((current) => [...current, ...page.items])
+      setNextCursor(page.nextCursor)
+      setTotal(page.total)
+    } catch (error) {
+      console.error(`Failed to fetch more from ${url}:`, error)
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
+  return {
+    items,
+    total,
+    loading,
+    loadingMore,
+    hasMore: Boolean(nextCursor),
+    loadMore,
+    refresh: () => refresh(items.length),
+  }
+}
+
+export default usePagedList
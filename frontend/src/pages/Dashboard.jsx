@@ -26,27 +26,19 @@ function Dashboard() {
     
     setLoading(true)
     try {
-      if (currentRole === 'farmer') {
-        const [fieldsRes, requestsRes, treatmentsRes] = await Promise.all([
-          axios.get('/api/farmers/fields'),
-          axios.get('/api/requests/'),
-          axios.get('/api/treatments/'),
-        ])
-        setStats({
-          fields: fieldsRes.data.length,
-          requests: requestsRes.data.length,
-          treatments: treatmentsRes.data.length,
-        })
-      } else if (currentRole === 'agronomist') {
-        const [requestsRes, treatmentsRes] = await Promise.all([
-          axios.get('/api/requests/'),
-          axios.get('/api/treatments/'),
-        ])
-        setStats({
-          requests: requestsRes.data.length,
-          treatments: treatmentsRes.data.length,
-        })
-      }
+      const response = await axios.get('/api/dashboard/summary', {
+        params: { role: currentRole },
+      })
+      const summary = response.data
+      setStats({
+        fields: currentRole === 'farmer' ? summary.fields.total : undefined,
+        fieldsBelowThreshold: summary.fields.below_threshold,
+        ndviThreshold: summary.fields.threshold,
+        requests: summary.requests.total,
+        pendingRequests: summary.requests.by_status.pending,
+        treatments: summary.treatments.total,
+        averageImprovement: summary.treatments.average_improvement_percentage,
+      })
     } catch (error) {
       console.error('Failed to fetch stats:', error)
       // Set default values on error
@@ -111,6 +103,44 @@ function Dashboard() {
             </CardContent>
           </Card>
         </Grid>
+        {stats?.fieldsBelowThreshold !== undefined && (
+          <Grid item xs={12} sm={6} md={4}>
+            <Card>
+              <CardContent>
+                <Typography color="text.secondary" gutterBottom>
+                  Fields below NDVI {stats.ndviThreshold}
+                </Typography>
+                <Typography variant="h4">{stats.fieldsBelowThreshold}</Typography>
+              </CardContent>
+            </Card>
+          </Grid>
+        )}
+        {stats?.pendingRequests !== undefined && (
+          <Grid item xs={12} sm={6} md={4}>
+            <Card>
+              <CardContent>
+                <Typography color="text.secondary" gutterBottom>
+                  Pending Requests
+                </Typography>
+                <Typography variant="h4">{stats.pendingRequests}</Typography>
+              </CardContent>
+            </Card>
+          </Grid>
+        )}
+        {stats?.averageImprovement !== undefined && (
+          <Grid item xs={12} sm={6} md={4}>
+            <Card>
+              <CardContent>
+                <Typography color="text.secondary" gutterBottom>
+                  Average Improvement
+                </Typography>
+                <Typography variant="h4">
+                  {stats.averageImprovement === null ? '-' : `${stats.averageImprovement}%`}
+                </Typography>
+              </CardContent>
+            </Card>
+          </Grid>
+        )}
       </Grid>
     </Box>
   )
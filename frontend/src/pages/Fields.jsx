@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from 'react'
+import React, { useState } from 'react'
 import { useAuth } from '../contexts/AuthContext'
 import {
   Typography,
@@ -21,11 +21,14 @@ import {
 } from '@mui/material'
 import { Add as AddIcon, Delete as DeleteIcon } from '@mui/icons-material'
 import axios from 'axios'
+import LoadMore from '../components/LoadMore'
+import usePagedList from '../hooks/usePagedList'
 
 function Fields() {
   const { user, currentRole } = useAuth()
-  const [fields, setFields] = useState([])
-  const [loading, setLoading] = useState(true)
+  const {
+    items: fields, total, loading, loadingMore, hasMore, loadMore, refresh: fetchFields,
+  } = usePagedList('/api/fields/')
   const [open, setOpen] = useState(false)
   const [formData, setFormData] = useState({
     name: '',
@@ -36,21 +39,6 @@ function Fields() {
     polygon_coordinates: '',
   })
 
-  useEffect(() => {
-    fetchFields()
-  }, [])
-
-  const fetchFields = async () => {
-    try {
-      const response = await axios.get('/api/fields/')
-      setFields(response.data)
-    } catch (error) {
-      console.error('Failed to fetch fields:', error)
-    } finally {
-      setLoading(false)
-    }
-  }
-
   const handleOpen = () => {
     setOpen(true)
   }
@@ -178,6 +166,13 @@ function Fields() {
           </TableBody>
         </Table>
       </TableContainer>
+      <LoadMore
+        shown={fields.length}
+        total={total}
+        hasMore={hasMore}
+        loading={loadingMore}
+        onLoadMore={loadMore}
+      />
 
       <Dialog open={open} onClose={handleClose} maxWidth="sm" fullWidth>
         <form onSubmit={handleSubmit}>
@@ -1,5 +1,5 @@
-import React, { useEffect, useState } from 'react'
-import { MapContainer, TileLayer, Marker, Popup, Circle, Polygon } from 'react-leaflet'
+import React, { useEffect, useRef, useState } from 'react'
+import { MapContainer, TileLayer, Marker, Popup, Circle, Polygon, useMapEvents } from 'react-leaflet'
 import { Box, Typography, Chip, CircularProgress, Paper, Grid, Button, FormControlLabel, Switch, Alert, Dialog, DialogTitle, DialogContent, DialogActions, TextField } from '@mui/material'
 import { useAuth } from '../contexts/AuthContext'
 import axios from 'axios'
@@ -14,6 +14,21 @@ L.Icon.Default.mergeOptions({
   shadowUrl: 'https://cdnjs.cloudflare.com/ajax/libs/leaflet/1.9.4/images/marker-shadow.png',
 })
 
+// Wait for the map to settle before querying, so a quick pan sends one request
+const VIEWPORT_DEBOUNCE_MS = 250
+
+// Reports the visible bounds ("min_lat,min_lon,max_lat,max_lon") and zoom after every pan/zoom
+function ViewportWatcher({ onChange }) {
+  useMapEvents({
+    moveend: (e) => {
+      const map = e.target
+      const b = map.getBounds()
+      onChange({ bounds: `${b.getSouth()},${b.getWest()},${b.getNorth()},${b.getEast()}`, zoom: map.getZoom() })
+    },
+  })
+  return null
+}
+
 function MapView() {
   const { currentRole } = useAuth()
   const [fields, setFields] = useState([])
@@ -22,6 +37,7 @@ function MapView() {
   const [center, setCenter] = useState([40.4093, 49.8671]) // Default to Azerbaijan
   const [showOnlyUnhealthy, setShowOnlyUnhealthy] = useState(false)
   const [fetchingNDVI, setFetchingNDVI] = useState(false)
+  const [viewport, setViewport] = useState(null)
   const [requestDialogOpen, setRequestDialogOpen] = useState(false)
   const [selectedFieldForRequest, setSelectedFieldForRequest] = useState(null)
   const [requestFormData, setRequestFormData] = useState({
@@ -30,25 +46,43 @@ function MapView() {
     health_issue_description: '',
   })
 
+  // In-flight /api/ndvi/map request and pending viewport change
+  const mapRequestRef = useRef(null)
+  const viewportTimerRef = useRef(null)
+
   useEffect(() => {
     fetchMapData()
+    return () => {
+      mapRequestRef.current?.abort()
+      clearTimeout(viewportTimerRef.current)
+    }
   }, [])
 
-  const fetchMapData = async () => {
+  const fetchMapData = async (view = viewport) => {
+    // Only the latest viewport's response may replace the fields: cancel the previous request
+    mapRequestRef.current?.abort()
+    const controller = new AbortController()
+    mapRequestRef.current = controller
     try {
       setError(null)
-      const response = await axios.get('/api/ndvi/map')
+      const response = await axios.get('/api/ndvi/map', { params: view || {}, signal: controller.signal })
       setFields(response.data.fields || [])
-      if (response.data.fields && response.data.fields.length > 0) {
+      if (!view && response.data.fields && response.data.fields.length > 0) {
         const avgLat = response.data.fields.reduce((sum, f) => sum + f.latitude, 0) / response.data.fields.length
         const avgLon = response.data.fields.reduce((sum, f) => sum + f.longitude, 0) / response.data.fields.length
         setCenter([avgLat, avgLon])
       }
     } catch (error) {
+      if (axios.isCancel(error)) {
+        return
+      }
       console.error('Failed to fetch map data:', error)
       setError(error.response?.data?.detail || error.message || 'Failed to load map data')
     } finally {
-      setLoading(false)
+      if (mapRequestRef.current === controller) {
+        mapRequestRef.current = null
+        setLoading(false)
+      }
     }
   }
 
@@ -62,16 +96,10 @@ function MapView() {
         return
       }
       
-      // Fetch NDVI for each field without data
-      const promises = fieldsWithoutNDVI.map(field => 
-        axios.post(`/api/ndvi/field/${field.field_id}/fetch`)
-          .catch(err => {
-            console.error(`Failed to fetch NDVI for field ${field.field_id}:`, err)
-            return null
-          })
-      )
-      
-      await Promise.all(promises)
+      // Fetch NDVI for all fields without data in one batch (fields sharing a tile share one read)
+      await axios.post('/api/ndvi/batch-fetch', {
+        field_ids: fieldsWithoutNDVI.map(field => field.field_id),
+      })
       // Refresh map data
       await fetchMapData()
       alert(`NDVI data fetched for ${fieldsWithoutNDVI.length} field(s)`)
@@ -83,6 +111,12 @@ function MapView() {
     }
   }
 
+  const handleViewportChange = (view) => {
+    setViewport(view)
+    clearTimeout(viewportTimerRef.current)
+    viewportTimerRef.current = setTimeout(() => fetchMapData(view), VIEWPORT_DEBOUNCE_MS)
+  }
+
   const handleOpenRequestDialog = (field) => {
     setSelectedFieldForRequest(field)
     setRequestFormData({
@@ -116,7 +150,9 @@ function MapView() {
 
     try {
       // Fetch latest NDVI for the field
-      const ndviResponse = await axios.get(`/api/ndvi/field/${selectedFieldForRequest.field_id}`)
+      const ndviResponse = await axios.get(`/api/ndvi/field/${selectedFieldForRequest.field_id}`, {
+        params: { sort: 'date', order: 'desc', limit: 1 }
+      })
       const latestNdvi = ndviResponse.data[0]?.ndvi_value || 0.5
 
       const data = {
@@ -177,7 +213,7 @@ function MapView() {
         <Alert severity="error" sx={{ mb: 2 }}>
           {error}
         </Alert>
-        <Button variant="contained" onClick={fetchMapData}>
+        <Button variant="contained" onClick={() => fetchMapData()}>
           Retry
         </Button>
       </Box>
@@ -321,6 +357,7 @@ function MapView() {
             url="https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png"
             attribution='&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
           />
+          <ViewportWatcher onChange={handleViewportChange} />
           {filteredFields.map((field) => {
             const ndviColor = getNDVIColor(field.latest_ndvi)
             const ndviStatus = getNDVIStatus(field.latest_ndvi)
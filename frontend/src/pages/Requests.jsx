@@ -22,11 +22,14 @@ import {
 } from '@mui/material'
 import { Delete as DeleteIcon } from '@mui/icons-material'
 import axios from 'axios'
+import LoadMore from '../components/LoadMore'
+import usePagedList, { fetchAllPages } from '../hooks/usePagedList'
 
 function Requests() {
   const { user, currentRole } = useAuth()
-  const [requests, setRequests] = useState([])
-  const [loading, setLoading] = useState(true)
+  const {
+    items: requests, total, loading, loadingMore, hasMore, loadMore, refresh: fetchRequests,
+  } = usePagedList('/api/requests/', {}, [user, currentRole])
   const [open, setOpen] = useState(false)
   const [selectedField, setSelectedField] = useState(null)
   const [formData, setFormData] = useState({
@@ -37,27 +40,15 @@ function Requests() {
   const [fields, setFields] = useState([])
 
   useEffect(() => {
-    fetchRequests()
     if (currentRole === 'agronomist') {
       fetchFields()
     }
   }, [user, currentRole])
 
-  const fetchRequests = async () => {
-    try {
-      const response = await axios.get('/api/requests/')
-      setRequests(response.data)
-    } catch (error) {
-      console.error('Failed to fetch requests:', error)
-    } finally {
-      setLoading(false)
-    }
-  }
-
   const fetchFields = async () => {
     try {
-      const response = await axios.get('/api/fields/')
-      setFields(response.data)
+      // The picker lists every field, not just the first page
+      setFields(await fetchAllPages('/api/fields/'))
     } catch (error) {
       console.error('Failed to fetch fields:', error)
     }
@@ -89,7 +80,9 @@ function Requests() {
     e.preventDefault()
     try {
       // Fetch latest NDVI for the field
-      const ndviResponse = await axios.get(`/api/ndvi/field/${selectedField.id}`)
+      const ndviResponse = await axios.get(`/api/ndvi/field/${selectedField.id}`, {
+        params: { sort: 'date', order: 'desc', limit: 1 }
+      })
       const latestNdvi = ndviResponse.data[0]?.ndvi_value || 0.5
 
       const data = {
@@ -231,6 +224,13 @@ function Requests() {
           </TableBody>
         </Table>
       </TableContainer>
+      <LoadMore
+        shown={requests.length}
+        total={total}
+        hasMore={hasMore}
+        loading={loadingMore}
+        onLoadMore={loadMore}
+      />
 
       <Dialog open={open} onClose={handleClose} maxWidth="sm" fullWidth>
         <form onSubmit={handleSubmit}>
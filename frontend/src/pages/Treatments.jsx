@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from 'react'
+import React, { useState } from 'react'
 import { useAuth } from '../contexts/AuthContext'
 import {
   Typography,
@@ -20,32 +20,20 @@ import {
   TextField,
 } from '@mui/material'
 import axios from 'axios'
+import LoadMore from '../components/LoadMore'
+import usePagedList from '../hooks/usePagedList'
 
 function Treatments() {
   const { user, currentRole } = useAuth()
-  const [treatments, setTreatments] = useState([])
-  const [loading, setLoading] = useState(true)
+  const {
+    items: treatments, total, loading, loadingMore, hasMore, loadMore, refresh: fetchTreatments,
+  } = usePagedList('/api/treatments/')
   const [open, setOpen] = useState(false)
   const [selectedTreatment, setSelectedTreatment] = useState(null)
   const [formData, setFormData] = useState({
     after_ndvi_value: '',
   })
 
-  useEffect(() => {
-    fetchTreatments()
-  }, [])
-
-  const fetchTreatments = async () => {
-    try {
-      const response = await axios.get('/api/treatments/')
-      setTreatments(response.data)
-    } catch (error) {
-      console.error('Failed to fetch treatments:', error)
-    } finally {
-      setLoading(false)
-    }
-  }
-
   const handleOpenVerify = (treatment) => {
     setSelectedTreatment(treatment)
     setOpen(true)
@@ -214,6 +202,13 @@ function Treatments() {
           </TableBody>
         </Table>
       </TableContainer>
+      <LoadMore
+        shown={treatments.length}
+        total={total}
+        hasMore={hasMore}
+        loading={loadingMore}
+        onLoadMore={loadMore}
+      />
 
       <Dialog open={open} onClose={handleClose} maxWidth="sm" fullWidth>
         <form onSubmit={handleVerify}>